@@ -12,20 +12,270 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import fcntl
+import hashlib
+import io
 import logging
+import os
 import pprint
 import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import ClassVar
-from zipfile import ZipFile
+from typing import BinaryIO, ClassVar
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
 
 import boto3
-import botocore
+import boto3.s3.transfer
+import botocore.config
+import botocore.exceptions
+import zstandard
 from blockwork.common.singleton import Singleton
 from blockwork.context import Context
 from blockwork.tools import Invocation, Tool, Version
 
 
+class ObjStoreReader(io.RawIOBase):
+
+    def __init__(self,
+                 store: "ObjStore",
+                 path: str,
+                 info: dict[str, str],
+                 chunk_size: int,
+                 concurrency: int,
+                 spool: BinaryIO | None = None) -> None:
+        super().__init__()
+        self.store = store
+        self.path = path
+        self.spool = spool
+        self.size = int(info["ContentLength"])
+        self.etag = info["ETag"]
+        self.chunk_size = chunk_size
+        # Ranged GETs are issued from a pool, a window of chunks is kept in
+        # flight ahead of the read position
+        self._pool = ThreadPoolExecutor(max_workers=concurrency,
+                                        thread_name_prefix="objstore")
+        self._window = 2 * concurrency
+        self._count = (self.size + chunk_size - 1) // chunk_size
+        self._chunks: dict[int, bytes] = {}
+        self._futures: dict[int, Future] = {}
+        self._position = 0
+        # User metadata is only returned by HEAD and GET requests, so when the
+        # description came from a listing it is picked up from the first GET
+        self._metadata: dict[str, str] | None = info.get("Metadata", None)
+        self._digest = None
+        self._expected = None
+        # Chunks are hashed (and spooled) strictly in order as they arrive
+        self._hashed = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        match whence:
+            case io.SEEK_SET:
+                self._position = offset
+            case io.SEEK_CUR:
+                self._position += offset
+            case io.SEEK_END:
+                self._position = self.size + offset
+        self._position = max(0, min(self._position, self.size))
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        total = 0
+        while total < len(view) and self._position < self.size:
+            index, offset = divmod(self._position, self.chunk_size)
+            chunk = self._get_chunk(index)
+            length = min(len(view) - total, len(chunk) - offset)
+            view[total:total+length] = chunk[offset:offset+length]
+            total += length
+            self._position += length
+        return total
+
+    def close(self) -> None:
+        if not self.closed:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._chunks.clear()
+            self._futures.clear()
+        super().close()
+
+    def verify(self) -> None:
+        # Pull in any chunks that were never read so the digest (and any spool)
+        # covers the entire object
+        while self._hashed < self._count:
+            self._get_chunk(self._hashed)
+        if self._digest is None:
+            logging.warning(f"No checksum available for {self.path}, it was not verified")
+            return
+        if (actual := self._digest.hexdigest()) != self._expected:
+            raise Exception(f"Checksum mismatch for {self.path}: expected "
+                            f"{self._expected}, received {actual}")
+        logging.debug(f"Verified {self._digest.name} checksum of {self.path}")
+
+    def _fetch(self, index: int) -> bytes:
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+        # Pin the ETag so that an object replaced mid-download is detected
+        rsp = self.store.store.get_object(Bucket=self.store.bucket,
+                                          Key=self.path,
+                                          Range=f"bytes={start}-{end}",
+                                          IfMatch=self.etag)
+        data = rsp["Body"].read()
+        if len(data) != (end - start + 1):
+            raise Exception(f"Short read of {self.path} for bytes {start}-{end}")
+        if self._metadata is None:
+            self._metadata = rsp.get("Metadata", {})
+        return data
+
+    def _select_digest(self) -> None:
+        # Prefer an explicit SHA256 attached to the object's metadata over the
+        # ETag (which is only an MD5 of the content when the object was not
+        # uploaded in multiple parts)
+        etag = self.etag.strip('"')
+        if sha256 := (self._metadata or {}).get("sha256", None):
+            self._digest = hashlib.sha256()
+            self._expected = sha256.lower()
+        elif "-" not in etag:
+            self._digest = hashlib.md5()
+            self._expected = etag.lower()
+
+    def _schedule(self, index: int) -> None:
+        for idx in range(index, min(index + self._window, self._count)):
+            if idx not in self._chunks and idx not in self._futures:
+                self._futures[idx] = self._pool.submit(self._fetch, idx)
+
+    def _collect(self, index: int, block: bool) -> bytes | None:
+        if (data := self._chunks.get(index, None)) is not None:
+            return data
+        if (future := self._futures.get(index, None)) is None:
+            return None
+        if not block and not future.done():
+            return None
+        self._chunks[index] = data = future.result()
+        del self._futures[index]
+        return data
+
+    def _get_chunk(self, index: int) -> bytes:
+        self._schedule(index)
+        data = self._collect(index, block=True)
+        # Feed any contiguous run of completed chunks into the digest and spool
+        while self._hashed < self._count:
+            if (ready := self._collect(self._hashed, block=False)) is None:
+                break
+            if self._hashed == 0:
+                self._select_digest()
+            if self._digest:
+                self._digest.update(ready)
+            if self.spool:
+                self.spool.write(ready)
+            self._hashed += 1
+        # Release chunks that have been hashed and lie behind the read position,
+        # if they are needed again they are simply fetched again
+        current = self._position // self.chunk_size
+        for idx in [x for x in self._chunks if x < min(self._hashed, current)]:
+            del self._chunks[idx]
+        return data
+
+
+class ObjStoreCache:
+
+    # Linux ioctl request number for cloning one file into another
+    FICLONE: ClassVar[int] = 0x40049409
+
+    def __init__(self, root: Path, limit: int) -> None:
+        self.root = root
+        self.limit = limit
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def entry(self, path: str, etag: str) -> Path:
+        etag = etag.strip('"')
+        key = hashlib.sha256(f"{path}:{etag}".encode("utf-8")).hexdigest()
+        return self.root / f"{key}{Path(path).suffix}"
+
+    def lookup(self, path: str, etag: str) -> Path | None:
+        entry = self.entry(path, etag)
+        try:
+            # Touch the entry so that eviction sees it as recently used
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return entry
+
+    @contextmanager
+    def insert(self, path: str, etag: str) -> Iterator[BinaryIO]:
+        # Entries are written under a temporary name and then atomically moved
+        # into place, so checkouts sharing the cache never see partial files
+        fd, temp = tempfile.mkstemp(dir=self.root, prefix=".partial_")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                yield fh
+            os.replace(temp, self.entry(path, etag))
+        finally:
+            Path(temp).unlink(missing_ok=True)
+        # NOTE: The new entry is kept even if it alone exceeds the limit, as the
+        #       caller is yet to link it into place
+        self.evict(keep=self.entry(path, etag))
+
+    def entries(self) -> list[tuple[os.stat_result, Path]]:
+        found = []
+        for entry in self.root.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                found.append((entry.stat(), entry))
+            except FileNotFoundError:
+                pass
+        return found
+
+    def evict(self, keep: Path | None = None) -> None:
+        entries = sorted(self.entries(), key=lambda x: x[0].st_mtime)
+        total = sum(x[0].st_size for x in entries)
+        # Drop the least recently used entries until back under the limit
+        for stat, entry in entries:
+            if total <= self.limit:
+                break
+            if entry == keep:
+                continue
+            logging.debug(f"Evicting {entry.name} from the object store cache")
+            entry.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def clear(self) -> None:
+        for _, entry in self.entries():
+            entry.unlink(missing_ok=True)
+
+    @staticmethod
+    def link(source: Path, target: Path) -> None:
+        target.unlink(missing_ok=True)
+        # Prefer a hard link, then a reflink (copy-on-write clone) for when the
+        # cache is on a different filesystem, and finally fall back to a copy
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+        try:
+            with source.open("rb") as src, target.open("wb") as dst:
+                fcntl.ioctl(dst.fileno(), ObjStoreCache.FICLONE, src.fileno())
+            return
+        except OSError:
+            target.unlink(missing_ok=True)
+        shutil.copyfile(source, target)
+
+
 @Tool.register()
 class ObjStore(Tool, metaclass=Singleton):
     versions: ClassVar[list[Version]] = [
@@ -36,6 +286,16 @@ class ObjStore(Tool, metaclass=Singleton):
         ),
     ]
 
+    # Default size of each ranged GET and the number of GETs kept in flight,
+    # the concurrency may be overridden with `bw tool objstore.concurrency`
+    CHUNK_SIZE: ClassVar[int] = 8 * 1024 * 1024
+    CONCURRENCY: ClassVar[int] = 8
+
+    # Location and size limit of the download cache shared by all checkouts on
+    # a host, these may be overridden with `bw tool objstore.cache`
+    CACHE_ROOT: ClassVar[Path] = Path.home() / ".cache" / "hex8" / "objstore"
+    CACHE_LIMIT: ClassVar[int] = 16 * 1024 * 1024 * 1024
+
     def __init__(self, *args, **kwds) -> None:
         super().__init__(*args, **kwds)
         self._is_setup = False
@@ -55,29 +315,157 @@ class ObjStore(Tool, metaclass=Singleton):
             ctx.state.objstore.secret_key = input("Secret Key  : ")
             ctx.state.objstore.bucket = input("Bucket      : ")
             logging.info("Object store configured")
-        # Create a client
+        # Determine the download concurrency
+        self.max_concurrency = int(ctx.state.objstore.concurrency or ObjStore.CONCURRENCY)
+        # Create a client, sizing the connection pool so that every in-flight
+        # ranged GET can hold a kept-alive connection
         self.store = boto3.client(
             service_name="s3",
             endpoint_url=ctx.state.objstore.endpoint,
             aws_access_key_id=ctx.state.objstore.access_key,
             aws_secret_access_key=ctx.state.objstore.secret_key,
+            config=botocore.config.Config(
+                max_pool_connections=max(10, 2 * self.max_concurrency),
+                retries={"mode": "adaptive", "max_attempts": 5},
+                connect_timeout=10,
+                read_timeout=60,
+                tcp_keepalive=True,
+            ),
         )
         # Locally cache the bucket
         self.bucket = ctx.state.objstore.bucket
+        # The manifest of available objects is listed lazily on first use, the
+        # lock guards both the listing and updates made from publishing threads
+        self._manifest = None
+        self._manifest_lock = threading.RLock()
+        # Open the local download cache
+        self._cache = ObjStoreCache(Path(ctx.state.objstore.cache_root or ObjStore.CACHE_ROOT),
+                                    int(ctx.state.objstore.cache_limit or ObjStore.CACHE_LIMIT))
         # Return self to allow chaining
         return self
 
+    @property
+    def manifest(self) -> dict[str, dict[str, str]]:
+        # A single paginated listing describes every object in the bucket, which
+        # avoids a HEAD round trip per object
+        with self._manifest_lock:
+            if self._manifest is None:
+                # Only publish the listing once complete, so that no other thread
+                # sees a partial manifest
+                manifest = {}
+                kwargs = {"Bucket": self.bucket}
+                while True:
+                    rsp = self.store.list_objects_v2(**kwargs)
+                    for obj in rsp.get("Contents", []):
+                        manifest[obj["Key"]] = {"ContentLength": obj["Size"],
+                                                "ETag": obj["ETag"],
+                                                "LastModified": obj.get("LastModified", None)}
+                    if not rsp.get("IsTruncated", False):
+                        break
+                    kwargs["ContinuationToken"] = rsp["NextContinuationToken"]
+                logging.debug(f"Object store manifest lists {len(manifest)} objects")
+                self._manifest = manifest
+            return self._manifest
+
+    def offers(self, path: str) -> bool:
+        return path in self.manifest
+
     def get_info(self, path: str) -> dict[str, str] | None:
         try:
             return self.store.head_object(Bucket=self.bucket, Key=path)
         except botocore.exceptions.ClientError:
             return None
 
-    def download(self, path: str, target: Path) -> None:
-        if not self.get_info(path):
+    def describe(self, path: str, info: dict[str, str] | None = None) -> dict[str, str]:
+        # Prefer a description from the manifest, only issuing a HEAD request
+        # for objects that have appeared since it was listed
+        if not (info := info or self.manifest.get(path, None) or self.get_info(path)):
             raise Exception(f"Unknown object: {path}")
-        with target.open("wb") as fh:
-            self.store.download_fileobj(self.bucket, path, fh)
+        return info
+
+    def open(self,
+             path: str,
+             info: dict[str, str] | None = None,
+             spool: BinaryIO | None = None) -> ObjStoreReader:
+        info = self.describe(path, info)
+        return ObjStoreReader(self, path, info, ObjStore.CHUNK_SIZE, self.max_concurrency, spool)
+
+    def download(self, path: str, target: Path, info: dict[str, str] | None = None) -> None:
+        info = self.describe(path, info)
+        # Fetch into the cache on a miss, then link the cached copy into place
+        if not (cached := self._cache.lookup(path, info["ETag"])):
+            with self._cache.insert(path, info["ETag"]) as spool:
+                with self.open(path, info, spool) as fh:
+                    fh.verify()
+            cached = self._cache.entry(path, info["ETag"])
+        else:
+            logging.debug(f"Using cached copy of {path}")
+        ObjStoreCache.link(cached, target)
+
+    def extract(self, path: str, target: Path, info: dict[str, str] | None = None) -> None:
+        info = self.describe(path, info)
+        # On a cache hit, unpack the local copy
+        if cached := self._cache.lookup(path, info["ETag"]):
+            logging.debug(f"Using cached copy of {path}")
+            with cached.open("rb") as fh:
+                self.unpack(fh, path, target)
+            return
+        # Otherwise archive members are unpacked as soon as their chunks arrive,
+        # with the remainder of the object streaming in behind them and being
+        # spooled into the cache for the next checkout
+        with self._cache.insert(path, info["ETag"]) as spool:
+            with self.open(path, info, spool) as fh:
+                self.unpack(fh, path, target, fh.verify)
+
+    def unpack(self, fh: BinaryIO, path: str, target: Path, verify=None) -> None:
+        written = []
+        try:
+            if path.endswith(TAR_SUFFIX):
+                unpack_tar(fh, target, self.max_concurrency, written)
+            else:
+                unpack_zip(fh, target, written)
+            if verify:
+                verify()
+        except Exception:
+            # Don't leave a partial or corrupt install behind
+            for entry in written:
+                if entry.is_file() or entry.is_symlink():
+                    entry.unlink()
+            raise
+
+    def upload(self, source: Path, path: str, metadata: dict[str, str]) -> None:
+        # Large archives are split into parts that are uploaded concurrently
+        self.store.upload_file(source.as_posix(),
+                               self.bucket,
+                               path,
+                               ExtraArgs={"Metadata": metadata},
+                               Config=boto3.s3.transfer.TransferConfig(
+                                   multipart_threshold=ObjStore.CHUNK_SIZE,
+                                   multipart_chunksize=ObjStore.CHUNK_SIZE,
+                                   max_concurrency=self.max_concurrency,
+                               ))
+        info = self.get_info(path)
+        with self._manifest_lock:
+            self.manifest[path] = info
+
+    def publish_tool(self, tool: Tool, version: Version, root: Path, force: bool = False) -> bool:
+        objname = archive_name(tool, version, ARCHIVE_SUFFIXES[0])
+        tree = root / version.location.relative_to(Tool.HOST_ROOT)
+        digest = tree_digest(tree)
+        # Skip trees whose content matches what was last published
+        if not force and self.offers(objname):
+            published = (self.get_info(objname) or {}).get("Metadata", {})
+            if published.get("tree-sha256", None) == digest:
+                logging.info(f"Skipping {objname} as {tool.name} @ {version.version} is unchanged")
+                return False
+        with tempfile.TemporaryDirectory() as tmpdir:
+            logging.info(f"Archiving {tool.name} @ {version.version} into {objname}")
+            build_archive(tree, root, archive := Path(tmpdir) / objname)
+            with archive.open("rb") as fh:
+                sha256 = hashlib.file_digest(fh, "sha256").hexdigest()
+            logging.info(f"Uploading {objname} ({archive.stat().st_size / (1024 ** 2):.1f} MB)")
+            self.upload(archive, objname, {"sha256": sha256, "tree-sha256": digest})
+        return True
 
     @Tool.action("ObjStore")
     def authenticate(self, ctx: Context, version: Version, *args: list[str]) -> Invocation:
@@ -105,23 +493,206 @@ class ObjStore(Tool, metaclass=Singleton):
         else:
             raise Exception(f"No object known for: {path}")
 
+    @Tool.action("ObjStore")
+    def concurrency(self, ctx: Context, version: Version, *args: list[str]) -> Invocation:
+        if len(args) == 1 and args[0].isdigit() and int(args[0]) > 0:
+            ctx.state.objstore.concurrency = int(args[0])
+        elif len(args) > 0:
+            raise Exception("SYNTAX: bw tool objstore.concurrency <NUM_REQUESTS>")
+        logging.info(f"Object store downloads use up to "
+                     f"{ctx.state.objstore.concurrency or ObjStore.CONCURRENCY} "
+                     f"concurrent requests")
+        return None
+
+    @Tool.action("ObjStore")
+    def cache(self, ctx: Context, version: Version, *args: list[str]) -> Invocation:
+        if len(args) == 2 and args[1].isdigit():
+            ctx.state.objstore.cache_root = Path(args[0]).absolute().as_posix()
+            ctx.state.objstore.cache_limit = int(args[1]) * 1024 * 1024 * 1024
+        elif args == ("clear", ):
+            ObjStore().setup(ctx)._cache.clear()
+        elif len(args) > 0:
+            raise Exception("SYNTAX: bw tool objstore.cache [clear | <DIRECTORY> <LIMIT_GB>]")
+        cache = ObjStore().setup(ctx)._cache
+        entries = cache.entries()
+        logging.info(f"Object store cache at {cache.root} holds {len(entries)} "
+                     f"archives using {sum(x[0].st_size for x in entries) / (1024 ** 3):.2f} "
+                     f"of {cache.limit / (1024 ** 3):.2f} GB")
+        return None
+
+    @Tool.action("ObjStore")
+    def publish(self, ctx: Context, version: Version, *args: list[str]) -> Invocation:
+        force = "--force" in args
+        names = {x.lower() for x in args if x != "--force"}
+        store = ObjStore().setup(ctx)
+        # Gather every installed version of the tools that install from the store
+        selected = []
+        for tool in (x() for x in Tool.__subclasses__() if x.__name__ in OBJSTORE_TOOLS):
+            if names and tool.name.lower() not in names:
+                continue
+            for tool_ver in tool.versions:
+                if (ctx.host_tools / tool_ver.location.relative_to(Tool.HOST_ROOT)).is_dir():
+                    selected.append((tool, tool_ver))
+                else:
+                    logging.warning(f"{tool.name} @ {tool_ver.version} is not installed")
+        # List the store before any threads start, then hash, archive, and upload
+        # the tools in parallel
+        store.manifest
+        with ThreadPoolExecutor(max_workers=min(len(selected), os.cpu_count()) or 1) as pool:
+            futures = [pool.submit(store.publish_tool, tool, tool_ver, ctx.host_tools, force)
+                       for tool, tool_ver in selected]
+            uploaded = sum(x.result() for x in futures)
+        logging.info(f"Published {uploaded} of {len(selected)} tool archives")
+        return None
+
+    @Tool.action("ObjStore")
+    def benchmark(self, ctx: Context, version: Version, *args: list[str]) -> Invocation:
+        if len(args) != 1 or not (tree := Path(args[0]).absolute()).is_dir():
+            raise Exception("SYNTAX: bw tool objstore.benchmark <DIRECTORY>")
+        workers = int(ctx.state.objstore.concurrency or ObjStore.CONCURRENCY)
+        # Archive the tree in each supported format and time unpacking each one
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for suffix in ARCHIVE_SUFFIXES:
+                archive = Path(tmpdir) / f"benchmark{suffix}"
+                start = time.perf_counter()
+                build_archive(tree, tree.parent, archive)
+                t_build = time.perf_counter() - start
+                start = time.perf_counter()
+                with archive.open("rb") as fh:
+                    if suffix == TAR_SUFFIX:
+                        unpack_tar(fh, Path(tmpdir) / suffix, workers, [])
+                    else:
+                        unpack_zip(fh, Path(tmpdir) / suffix, [])
+                t_unpack = time.perf_counter() - start
+                logging.info(f"{suffix:<8s} {archive.stat().st_size / (1024 ** 2):8.1f} MB, "
+                             f"archived in {t_build:6.2f} s, unpacked in {t_unpack:6.2f} s")
+                archive.unlink()
+                shutil.rmtree(Path(tmpdir) / suffix)
+        return None
+
+
+# Names of the tools whose installers attempt the object store first
+OBJSTORE_TOOLS: set[str] = set()
+
+# Archive formats in order of preference, zstandard compressed tarballs unpack
+# significantly faster than zips which are only retained for older objects
+TAR_SUFFIX: str = ".tar.zst"
+ARCHIVE_SUFFIXES: list[str] = [TAR_SUFFIX, ".zip"]
+
+# Archive members with these suffixes are already compressed, so deflating
+# them again only costs time
+COMPRESSED_SUFFIXES: set[str] = {
+    ".7z", ".bz2", ".gz", ".jar", ".jpg", ".lz", ".lzma", ".png", ".tbz",
+    ".tgz", ".txz", ".whl", ".xz", ".zip", ".zst",
+}
+
+
+def archive_name(tool: Tool, version: Version, suffix: str = ".zip") -> str:
+    return f"{tool.name.lower()}_{version.version.replace('.', '_')}{suffix}"
+
+
+def tree_digest(tree: Path) -> str:
+    # Hash the layout, permissions, and content of every file in sorted order,
+    # so that an identical install always produces an identical digest
+    digest = hashlib.sha256()
+    for path in sorted(tree.rglob("*")):
+        digest.update(path.relative_to(tree).as_posix().encode("utf-8") + b"\0")
+        if path.is_symlink():
+            digest.update(b"L" + os.readlink(path).encode("utf-8") + b"\0")
+        elif path.is_file():
+            digest.update(b"F" + oct(path.stat().st_mode & 0o777).encode("utf-8") + b"\0")
+            with path.open("rb") as fh:
+                digest.update(hashlib.file_digest(fh, "sha256").digest())
+    return digest.hexdigest()
+
+
+def build_archive(tree: Path, root: Path, target: Path) -> None:
+    # Members are stored relative to the tools root, matching what from_objstore
+    # expects to unpack
+    if target.name.endswith(TAR_SUFFIX):
+        # Compression is spread across all available cores
+        cctx = zstandard.ZstdCompressor(level=10, threads=-1)
+        with target.open("wb") as fh, cctx.stream_writer(fh) as zh:
+            with tarfile.open(fileobj=zh, mode="w|") as th:
+                th.add(tree, arcname=tree.relative_to(root).as_posix())
+        return
+    # File permissions are recorded by ZipFile.write
+    with ZipFile(target, "w", compression=ZIP_DEFLATED, compresslevel=6) as zh:
+        for path in sorted(tree.rglob("*")):
+            if path.is_dir() or not path.exists():
+                continue
+            zh.write(path,
+                     path.relative_to(root).as_posix(),
+                     compress_type=[ZIP_DEFLATED, ZIP_STORED][path.suffix in COMPRESSED_SUFFIXES])
+
 
 def from_objstore(func):
+    OBJSTORE_TOOLS.add(func.__qualname__.split(".")[0])
     def _mock(tool: Tool, ctx: Context, version: Version, *args: list[str]) -> Invocation:
-        objname = f"{tool.name.lower()}_{version.version.replace('.', '_')}.zip"
         store = ObjStore().setup(ctx)
+        # Select the preferred archive format that the object store offers
+        objname = next((x for x in (archive_name(tool, version, y) for y in ARCHIVE_SUFFIXES)
+                        if store.offers(x)), None)
         # If the object store doesn't offer this tool, defer to the next installer
-        if not store.get_info(objname):
+        if objname is None:
             logging.warning(f"Object store doesn't offer {tool.name} @ {version.version}")
-            return func(ctx, version, *args)
-        # Download the object
-        logging.debug(f"Downloading tool {tool.name} from object store")
-        store.download(objname, target := ctx.host_tools / objname)
-        # Unpack archive
-        logging.debug(f"Unpacking tool {tool.name} into {ctx.host_tools}")
-        with ZipFile(target, "r") as zh:
-            zh.extractall(ctx.host_tools)
-        # Clean-up
-        logging.debug("Removing zip archive")
-        target.unlink()
+            return func(tool, ctx, version, *args)
+        # Stream the archive from the object store, unpacking as it arrives
+        logging.debug(f"Downloading and unpacking tool {tool.name} into {ctx.host_tools}")
+        store.extract(objname, ctx.host_tools)
     return _mock
+
+
+def unpack_zip(fh: BinaryIO, target: Path, written: list[Path]) -> None:
+    with ZipFile(fh, "r") as zh:
+        for member in zh.infolist():
+            written.append(entry := Path(zh.extract(member, target)))
+            # ZipFile doesn't restore permissions, so apply any that were recorded
+            if not member.is_dir() and (mode := (member.external_attr >> 16) & 0o777):
+                entry.chmod(mode)
+
+
+def unpack_tar(fh: BinaryIO, target: Path, workers: int, written: list[Path]) -> None:
+    # Decompression and tar parsing run as one sequential stream (within which
+    # zstandard releases the GIL), while file contents are handed to a pool of
+    # writers so that filesystem latency overlaps with decompression. The number
+    # of buffered files is bounded to keep memory use in check.
+    pending = threading.BoundedSemaphore(4 * workers)
+    links = []
+
+    def _write(entry: Path, data: bytes, member: tarfile.TarInfo) -> None:
+        try:
+            entry.write_bytes(data)
+            entry.chmod(member.mode)
+            os.utime(entry, (member.mtime, member.mtime))
+        finally:
+            pending.release()
+
+    dctx = zstandard.ZstdDecompressor()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="unpack") as pool:
+        futures = []
+        with dctx.stream_reader(fh) as zh, tarfile.open(fileobj=zh, mode="r|") as th:
+            for member in th:
+                if hasattr(tarfile, "data_filter"):
+                    member = tarfile.data_filter(member, target.as_posix())
+                entry = target / member.name
+                if member.isdir():
+                    entry.mkdir(parents=True, exist_ok=True)
+                    continue
+                written.append(entry)
+                entry.parent.mkdir(parents=True, exist_ok=True)
+                if member.isfile():
+                    data = th.extractfile(member).read()
+                    pending.acquire()
+                    futures.append(pool.submit(_write, entry, data, member))
+                elif member.issym() or member.islnk():
+                    links.append((entry, member))
+        for future in futures:
+            future.result()
+    # Links are created last, once the files they point at exist
+    for entry, member in links:
+        entry.unlink(missing_ok=True)
+        if member.issym():
+            entry.symlink_to(member.linkname)
+        else:
+            os.link(target / member.linkname, entry)
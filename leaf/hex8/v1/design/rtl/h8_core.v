@@ -12,7 +12,12 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
-module h8_core (
+module h8_core #(
+    // Include performance counters (off by default, enabled by the testbenches),
+    // otherwise the debug port is tied to zero
+      parameter PERF_COUNTERS = 0
+    , parameter PERF_WIDTH    = 32
+) (
       input  wire       i_clk
     , input  wire       i_rst
     // Instruction Memory
@@ -25,6 +30,13 @@ module h8_core (
     , output wire       o_dmem_req_write
     , output wire       o_dmem_req_valid
     , input  wire [7:0] i_dmem_rsp_data
+    // Performance Counters (debug)
+    , output wire [PERF_WIDTH-1:0] o_perf_retired
+    , output wire [PERF_WIDTH-1:0] o_perf_branches
+    , output wire [PERF_WIDTH-1:0] o_perf_flushed
+    , output wire [PERF_WIDTH-1:0] o_perf_loads
+    , output wire [PERF_WIDTH-1:0] o_perf_stores
+    , output wire [PERF_WIDTH-1:0] o_perf_prefixed
 );
 
 // =============================================================================
@@ -250,4 +262,53 @@ always @(posedge i_clk, posedge i_rst) begin
     end
 end
 
+// =============================================================================
+// Performance Counters
+// =============================================================================
+
+// NOTE: Counters are cleared by reset and count events as instructions execute,
+//       they are only present when PERF_COUNTERS is set
+generate
+if (PERF_COUNTERS) begin : gen_perf
+    reg [PERF_WIDTH-1:0] retired_q, branches_q, flushed_q, loads_q, stores_q,
+                         prefixed_q;
+    reg                  pfix_vld_q;
+
+    always @(posedge i_clk, posedge i_rst) begin
+        if (i_rst) begin
+            retired_q  <= 'd0;
+            branches_q <= 'd0;
+            flushed_q  <= 'd0;
+            loads_q    <= 'd0;
+            stores_q   <= 'd0;
+            prefixed_q <= 'd0;
+            pfix_vld_q <= 1'd0;
+        end else begin
+            retired_q  <= retired_q  + PERF_WIDTH'(valid                           );
+            branches_q <= branches_q + PERF_WIDTH'(valid && take_branch            );
+            flushed_q  <= flushed_q  + PERF_WIDTH'(flush_q                         );
+            loads_q    <= loads_q    + PERF_WIDTH'(valid && (dmem_ld_a || dmem_ld_b));
+            stores_q   <= stores_q   + PERF_WIDTH'(valid && dmem_st_a              );
+            prefixed_q <= prefixed_q + PERF_WIDTH'(valid && pfix_vld_q             );
+            // Track whether the last instruction executed was a prefix
+            pfix_vld_q <= valid ? is_pfix : pfix_vld_q;
+        end
+    end
+
+    assign o_perf_retired  = retired_q;
+    assign o_perf_branches = branches_q;
+    assign o_perf_flushed  = flushed_q;
+    assign o_perf_loads    = loads_q;
+    assign o_perf_stores   = stores_q;
+    assign o_perf_prefixed = prefixed_q;
+end else begin : gen_no_perf
+    assign o_perf_retired  = 'd0;
+    assign o_perf_branches = 'd0;
+    assign o_perf_flushed  = 'd0;
+    assign o_perf_loads    = 'd0;
+    assign o_perf_stores   = 'd0;
+    assign o_perf_prefixed = 'd0;
+end
+endgenerate
+
 endmodule : h8_core
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 from random import Random
 
 from cocotb.log import SimLog
@@ -22,31 +23,58 @@ from .monitor import ByteMemoryRequestMonitor
 from .transaction import ByteMemoryRequest, ByteMemoryResponse
 
 
+@functools.lru_cache(maxsize=1024)
+def background(seed: int, size: int) -> bytes:
+    # Backgrounds are cached so that repeated seeds (e.g. when replaying a
+    # failure, or between the bench and a model) share the same block
+    return Random(seed).randbytes(size)
+
+
 class ByteMemoryModel:
 
     def __init__(self,
                  request: ByteMemoryRequestMonitor,
                  response: ByteMemoryResponseDriver,
                  random: Random,
-                 log: SimLog) -> None:
+                 log: SimLog,
+                 dense: bool = False,
+                 size: int = 256) -> None:
         # Take references
         self._request = request
         self._response = response
-        self._random = random
         self._log = log
+        # NOTE: A sparse memory fills each address as it is first read, so the
+        #       contents depend on the order of accesses, while a dense memory
+        #       takes its whole random background from the seed up front
+        self._dense = dense
+        self._size = size
         # Create memory storage
         self._memory = {}
+        self.seed(random)
         # Subscribe to requests
         self._request.subscribe(MonitorEvent.CAPTURE, self._service)
 
+    @property
+    def image(self) -> bytes:
+        return bytes(self.read(x) for x in range(self._size))
+
     def reset(self) -> None:
-        self._memory.clear()
+        if self._dense:
+            self._memory = bytearray(background(self._background, self._size))
+        else:
+            self._memory.clear()
+
+    def seed(self, random: Random) -> None:
+        self._random = random
+        if self._dense:
+            self._background = random.getrandbits(64)
+            self.reset()
 
     def write(self, address: int, data: int) -> None:
         self._memory[address] = data
 
     def read(self, address: int) -> int:
-        if address not in self._memory:
+        if not self._dense and address not in self._memory:
             self._memory[address] = self._random.getrandbits(8)
         return self._memory[address]
 
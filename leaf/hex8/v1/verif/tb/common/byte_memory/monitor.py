@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import deque
+
 from cocotb.triggers import RisingEdge
 from forastero import BaseMonitor
 
@@ -33,13 +35,25 @@ class ByteMemoryRequestMonitor(BaseMonitor):
 
 class ByteMemoryResponseMonitor(BaseMonitor):
 
+    def __init__(self, *args, latency: int = 1, **kwds) -> None:
+        assert latency >= 1, "Response latency must be at least one cycle"
+        self.latency = latency
+        super().__init__(*args, **kwds)
+
     async def monitor(self, capture) -> None:
+        # NOTE: Requests may be presented every cycle, so rather than waiting
+        #       for each response in turn the cycle in which each outstanding
+        #       response is due is tracked, capturing at most one per cycle
+        outstanding = deque()
+        cycle = 0
         while True:
             await RisingEdge(self.clk)
+            cycle += 1
             if self.rst.value != 0:
+                outstanding.clear()
                 continue
-            if self.io.get("req_valid", 1):
-                await RisingEdge(self.clk)
-                if self.rst.value != 0:
-                    continue
+            if outstanding and outstanding[0] == cycle:
+                outstanding.popleft()
                 capture(ByteMemoryResponse(data=self.io.get("rsp_data", 0)))
+            if self.io.get("req_valid", 1):
+                outstanding.append(cycle + self.latency)
@@ -12,6 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .model import Hex8Model
+from importlib import import_module
 
-assert all((Hex8Model, ))
+# Exports are resolved on first access, so that importing one part of the
+# package (e.g. the golden model) does not pull in all of the others
+EXPORTS = {
+    "Hex8Assembler": "asm",
+    "Hex8Coverage": "coverage",
+    "Hex8CycleModel": "cycle",
+    "Hex8CycleSystem": "cycle",
+    "Hex8Model": "model",
+    "Hex8PerfStats": "perf",
+    "Hex8Profile": "profile",
+    "Hex8Recorder": "recorder",
+    "Hex8Workload": "workloads",
+}
+
+
+def __getattr__(name: str) -> object:
+    if name in EXPORTS:
+        return getattr(import_module(f"{__name__}.{EXPORTS[name]}"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(EXPORTS))
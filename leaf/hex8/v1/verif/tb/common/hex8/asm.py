@@ -0,0 +1,146 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .isa import Hex8Op, encode
+
+# Items making up a program, assembled into instructions once all labels are
+# known (the first element of each item identifies its kind):
+#  - ("op", op, value)            : instruction, prefixed if the value needs it
+#  - ("nop",)                     : PFIX 0, never removed by the optimiser
+#  - ("label", name)              : marks the address of the next item
+#  - ("ref", op, name, relative)  : instruction taking the address of a label
+Item = tuple
+
+
+class Hex8Assembler:
+
+    # NOTE: The RTL executes the instruction following a taken branch and takes
+    #       relative targets from the next fetch address, whereas Hex8Model does
+    #       neither. Programs assembled here are written so that both agree on
+    #       the final state: every branch is followed by a NOP and every branch
+    #       target is a NOP, so the RTL landing one instruction past the target
+    #       (having executed the NOP after the branch) is equivalent to the
+    #       model landing on it. PFIX 0 serves as the NOP.
+
+    def __init__(self, items: list[Item] | None = None) -> None:
+        self.items: list[Item] = list(items or [])
+        # Data memory locations initialised with the address of a label
+        self.pointers: dict[int, str] = {}
+        # Populated on assembly
+        self.labels: dict[str, int] = {}
+        self.addresses: list[int] = []
+        self.sizes: list[int] = []
+
+    def emit(self, op: Hex8Op, imm: int = 0) -> None:
+        self.items.append(("op", op, imm & 0xF))
+
+    def nop(self) -> None:
+        self.items.append(("nop", ))
+
+    def op(self, op: Hex8Op, value: int = 0) -> None:
+        # Emit an instruction with an 8-bit immediate, prefixed only if needed
+        self.items.append(("op", op, value & 0xFF))
+
+    def mark(self, name: str) -> None:
+        if any(x[0] == "label" and x[1] == name for x in self.items):
+            raise Exception(f"Label '{name}' defined twice")
+        self.items.append(("label", name))
+
+    def label(self, name: str) -> None:
+        self.mark(name)
+        self.nop()
+
+    def branch(self, op: Hex8Op, name: str) -> None:
+        self.items.append(("ref", op, name, True))
+        self.nop()
+
+    def branch_b(self) -> None:
+        self.emit(Hex8Op.BRB)
+        self.nop()
+
+    def address(self, op: Hex8Op, name: str) -> None:
+        # Load the address of a label as a constant (i.e. with LDAC or LDBC)
+        self.items.append(("ref", op, name, False))
+
+    def pointer(self, address: int, name: str) -> None:
+        self.pointers[address] = name
+
+    def halt(self) -> None:
+        # Spin on a branch back to a NOP, the branch marks the end of the program
+        self.label("_halt")
+        self.mark("_spin")
+        self.branch(Hex8Op.BR, "_halt")
+
+    @property
+    def halt_pc(self) -> int:
+        # The spinning branch follows its prefix
+        index = next(i for i, x in enumerate(self.items) if x == ("label", "_spin")) + 1
+        return self.addresses[index] + self.sizes[index] - 1
+
+    def layout(self, sizes: dict[int, int]) -> None:
+        # Place every item given the sizes chosen for label references
+        self.labels, self.addresses, self.sizes = {}, [], []
+        address = 0
+        for index, item in enumerate(self.items):
+            match item[0]:
+                case "op":
+                    size = 2 if item[2] > 0xF else 1
+                case "nop":
+                    size = 1
+                case "label":
+                    size = 0
+                    self.labels[item[1]] = address
+                case "ref":
+                    size = sizes[index]
+            self.addresses.append(address)
+            self.sizes.append(size)
+            address += size
+
+    def resolve(self, index: int) -> int:
+        _, _, name, relative = self.items[index]
+        if name not in self.labels:
+            raise Exception(f"Undefined label '{name}'")
+        # Offsets are relative to the branch itself, which follows any prefix
+        if relative:
+            return (self.labels[name] - (self.addresses[index] + self.sizes[index] - 1)) & 0xFF
+        return self.labels[name]
+
+    def assemble(self, relax: bool = False) -> bytes:
+        # References to labels are either always prefixed or, when relaxed,
+        # start without a prefix and grow until every value fits (sizes only
+        # ever grow, so this reaches a fixed point)
+        refs = [i for i, x in enumerate(self.items) if x[0] == "ref"]
+        sizes = {x: 1 if relax else 2 for x in refs}
+        while True:
+            self.layout(sizes)
+            grow = [x for x in refs if sizes[x] == 1 and self.resolve(x) > 0xF]
+            if not grow:
+                break
+            for index in grow:
+                sizes[index] = 2
+        # Encode
+        code = bytearray()
+        for index, item in enumerate(self.items):
+            if item[0] == "label":
+                continue
+            if item[0] == "nop":
+                code.append(encode(Hex8Op.PFIX, 0))
+                continue
+            value = self.resolve(index) if item[0] == "ref" else item[2]
+            if self.sizes[index] == 2:
+                code.append(encode(Hex8Op.PFIX, value >> 4))
+            code.append(encode(item[1], value))
+        if len(code) > 256:
+            raise Exception(f"Program of {len(code)} instructions exceeds instruction memory")
+        return bytes(code.ljust(256, b"\x00"))
@@ -0,0 +1,289 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from dataclasses import dataclass
+
+from .isa import Hex8Op
+
+# Nodes of the graph hold an instruction address, the prefix held on reaching
+# it (as the same byte decodes differently with and without a PFIX ahead of
+# it), and the address that executes next unless a branch redirects it. The
+# latter always follows the instruction under the ISA, but under the RTL it is
+# the address being fetched, which is a branch's target in its delay slot.
+Node = tuple[int, int, int]
+
+# NOTE: Hex8Model does not wrap the PC under the ISA, so falling through the
+#       last address of instruction memory fetches zeroes (LDAM) forever. Every
+#       fetch beyond the end is represented by this single address.
+END = 0x100
+
+# Execution starts from address zero, with no prefix, under both the ISA and
+# the RTL
+START: Node = (0, 0, 1)
+
+LOADS = frozenset((Hex8Op.LDAM, Hex8Op.LDBM, Hex8Op.LDAI, Hex8Op.LDBI))
+STORES = frozenset((Hex8Op.STAM, Hex8Op.STAI))
+
+
+def merge(lhs: int | None, rhs: int | None) -> int | None:
+    # Register values are either a known constant or unknown (None)
+    return lhs if lhs == rhs else None
+
+
+@dataclass(kw_only=True)
+class Hex8Loop:
+    nodes: frozenset[Node]
+    # Edges leaving the loop
+    exits: list[tuple[Node, Node]]
+    stores: bool
+    # One of:
+    #  - spin     : can never be left and never stores, so nothing changes
+    #  - infinite : can never be left, but keeps storing
+    #  - bounded  : always left, within 'steps' instructions
+    #  - unknown  : may or may not be left
+    kind: str
+    steps: int | None = None
+
+    @property
+    def pcs(self) -> list[int]:
+        return sorted({x[0] for x in self.nodes})
+
+
+class Hex8ControlFlow:
+
+    # NOTE: Analysis follows Hex8Model, either under the ISA (where branches
+    #       take effect immediately and relative targets are taken from the
+    #       branch's own PC) or, with 'rtl' set, as h8_core executes (matching
+    #       the engines that are co-simulated). Register values are tracked as
+    #       constants where every path agrees, which resolves conditional
+    #       branches and BRB targets where possible. Otherwise BRB may reach
+    #       any address, and under the RTL one in the delay slot of another may
+    #       pair any address with any fetch, in which case the analysis gives
+    #       up once the graph exceeds 'nodes' (which the ISA cannot reach).
+
+    def __init__(self,
+                 imem: bytes,
+                 limit: int = 1 << 12,
+                 rtl: bool = False,
+                 nodes: int = 1 << 13) -> None:
+        self.imem = bytes(imem)
+        self.rtl = rtl
+        # Most instructions simulated when bounding a loop
+        self.limit = limit
+        # Registers on reaching each node, and the edges leaving it
+        self.states: dict[Node, tuple[int | None, int | None]] = {}
+        self.edges: dict[Node, set[Node]] = {}
+        # An incomplete analysis predicts nothing, with every address reachable
+        self.complete = self._propagate(nodes)
+        self.components = self._components() if self.complete else []
+        self.loops = [x for x in map(self._classify, self.components) if x is not None]
+        self.steps = self._bound() if self.complete else None
+
+    def decode(self, node: Node) -> tuple[Hex8Op, int]:
+        pc, pfix, _ = node
+        data = self.imem[pc] if pc < len(self.imem) else 0
+        return Hex8Op(data >> 4), (pfix << 4) | (data & 0xF)
+
+    def follow(self, node: Node, pfix: int = 0, target: int | None = None) -> Node:
+        # Node executed after this one, either falling through or (given a
+        # target) having taken a branch
+        _, _, fetch = node
+        if self.rtl:
+            # The instruction already fetched executes while the target is
+            return (fetch, pfix, ((fetch + 1) & 0xFF) if target is None else target)
+        pc = fetch if target is None else target
+        return (pc, pfix, min(pc + 1, END))
+
+    def transfer(self, node: Node, areg: int | None, breg: int | None
+                 ) -> tuple[int | None, int | None, list[Node]]:
+        # Registers after executing a node, along with the nodes that may follow
+        pc, _, fetch = node
+        op, value = self.decode(node)
+        base = fetch if self.rtl else pc
+        after, target = self.follow(node), self.follow(node, target=(base + value) & 0xFF)
+        match op:
+            case Hex8Op.PFIX:
+                return areg, breg, [self.follow(node, pfix=value & 0xF)]
+            case Hex8Op.LDAM | Hex8Op.LDAI:
+                areg = None
+            case Hex8Op.LDBM | Hex8Op.LDBI:
+                breg = None
+            case Hex8Op.LDAC:
+                areg = value
+            case Hex8Op.LDBC:
+                breg = value
+            case Hex8Op.LDAP:
+                areg = (base + value) & 0xFF
+            case Hex8Op.ADD | Hex8Op.SUB:
+                if areg is not None and breg is not None:
+                    areg = ((areg - breg) if op == Hex8Op.SUB else (areg + breg)) & 0xFF
+                else:
+                    areg = None
+            case Hex8Op.BR:
+                return areg, breg, [target]
+            case Hex8Op.BRZ | Hex8Op.BRN:
+                if areg is None:
+                    return areg, breg, [after, target]
+                taken = (areg == 0) if op == Hex8Op.BRZ else bool(areg & 0x80)
+                return areg, breg, [target if taken else after]
+            case Hex8Op.BRB:
+                if breg is None:
+                    return areg, breg, [self.follow(node, target=x) for x in range(256)]
+                return areg, breg, [self.follow(node, target=breg)]
+        return areg, breg, [after]
+
+    def _propagate(self, nodes: int) -> bool:
+        # Find every reachable node, starting from reset with both registers
+        # cleared, widening register values until a fixed point. Edges are
+        # recomputed each time a node is revisited, as they only ever grow.
+        self.states = {START: (0, 0)}
+        work = [START]
+        while work:
+            if len(self.states) > nodes:
+                return False
+            node = work.pop()
+            areg, breg, succs = self.transfer(node, *self.states[node])
+            self.edges[node] = set(succs)
+            for succ in succs:
+                prev = self.states.get(succ)
+                state = (areg, breg) if prev is None else (merge(prev[0], areg),
+                                                           merge(prev[1], breg))
+                if state != prev:
+                    self.states[succ] = state
+                    work.append(succ)
+        return True
+
+    def _components(self) -> list[list[Node]]:
+        # Strongly connected components (Tarjan's algorithm, without recursion),
+        # listed with the components that follow ahead of those that precede
+        index, low, stack, active, result = {}, {}, [], set(), []
+        for root in sorted(self.edges):
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            active.add(root)
+            work = [(root, iter(sorted(self.edges[root])))]
+            while work:
+                node, succs = work[-1]
+                for succ in succs:
+                    if succ not in index:
+                        index[succ] = low[succ] = len(index)
+                        stack.append(succ)
+                        active.add(succ)
+                        work.append((succ, iter(sorted(self.edges[succ]))))
+                        break
+                    if succ in active:
+                        low[node] = min(low[node], index[succ])
+                else:
+                    work.pop()
+                    if work:
+                        low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while (member := stack.pop()) != node:
+                            active.discard(member)
+                            component.append(member)
+                        active.discard(node)
+                        result.append([*component, node])
+        return result
+
+    def _classify(self, component: list[Node]) -> Hex8Loop | None:
+        members = frozenset(component)
+        if len(component) == 1 and component[0] not in self.edges[component[0]]:
+            return None
+        exits = [(x, y) for x in component for y in sorted(self.edges[x]) if y not in members]
+        stores = any(self.decode(x)[0] in STORES for x in component)
+        if not exits:
+            return Hex8Loop(nodes=members, exits=exits, stores=stores,
+                            kind="infinite" if stores else "spin")
+        steps = self._trips(members)
+        return Hex8Loop(nodes=members, exits=exits, stores=stores,
+                        kind="unknown" if steps is None else "bounded", steps=steps)
+
+    def _trips(self, members: frozenset[Node]) -> int | None:
+        # A loop that never loads is deterministic given the registers it is
+        # entered with, so where those are known it can be simulated until it
+        # leaves (or repeats a state, in which case it may never be left)
+        if any(self.decode(x)[0] in LOADS for x in members):
+            return None
+        entries = [(y, *self.transfer(x, *self.states[x])[:2]) for x in self.edges
+                   if x not in members for y in self.edges[x] if y in members]
+        if START in members:
+            entries.append((START, 0, 0))
+        longest = 0
+        for node, areg, breg in entries:
+            if areg is None or breg is None:
+                return None
+            seen, steps = set(), 0
+            while node in members:
+                if (node, areg, breg) in seen or steps >= self.limit:
+                    return None
+                seen.add((node, areg, breg))
+                areg, breg, (node, ) = self.transfer(node, areg, breg)
+                steps += 1
+            longest = max(longest, steps)
+        return longest
+
+    def _bound(self) -> int | None:
+        # Most instructions executed before reaching a spin loop, which is known
+        # only where every path from reset leads to one through bounded loops
+        component = {x: i for i, c in enumerate(self.components) for x in c}
+        loops = {component[next(iter(x.nodes))]: x for x in self.loops}
+        bounds = []
+        for idx, nodes in enumerate(self.components):
+            loop = loops.get(idx)
+            if loop is not None and loop.kind == "spin":
+                bounds.append(0)
+                continue
+            if loop is not None and loop.kind != "bounded":
+                bounds.append(None)
+                continue
+            after = [bounds[component[y]] for x in nodes for y in self.edges[x]
+                     if component[y] != idx]
+            if not after or None in after:
+                bounds.append(None)
+            else:
+                bounds.append((loop.steps if loop else 1) + max(after))
+        return bounds[component[START]]
+
+    @property
+    def halts(self) -> bool:
+        # Whether the program always settles into a spin loop, as a workload's
+        # halt does
+        return self.steps is not None
+
+    @property
+    def reachable(self) -> list[int]:
+        if not self.complete:
+            return list(range(len(self.imem)))
+        return sorted({x[0] for x in self.edges if x[0] < END})
+
+    @property
+    def unreachable(self) -> list[int]:
+        reachable = set(self.reachable)
+        return [x for x in range(len(self.imem)) if x not in reachable]
+
+    def budget(self, cycles: int, margin: int = 32) -> int:
+        # Trim a cycle budget where the program is predicted to halt, allowing a
+        # margin for the pipeline and a few turns of the spin loop
+        return cycles if self.steps is None else min(cycles, self.steps + margin)
+
+    def summary(self) -> dict:
+        return {"halts": self.halts,
+                "steps": self.steps,
+                "unreachable": len(self.unreachable),
+                "loops": [{"pcs": x.pcs, "kind": x.kind, "steps": x.steps, "exits": len(x.exits)}
+                          for x in self.loops]}
+
@@ -0,0 +1,101 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+
+from .isa import Hex8Op
+from .model import Hex8Model
+from .state import Hex8State
+
+
+@dataclass(kw_only=True)
+class Hex8Divergence:
+    engine: str
+    index: int
+    pc: int
+    op: str
+    fields: list[str] = field(default_factory=list)
+    expected: dict[str, int] = field(default_factory=dict)
+    actual: dict[str, int] = field(default_factory=dict)
+
+
+class Hex8Cosim:
+
+    # NOTE: The opcode is not compared directly as it is implied by the PC, with
+    #       instruction memory being read-only
+    FIELDS = ("pc", "areg", "breg", "memory", "address", "data")
+
+    def __init__(self, imem: Iterable[int], dmem: Iterable[int]) -> None:
+        self.imem = bytes(imem)
+        self.dmem = bytes(dmem)
+        # The golden model supplies the reference commit stream, following the
+        # RTL's semantics as every engine compared is derived from h8_core
+        self.model = Hex8Model(rtl=True)
+        self.model.load(self.imem, self.dmem)
+        # Reference commits are held only until every engine has consumed them
+        self.expected: list[Hex8State] = []
+        self.base = 0
+        self.position: dict[str, int] = {}
+        self.divergences: dict[str, Hex8Divergence] = {}
+
+    def register(self, engine: str) -> None:
+        self.position[engine] = self.base
+
+    @property
+    def active(self) -> list[str]:
+        return [x for x in self.position if x not in self.divergences]
+
+    def commit(self, engine: str, state: Hex8State) -> Hex8Divergence | None:
+        # Once diverged, an engine's later commits are meaningless
+        if engine in self.divergences:
+            return self.divergences[engine]
+        index = self.position[engine]
+        while len(self.expected) <= (index - self.base):
+            self.expected.append(self.model.step())
+        expected = self.expected[index - self.base]
+        self.position[engine] = index + 1
+        # Compare the commit against the reference
+        if mismatches := [x for x in Hex8Cosim.FIELDS
+                          if getattr(state, x) != getattr(expected, x)]:
+            self.divergences[engine] = Hex8Divergence(
+                engine=engine,
+                index=index,
+                pc=expected.pc,
+                op=Hex8Op(self.imem[expected.pc] >> 4).name,
+                fields=mismatches,
+                expected={x: int(getattr(expected, x)) for x in mismatches},
+                actual={x: int(getattr(state, x)) for x in mismatches},
+            )
+        # Release reference commits that all engines have moved past
+        if consumed := min((self.position[x] for x in self.active), default=index + 1) - self.base:
+            del self.expected[:consumed]
+            self.base += consumed
+        return self.divergences.get(engine, None)
+
+    def consume(self, engine: str, commits: Iterable[Hex8State]) -> Hex8Divergence | None:
+        # NOTE: Engines consumed one after another must all be registered up
+        #       front, otherwise reference commits are released too early
+        if engine not in self.position:
+            self.register(engine)
+        for state in commits:
+            if divergence := self.commit(engine, state):
+                return divergence
+        return None
+
+    def summary(self) -> dict[str, dict]:
+        return {x: {"commits": self.position[x],
+                    "divergence": (asdict(self.divergences[x])
+                                   if x in self.divergences else None)}
+                for x in self.position}
@@ -0,0 +1,268 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import struct
+import sys
+from array import array
+from collections.abc import Iterable
+from itertools import accumulate
+from operator import add
+from pathlib import Path
+
+from .isa import Hex8Op
+from .state import Hex8MemoryOp, Hex8State
+
+# Length of the PFIX chain preceding an instruction (0, 1, 2, or 3+)
+PFIX_DEPTH = 4
+# Branch outcomes are recorded per branch type, unconditional branches are only
+# ever taken
+BRANCHES = ((Hex8Op.BR, True),
+            (Hex8Op.BRZ, False), (Hex8Op.BRZ, True),
+            (Hex8Op.BRN, False), (Hex8Op.BRN, True),
+            (Hex8Op.BRB, True))
+# Data memory accesses are binned into 16 byte ranges
+ADDRESS_RANGES = 16
+# Register values are classified as zero, positive, or negative
+SIGNS = ("ZERO", "POS", "NEG")
+# Instructions that load each register from memory
+LOADS = {"A": (Hex8Op.LDAM, Hex8Op.LDAI), "B": (Hex8Op.LDBM, Hex8Op.LDBI)}
+
+# Bin labels for each cover group, in the order they are laid out in memory
+GROUPS: dict[str, list[str]] = {
+    # Every opcode at each depth of PFIX chain
+    "op_pfix": [f"{op.name}.PFIX_{x}" for op in Hex8Op for x in ("0", "1", "2", "3+")],
+    # Taken and not-taken outcome for each branch type
+    "branch": [f"{op.name}.{'TAKEN' if x else 'NOT_TAKEN'}" for op, x in BRANCHES],
+    # Loads and stores by address range
+    "address": [f"{mem.name}.{x * 16:02X}_{x * 16 + 15:02X}"
+                for mem in (Hex8MemoryOp.LOAD, Hex8MemoryOp.STORE)
+                for x in range(ADDRESS_RANGES)],
+    # Cross of the signs of A and B
+    "sign": [f"A_{a}.B_{b}" for a in SIGNS for b in SIGNS],
+    # Every opcode immediately following a load, exercising the forwarding of
+    # loaded data via ld_a_pend_q/ld_b_pend_q
+    "hazard": [f"LOAD_{reg}.{op.name}" for reg in LOADS for op in Hex8Op],
+}
+
+# Offset of each group within the flat array of hits
+OFFSETS = dict(zip(GROUPS, accumulate((len(x) for x in GROUPS.values()), initial=0)))
+TOTAL_BINS = sum(len(x) for x in GROUPS.values())
+
+# Binary database layout (all little-endian):
+#  - Header: magic, format version, digest of the bin layout, bin count, total
+#            samples, and the number of contributing tests
+#  - Hits:   one 64-bit count per bin
+#  - Tests:  for each contributing test, the length of its name, the name, and
+#            a bitmap of the bins that it hit
+DB_MAGIC = b"H8CV"
+DB_VERSION = 1
+DB_HEADER = struct.Struct("<4sH8sIQI")
+DB_NAME = struct.Struct("<H")
+DB_MASK_BYTES = (TOTAL_BINS + 7) // 8
+DB_LAYOUT = hashlib.sha256("\n".join(f"{k}.{x}" for k, v in GROUPS.items()
+                                      for x in v).encode("utf-8")).digest()[:8]
+
+# Lookup tables so that sampling is reduced to indexing and addition
+BRANCH_INDEX = [tuple(BRANCHES.index((op, x)) if (op, x) in BRANCHES else -1
+                      for x in (False, True))
+                if any(y == op for y, _ in BRANCHES) else None
+                for op in Hex8Op]
+SIGN_INDEX = [0 if x == 0 else (1 if x < 0x80 else 2) for x in range(256)]
+LOAD_INDEX = [next((i for i, ops in enumerate(LOADS.values()) if x in ops), -1)
+              for x in Hex8Op]
+
+
+class Hex8Coverage:
+
+    def __init__(self, name: str | None = None) -> None:
+        self.name = name
+        # Hits are accumulated into a single preallocated array, with each cover
+        # group occupying a contiguous range of bins
+        self.hits = array("Q", bytes(8 * TOTAL_BINS))
+        self.samples = 0
+        # Bins hit by each test merged into this database (as integer bitsets)
+        self.tests: dict[str, int] = {}
+        self.restart()
+
+    def restart(self) -> None:
+        # Clear the sequence tracking at the start of a new instruction stream
+        self.pfix_chain = 0
+        self.last_load = -1
+
+    def sample(self, state: Hex8State) -> None:
+        hits = self.hits
+        op = int(state.op.op)
+        self.samples += 1
+        # Opcode by PFIX chain depth
+        hits[OFFSETS["op_pfix"] + op * PFIX_DEPTH + min(self.pfix_chain, PFIX_DEPTH - 1)] += 1
+        self.pfix_chain = (self.pfix_chain + 1) if op == Hex8Op.PFIX else 0
+        # Branch outcome (branches do not modify A, so the committed value is
+        # the one the condition was evaluated against)
+        if branch := BRANCH_INDEX[op]:
+            match op:
+                case Hex8Op.BRZ:
+                    taken = state.areg == 0
+                case Hex8Op.BRN:
+                    taken = (state.areg & 0x80) != 0
+                case _:
+                    taken = True
+            hits[OFFSETS["branch"] + branch[taken]] += 1
+        # Memory access address range
+        if state.memory != Hex8MemoryOp.NOTHING:
+            hits[OFFSETS["address"]
+                 + (state.memory - Hex8MemoryOp.LOAD) * ADDRESS_RANGES
+                 + (state.address >> 4)] += 1
+        # Register sign cross
+        hits[OFFSETS["sign"] + 3 * SIGN_INDEX[state.areg] + SIGN_INDEX[state.breg]] += 1
+        # Instruction following a load
+        if self.last_load >= 0:
+            hits[OFFSETS["hazard"] + self.last_load * len(Hex8Op) + op] += 1
+        self.last_load = LOAD_INDEX[op]
+
+    def observe(self, commits: Iterable[Hex8State]) -> Iterable[Hex8State]:
+        # Sample commits as they pass through to another consumer
+        for state in commits:
+            self.sample(state)
+            yield state
+
+    @property
+    def mask(self) -> int:
+        return sum(1 << i for i, x in enumerate(self.hits) if x)
+
+    def contributions(self) -> dict[str, int]:
+        # A database built from a single named run contributes only itself
+        if not self.tests and self.name:
+            return {self.name: self.mask}
+        return self.tests
+
+    def merge(self, other: "Hex8Coverage") -> "Hex8Coverage":
+        self.tests = {**self.contributions(), **other.contributions()}
+        self.hits = array("Q", map(add, self.hits, other.hits))
+        self.samples += other.samples
+        return self
+
+    def group(self, name: str) -> dict[str, int]:
+        offset = OFFSETS[name]
+        return dict(zip(GROUPS[name], self.hits[offset:offset + len(GROUPS[name])]))
+
+    def summary(self) -> dict[str, dict]:
+        summary = {}
+        for name, labels in GROUPS.items():
+            bins = self.group(name)
+            summary[name] = {"hit": sum(x > 0 for x in bins.values()),
+                             "bins": len(labels),
+                             "holes": [k for k, v in bins.items() if v == 0]}
+        return summary
+
+    @property
+    def percentage(self) -> float:
+        return 100 * sum(x > 0 for x in self.hits) / TOTAL_BINS
+
+    def to_bytes(self) -> bytes:
+        tests = self.contributions()
+        hits = array("Q", self.hits)
+        if sys.byteorder == "big":
+            hits.byteswap()
+        parts = [DB_HEADER.pack(DB_MAGIC, DB_VERSION, DB_LAYOUT, TOTAL_BINS,
+                                self.samples, len(tests)),
+                 hits.tobytes()]
+        for name, mask in tests.items():
+            encoded = name.encode("utf-8")
+            parts += [DB_NAME.pack(len(encoded)), encoded, mask.to_bytes(DB_MASK_BYTES, "little")]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Hex8Coverage":
+        magic, version, layout, bins, samples, count = DB_HEADER.unpack_from(data)
+        if magic != DB_MAGIC or version != DB_VERSION:
+            raise Exception("Not a Hex8 coverage database (or an unsupported version)")
+        if layout != DB_LAYOUT or bins != TOTAL_BINS:
+            raise Exception("Coverage database was recorded with a different bin layout")
+        coverage = cls()
+        coverage.samples = samples
+        offset = DB_HEADER.size
+        coverage.hits = array("Q", data[offset:offset + 8 * TOTAL_BINS])
+        if sys.byteorder == "big":
+            coverage.hits.byteswap()
+        offset += 8 * TOTAL_BINS
+        for _ in range(count):
+            (length,) = DB_NAME.unpack_from(data, offset)
+            offset += DB_NAME.size
+            name = data[offset:offset + length].decode("utf-8")
+            offset += length
+            coverage.tests[name] = int.from_bytes(data[offset:offset + DB_MASK_BYTES], "little")
+            offset += DB_MASK_BYTES
+        return coverage
+
+    def save(self, path: Path) -> None:
+        Path(path).write_bytes(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: Path) -> "Hex8Coverage":
+        return cls.from_bytes(Path(path).read_bytes())
+
+    def rank(self) -> list[dict]:
+        tests = self.contributions()
+        # Find the bins that are hit by only a single test
+        seen = multiple = 0
+        for mask in tests.values():
+            multiple |= seen & mask
+            seen |= mask
+        once = seen & ~multiple
+        # Greedily order tests by the number of bins each adds beyond those
+        # already covered, those adding nothing are redundant
+        remaining = dict(tests)
+        covered = 0
+        ranking = []
+        while remaining:
+            name, mask = max(remaining.items(), key=lambda x: (x[1] & ~covered).bit_count())
+            if not (added := (mask & ~covered).bit_count()):
+                break
+            covered |= mask
+            del remaining[name]
+            ranking.append({"test": name,
+                            "added": added,
+                            "unique": (mask & once).bit_count(),
+                            "cumulative": 100 * covered.bit_count() / TOTAL_BINS})
+        return ranking + [{"test": x,
+                           "added": 0,
+                           "unique": 0,
+                           "cumulative": 100 * covered.bit_count() / TOTAL_BINS}
+                          for x in remaining]
+
+    def select(self, costs: dict[str, float] | None = None) -> list[str]:
+        # Choose a subset of tests hitting every bin that any test hits, greedily
+        # taking the test adding the most bins per unit cost (one by default),
+        # then dropping the most costly of any made redundant by later choices
+        tests = self.contributions()
+        costs = {x: max(costs.get(x, 1.0), 1E-9) if costs else 1.0 for x in tests}
+        target = covered = 0
+        for mask in tests.values():
+            target |= mask
+        remaining = dict(tests)
+        chosen = []
+        while covered != target:
+            name, mask = max(remaining.items(),
+                             key=lambda x: (x[1] & ~covered).bit_count() / costs[x[0]])
+            chosen.append(name)
+            covered |= mask
+            del remaining[name]
+        for name in sorted(chosen, key=lambda x: -costs[x]):
+            others = 0
+            for other in chosen:
+                others |= tests[other] if other != name else 0
+            if not tests[name] & ~others:
+                chosen.remove(name)
+        return chosen
@@ -0,0 +1,193 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections.abc import Iterable
+
+from .isa import Hex8Op, instruction
+from .state import Hex8State, Hex8MemoryOp
+
+
+# Decode tables indexed by opcode, mirroring the decode and operand muxing of
+# h8_core.v (see the corresponding sections of the RTL)
+OP_0_AREG = [x in (Hex8Op.LDAI, Hex8Op.LDBI, Hex8Op.STAI, Hex8Op.ADD, Hex8Op.SUB)
+             for x in range(16)]
+OP_0_PC = [x in (Hex8Op.LDAP, Hex8Op.BR, Hex8Op.BRZ, Hex8Op.BRN) for x in range(16)]
+OP_1_BREG = [x in (Hex8Op.BRB, Hex8Op.ADD, Hex8Op.SUB) for x in range(16)]
+DMEM_LD_A = [x in (Hex8Op.LDAM, Hex8Op.LDAI) for x in range(16)]
+DMEM_LD_B = [x in (Hex8Op.LDBM, Hex8Op.LDBI) for x in range(16)]
+DMEM_ST_A = [x in (Hex8Op.STAM, Hex8Op.STAI) for x in range(16)]
+AREG_RESULT = [x in (Hex8Op.LDAC, Hex8Op.LDAP, Hex8Op.ADD, Hex8Op.SUB) for x in range(16)]
+
+
+class Hex8CycleModel:
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        # Registers, named after their counterparts in h8_core.v
+        self.pc_fetch_q = 0
+        self.flush_q = 1
+        self.ld_a_pend_q = 0
+        self.ld_b_pend_q = 0
+        self.areg_q = 0
+        self.breg_q = 0
+        self.pfix_q = 0
+        # Performance counters (see gen_perf)
+        self.pfix_vld_q = 0
+        self.o_perf_retired = 0
+        self.o_perf_branches = 0
+        self.o_perf_flushed = 0
+        self.o_perf_loads = 0
+        self.o_perf_stores = 0
+        self.o_perf_prefixed = 0
+        # Settle the combinational logic with the inputs at zero
+        self.evaluate(0, 0)
+
+    def evaluate(self, i_imem_rsp_data: int, i_dmem_rsp_data: int) -> None:
+        # PC & qualifier
+        self.pc = pc = self.pc_fetch_q
+        self.valid = valid = not self.flush_q
+        # Operator/immediate separation
+        self.op = op = i_imem_rsp_data >> 4
+        self.imm_u4 = imm_u4 = i_imem_rsp_data & 0xF
+        imm_u8 = (self.pfix_q << 4) | imm_u4
+        # Capture memory read response
+        self.areg = areg = i_dmem_rsp_data if self.ld_a_pend_q else self.areg_q
+        self.breg = breg = i_dmem_rsp_data if self.ld_b_pend_q else self.breg_q
+        # Operand muxing
+        op_0 = areg if OP_0_AREG[op] else (pc if OP_0_PC[op] else 0)
+        op_1 = breg if OP_1_BREG[op] else imm_u8
+        # ALU
+        self.result = result = ((op_0 - op_1) if op == Hex8Op.SUB else (op_0 + op_1)) & 0xFF
+        # Load / store
+        self.dmem_ld_a = DMEM_LD_A[op]
+        self.dmem_ld_b = DMEM_LD_B[op]
+        self.dmem_st_a = DMEM_ST_A[op]
+        # Branching
+        self.take_branch = ((op == Hex8Op.BR) or
+                            (op == Hex8Op.BRZ and areg == 0) or
+                            (op == Hex8Op.BRN and (areg & 0x80) != 0) or
+                            (op == Hex8Op.BRB))
+        target_pc = breg if op == Hex8Op.BRB else result
+        # Outputs
+        self.o_imem_req_addr = pc
+        self.o_imem_req_valid = 1
+        self.o_dmem_req_addr = result
+        self.o_dmem_req_data = areg
+        self.o_dmem_req_write = int(self.dmem_st_a)
+        self.o_dmem_req_valid = int(valid and (self.dmem_ld_a or self.dmem_ld_b or self.dmem_st_a))
+        # Next state
+        self.pc_fetch_d = target_pc if self.take_branch else ((pc + 1) & 0xFF)
+        if valid and AREG_RESULT[op]:
+            self.areg_d = result
+        elif self.ld_a_pend_q:
+            self.areg_d = i_dmem_rsp_data
+        else:
+            self.areg_d = self.areg_q
+        if valid and op == Hex8Op.LDBC:
+            self.breg_d = result
+        elif self.ld_b_pend_q:
+            self.breg_d = i_dmem_rsp_data
+        else:
+            self.breg_d = self.breg_q
+        self.pfix_d = imm_u4 if op == Hex8Op.PFIX else 0
+
+    def tick(self) -> None:
+        # Rising clock edge, must follow a call to evaluate
+        if self.valid:
+            self.o_perf_retired += 1
+            self.o_perf_branches += self.take_branch
+            self.o_perf_loads += self.dmem_ld_a or self.dmem_ld_b
+            self.o_perf_stores += self.dmem_st_a
+            self.o_perf_prefixed += self.pfix_vld_q
+            self.pfix_vld_q = int(self.op == Hex8Op.PFIX)
+        self.o_perf_flushed += self.flush_q
+        self.pc_fetch_q = self.pc_fetch_d
+        self.flush_q = 0
+        self.ld_a_pend_q = int(self.dmem_ld_a)
+        self.ld_b_pend_q = int(self.dmem_ld_b)
+        self.areg_q = self.areg_d
+        self.breg_q = self.breg_d
+        self.pfix_q = self.pfix_d
+
+
+class Hex8CycleSystem:
+
+    def __init__(self,
+                 imem: Iterable[int] | None = None,
+                 dmem: Iterable[int] | None = None) -> None:
+        self.core = Hex8CycleModel()
+        # Short images are padded with zeroes to fill the 256 byte memories
+        self.imem = bytearray(bytes(imem or b"")[:256].ljust(256, b"\x00"))
+        self.dmem = bytearray(bytes(dmem or b"")[:256].ljust(256, b"\x00"))
+        self.reset()
+
+    def reset(self) -> None:
+        # NOTE: Unlike ram_1rw memory contents are retained through reset so
+        #       that a preloaded program survives, only the read data is cleared
+        self.core.reset()
+        self.imem_rsp_data = 0
+        self.dmem_rsp_data = 0
+        self.cycle = 0
+        # Address of the instruction returned by the instruction memory, this
+        # is implied by the pipeline in the RTL rather than being registered
+        self.exec_pc = 0
+        # Load awaiting its response from data memory
+        self.pending = None
+
+    def step(self) -> list[Hex8State]:
+        core = self.core
+        core.evaluate(self.imem_rsp_data, self.dmem_rsp_data)
+        commits = []
+        # A load that was in execute completes as its data is returned
+        if self.pending:
+            self.pending.areg = core.areg
+            self.pending.breg = core.breg
+            self.pending.data = self.dmem_rsp_data
+            commits.append(self.pending)
+            self.pending = None
+        # Track the instruction in execute
+        if core.valid:
+            state = Hex8State(timestamp=self.cycle,
+                              pc=self.exec_pc,
+                              op=instruction(self.imem_rsp_data),
+                              areg=core.areg_d,
+                              breg=core.breg_d)
+            if core.o_dmem_req_valid:
+                state.address = core.o_dmem_req_addr
+                if core.o_dmem_req_write:
+                    state.memory = Hex8MemoryOp.STORE
+                    state.data = core.o_dmem_req_data
+                else:
+                    state.memory = Hex8MemoryOp.LOAD
+                    self.pending = state
+            if state is not self.pending:
+                commits.append(state)
+        # Memories respond on the clock edge with a single cycle of latency
+        if core.o_dmem_req_valid:
+            if core.o_dmem_req_write:
+                self.dmem[core.o_dmem_req_addr] = core.o_dmem_req_data
+            else:
+                self.dmem_rsp_data = self.dmem[core.o_dmem_req_addr]
+        self.exec_pc = core.o_imem_req_addr
+        self.imem_rsp_data = self.imem[core.o_imem_req_addr]
+        core.tick()
+        self.cycle += 1
+        return commits
+
+    def run(self, cycles: int) -> Iterable[Hex8State]:
+        for _ in range(cycles):
+            yield from self.step()
+
@@ -0,0 +1,355 @@
+// Copyright 2024, Peter Birch, mailto:peter@intuity.io
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Direct Verilator harness for h8_core exposed as a CPython extension, with the
+// instruction and data memories held in arrays alongside the Verilated model.
+// Commits are traced in the same way as Hex8Tracer and returned in bulk as a
+// packed buffer, which Python accesses without copying via the buffer protocol.
+// When built with tracing, waves can be dumped over any window of cycles.
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include <cstdint>
+#include <cstring>
+#include <vector>
+
+#include "verilated.h"
+#include "Vh8_core.h"
+#include "Vh8_core___024root.h"
+#if VM_TRACE
+#include "verilated_vcd_c.h"
+#endif
+
+// NOTE: Must match COMMIT_FORMAT in direct.py
+#pragma pack(push, 1)
+struct Commit {
+    uint32_t cycle;
+    uint8_t  pc;
+    uint8_t  instr;
+    uint8_t  areg;
+    uint8_t  breg;
+    uint8_t  memory;
+    uint8_t  address;
+    uint8_t  data;
+    uint8_t  padding;
+};
+#pragma pack(pop)
+
+// NOTE: Must match Hex8MemoryOp
+enum MemoryOp : uint8_t { NOTHING = 1, LOAD = 2, STORE = 3 };
+
+// =============================================================================
+// Trace
+// =============================================================================
+
+typedef struct {
+    PyObject_HEAD
+    std::vector<Commit> * commits;
+} Trace;
+
+static void Trace_dealloc (Trace * self) {
+    delete self->commits;
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static int Trace_getbuffer (Trace * self, Py_buffer * view, int flags) {
+    return PyBuffer_FillInfo(
+        view, (PyObject *)self, self->commits->data(),
+        self->commits->size() * sizeof(Commit), 1, flags
+    );
+}
+
+static Py_ssize_t Trace_len (Trace * self) {
+    return self->commits->size();
+}
+
+static PyBufferProcs Trace_buffer = { (getbufferproc)Trace_getbuffer, NULL };
+
+static PySequenceMethods Trace_sequence = { (lenfunc)Trace_len };
+
+static PyTypeObject TraceType = {
+    .ob_base      = PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name      = "h8_direct.Trace",
+    .tp_basicsize = sizeof(Trace),
+    .tp_dealloc   = (destructor)Trace_dealloc,
+    .tp_as_sequence = &Trace_sequence,
+    .tp_as_buffer = &Trace_buffer,
+    .tp_flags     = Py_TPFLAGS_DEFAULT,
+    .tp_doc       = "Packed commit records captured by Harness.run",
+};
+
+// =============================================================================
+// Harness
+// =============================================================================
+
+typedef struct {
+    PyObject_HEAD
+    VerilatedContext * context;
+    Vh8_core         * core;
+    uint8_t            imem[256];
+    uint8_t            dmem[256];
+    uint8_t            imem_rsp;
+    uint8_t            dmem_rsp;
+    uint32_t           cycle;
+    // Pipeline tracking (mirrors Hex8Tracer)
+    bool               fetch_valid;
+    uint8_t            fetch_pc;
+    uint32_t           fetch_cycle;
+    bool               exec_valid;
+    Commit             exec;
+#if VM_TRACE
+    VerilatedVcdC    * waves;
+#endif
+} Harness;
+
+// Waves are timestamped with two steps per cycle, so that times correspond
+// directly to cycle numbers
+static void Harness_dump (Harness * self, uint64_t time) {
+#if VM_TRACE
+    if (self->waves) self->waves->dump(time);
+#endif
+}
+
+static void Harness_clock (Harness * self) {
+    self->core->i_clk = 1;
+    self->core->eval();
+    Harness_dump(self, 2 * (uint64_t)self->cycle + 1);
+    self->core->i_clk = 0;
+    self->core->eval();
+}
+
+static void Harness_do_reset (Harness * self) {
+    self->core->i_imem_rsp_data = 0;
+    self->core->i_dmem_rsp_data = 0;
+    self->core->i_rst = 1;
+    Harness_clock(self);
+    self->core->i_rst = 0;
+    self->core->eval();
+    self->imem_rsp    = 0;
+    self->dmem_rsp    = 0;
+    self->cycle       = 0;
+    self->fetch_valid = false;
+    self->exec_valid  = false;
+}
+
+static int Harness_init (Harness * self, PyObject * args, PyObject * kwds) {
+    static const char * kwlist[] = { "imem", "dmem", NULL };
+    Py_buffer imem, dmem;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "y*y*", (char **)kwlist, &imem, &dmem))
+        return -1;
+    if (imem.len != 256 || dmem.len != 256) {
+        PyBuffer_Release(&imem);
+        PyBuffer_Release(&dmem);
+        PyErr_SetString(PyExc_ValueError, "Memory images must be 256 bytes");
+        return -1;
+    }
+    memcpy(self->imem, imem.buf, 256);
+    memcpy(self->dmem, dmem.buf, 256);
+    PyBuffer_Release(&imem);
+    PyBuffer_Release(&dmem);
+    if (!self->core) {
+        self->context = new VerilatedContext;
+#if VM_TRACE
+        self->context->traceEverOn(true);
+#endif
+        self->core    = new Vh8_core(self->context);
+    }
+    Harness_do_reset(self);
+    return 0;
+}
+
+static void Harness_close_waves (Harness * self) {
+#if VM_TRACE
+    if (self->waves) {
+        self->waves->close();
+        delete self->waves;
+        self->waves = NULL;
+    }
+#endif
+}
+
+static void Harness_dealloc (Harness * self) {
+    Harness_close_waves(self);
+    if (self->core) {
+        self->core->final();
+        delete self->core;
+        delete self->context;
+    }
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static void Harness_step (Harness * self, std::vector<Commit> & commits) {
+    Vh8_core * core = self->core;
+    auto     * root = core->rootp;
+    // Present the memory responses and settle the design
+    core->i_imem_rsp_data = self->imem_rsp;
+    core->i_dmem_rsp_data = self->dmem_rsp;
+    core->eval();
+    Harness_dump(self, 2 * (uint64_t)self->cycle);
+    // A load that was in execute commits as its data is returned
+    if (self->exec_valid) {
+        self->exec.areg = root->h8_core__DOT__areg;
+        self->exec.breg = root->h8_core__DOT__breg;
+        self->exec.data = self->dmem_rsp;
+        commits.push_back(self->exec);
+        self->exec_valid = false;
+    }
+    // A fetched instruction is now executing (unless flushed)
+    if (self->fetch_valid && !root->h8_core__DOT__flush_q) {
+        Commit commit = {
+            self->fetch_cycle, self->fetch_pc, self->imem_rsp,
+            root->h8_core__DOT__areg_d, root->h8_core__DOT__breg_d,
+            NOTHING, 0, 0, 0
+        };
+        if (core->o_dmem_req_valid) {
+            commit.address = core->o_dmem_req_addr;
+            if (core->o_dmem_req_write) {
+                commit.memory = STORE;
+                commit.data   = core->o_dmem_req_data;
+            } else {
+                commit.memory    = LOAD;
+                self->exec       = commit;
+                self->exec_valid = true;
+            }
+        }
+        if (commit.memory != LOAD) commits.push_back(commit);
+    }
+    // Track the fetch
+    self->fetch_valid = core->o_imem_req_valid;
+    self->fetch_pc    = core->o_imem_req_addr;
+    self->fetch_cycle = self->cycle;
+    // Memories respond on the clock edge with a single cycle of latency
+    if (core->o_imem_req_valid) self->imem_rsp = self->imem[core->o_imem_req_addr];
+    if (core->o_dmem_req_valid) {
+        if (core->o_dmem_req_write) self->dmem[core->o_dmem_req_addr] = core->o_dmem_req_data;
+        else                        self->dmem_rsp = self->dmem[core->o_dmem_req_addr];
+    }
+    Harness_clock(self);
+    self->cycle++;
+}
+
+static PyObject * Harness_run (Harness * self, PyObject * args) {
+    unsigned long cycles;
+    if (!PyArg_ParseTuple(args, "k", &cycles)) return NULL;
+    Trace * trace = PyObject_New(Trace, &TraceType);
+    if (!trace) return NULL;
+    trace->commits = new std::vector<Commit>;
+    trace->commits->reserve(cycles);
+    Py_BEGIN_ALLOW_THREADS
+    for (unsigned long idx = 0; idx < cycles; idx++) Harness_step(self, *trace->commits);
+    Py_END_ALLOW_THREADS
+    return (PyObject *)trace;
+}
+
+static PyObject * Harness_reset (Harness * self, PyObject * Py_UNUSED(args)) {
+    Harness_do_reset(self);
+    Py_RETURN_NONE;
+}
+
+static PyObject * Harness_open_waves (Harness * self, PyObject * args) {
+#if VM_TRACE
+    const char * path;
+    if (!PyArg_ParseTuple(args, "s", &path)) return NULL;
+    Harness_close_waves(self);
+    self->waves = new VerilatedVcdC;
+    self->core->trace(self->waves, 99);
+    self->waves->open(path);
+    if (!self->waves->isOpen()) {
+        Harness_close_waves(self);
+        return PyErr_Format(PyExc_OSError, "Failed to open waves file %s", path);
+    }
+    Py_RETURN_NONE;
+#else
+    PyErr_SetString(PyExc_RuntimeError, "Harness was built without tracing");
+    return NULL;
+#endif
+}
+
+static PyObject * Harness_close_waves_method (Harness * self, PyObject * Py_UNUSED(args)) {
+    Harness_close_waves(self);
+    Py_RETURN_NONE;
+}
+
+static PyObject * Harness_get_dmem (Harness * self, void * Py_UNUSED(closure)) {
+    return PyBytes_FromStringAndSize((const char *)self->dmem, 256);
+}
+
+static PyObject * Harness_get_cycle (Harness * self, void * Py_UNUSED(closure)) {
+    return PyLong_FromUnsignedLong(self->cycle);
+}
+
+static PyObject * Harness_get_counters (Harness * self, void * Py_UNUSED(closure)) {
+    return Py_BuildValue(
+        "{s:k,s:k,s:k,s:k,s:k,s:k}",
+        "retired",  (unsigned long)self->core->o_perf_retired,
+        "branches", (unsigned long)self->core->o_perf_branches,
+        "flushed",  (unsigned long)self->core->o_perf_flushed,
+        "loads",    (unsigned long)self->core->o_perf_loads,
+        "stores",   (unsigned long)self->core->o_perf_stores,
+        "prefixed", (unsigned long)self->core->o_perf_prefixed
+    );
+}
+
+static PyMethodDef Harness_methods[] = {
+    { "run",         (PyCFunction)Harness_run,                METH_VARARGS, "Run for a number of cycles, returning the commit trace" },
+    { "reset",       (PyCFunction)Harness_reset,              METH_NOARGS,  "Reset the core, retaining memory contents" },
+    { "open_waves",  (PyCFunction)Harness_open_waves,         METH_VARARGS, "Start dumping waves to a VCD file" },
+    { "close_waves", (PyCFunction)Harness_close_waves_method, METH_NOARGS,  "Stop dumping waves" },
+    { NULL }
+};
+
+static PyGetSetDef Harness_getset[] = {
+    { "dmem",     (getter)Harness_get_dmem,     NULL, "Copy of the data memory",    NULL },
+    { "cycle",    (getter)Harness_get_cycle,    NULL, "Cycles run since reset",     NULL },
+    { "counters", (getter)Harness_get_counters, NULL, "Performance counter values", NULL },
+    { NULL }
+};
+
+static PyTypeObject HarnessType = {
+    .ob_base      = PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name      = "h8_direct.Harness",
+    .tp_basicsize = sizeof(Harness),
+    .tp_dealloc   = (destructor)Harness_dealloc,
+    .tp_flags     = Py_TPFLAGS_DEFAULT,
+    .tp_doc       = "Verilated h8_core with attached instruction and data memories",
+    .tp_methods   = Harness_methods,
+    .tp_getset    = Harness_getset,
+    .tp_init      = (initproc)Harness_init,
+    .tp_new       = PyType_GenericNew,
+};
+
+// =============================================================================
+// Module
+// =============================================================================
+
+static PyModuleDef h8_direct_module = {
+    .m_base = PyModuleDef_HEAD_INIT,
+    .m_name = "h8_direct",
+    .m_doc  = "Direct Verilator harness for h8_core",
+    .m_size = -1,
+};
+
+PyMODINIT_FUNC PyInit_h8_direct (void) {
+    if (PyType_Ready(&TraceType) < 0 || PyType_Ready(&HarnessType) < 0) return NULL;
+    PyObject * module = PyModule_Create(&h8_direct_module);
+    if (!module) return NULL;
+    Py_INCREF(&TraceType);
+    Py_INCREF(&HarnessType);
+    PyModule_AddObject(module, "Trace", (PyObject *)&TraceType);
+    PyModule_AddObject(module, "Harness", (PyObject *)&HarnessType);
+    PyModule_AddIntConstant(module, "COMMIT_SIZE", sizeof(Commit));
+    PyModule_AddIntConstant(module, "WAVES", VM_TRACE);
+    return module;
+}
@@ -0,0 +1,168 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import importlib.util
+import os
+import shutil
+import struct
+import subprocess
+import sysconfig
+from collections.abc import Iterable
+from pathlib import Path
+from types import ModuleType
+
+from .isa import instruction
+from .state import Hex8MemoryOp, Hex8State
+
+# NOTE: Must match the Commit structure in direct.cpp
+COMMIT_FORMAT = struct.Struct("<I7Bx")
+
+HARNESS = Path(__file__).with_suffix(".cpp")
+RTL = Path(__file__).parents[4] / "design" / "rtl" / "h8_core.v"
+BUILD_ROOT = Path(os.environ.get("HEX8_DIRECT_BUILD", Path.home() / ".cache" / "hex8" / "direct"))
+VERILATOR = os.environ.get("VERILATOR", "verilator")
+
+
+def build(build_root: Path = BUILD_ROOT,
+          waves: bool = False,
+          force: bool = False,
+          rtl: Path = RTL) -> Path:
+    # Builds are keyed by the content of the RTL and harness, so a stale
+    # extension is never picked up and concurrent checkouts do not collide.
+    # Tracing is only compiled into a separate variant, so that runs which do
+    # not dump waves do not pay for it
+    digest = hashlib.sha256()
+    for path in (rtl, HARNESS):
+        digest.update(path.read_bytes())
+    build_dir = build_root / (digest.hexdigest()[:16] + ("_waves" if waves else ""))
+    library = build_dir / f"h8_direct{sysconfig.get_config_var('EXT_SUFFIX')}"
+    if library.exists() and not force:
+        return library
+    # Build into a scratch directory and move into place once complete
+    scratch = build_dir.with_name(f"{build_dir.name}.{os.getpid()}")
+    shutil.rmtree(scratch, ignore_errors=True)
+    scratch.mkdir(parents=True)
+    subprocess.run([VERILATOR,
+                    "--cc", "--build", "--exe", "-j", "0", "-O3",
+                    "--public-flat-rw", "-Wno-fatal",
+                    *(["--trace"] if waves else []),
+                    "--top-module", "h8_core",
+                    "-GPERF_COUNTERS=1",
+                    "--Mdir", str(scratch),
+                    "-CFLAGS", f"-fPIC -O2 -I{sysconfig.get_path('include')}",
+                    "-LDFLAGS", "-shared",
+                    "-o", library.name,
+                    str(rtl),
+                    str(HARNESS)],
+                   check=True,
+                   stdout=subprocess.DEVNULL)
+    # Never delete a build in place, as another process may be loading it
+    try:
+        scratch.rename(build_dir)
+    except OSError:
+        if library.exists() and not force:
+            # Another process won the race, use its build
+            shutil.rmtree(scratch, ignore_errors=True)
+            return library
+        # A forced (or incomplete) build is moved aside before being replaced
+        stale = build_dir.with_name(f"{build_dir.name}.{os.getpid()}.stale")
+        build_dir.rename(stale)
+        scratch.rename(build_dir)
+        shutil.rmtree(stale, ignore_errors=True)
+    return library
+
+
+def load(build_root: Path = BUILD_ROOT, waves: bool = False, rtl: Path = RTL) -> ModuleType:
+    library = build(build_root, waves, rtl=rtl)
+    spec = importlib.util.spec_from_file_location("h8_direct", library)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert module.COMMIT_SIZE == COMMIT_FORMAT.size
+    return module
+
+
+class Hex8DirectSystem:
+
+    # Extension modules are loaded (and built if required) on first use, keyed
+    # by the RTL they were built from and whether they support dumping waves
+    MODULES: dict[tuple[Path, bool], ModuleType] = {}
+
+    def __init__(self,
+                 imem: Iterable[int] | None = None,
+                 dmem: Iterable[int] | None = None,
+                 waves: bool = False,
+                 rtl: Path = RTL) -> None:
+        if (key := (rtl, waves)) not in Hex8DirectSystem.MODULES:
+            Hex8DirectSystem.MODULES[key] = load(waves=waves, rtl=rtl)
+        self.harness = Hex8DirectSystem.MODULES[key].Harness(bytes(imem or bytes(256)),
+                                                             bytes(dmem or bytes(256)))
+
+    @property
+    def cycle(self) -> int:
+        return self.harness.cycle
+
+    @property
+    def dmem(self) -> bytes:
+        return self.harness.dmem
+
+    @property
+    def counters(self) -> dict[str, int]:
+        return self.harness.counters
+
+    def reset(self) -> None:
+        self.harness.reset()
+
+    def trace(self, cycles: int) -> memoryview:
+        return memoryview(self.harness.run(cycles))
+
+    def run(self, cycles: int) -> Iterable[Hex8State]:
+        for cycle, pc, instr, areg, breg, memory, address, data in \
+                COMMIT_FORMAT.iter_unpack(self.trace(cycles)):
+            yield Hex8State(timestamp=cycle,
+                            pc=pc,
+                            op=instruction(instr),
+                            areg=areg,
+                            breg=breg,
+                            memory=Hex8MemoryOp(memory),
+                            address=address,
+                            data=data)
+
+    def open_waves(self, path: Path) -> None:
+        self.harness.open_waves(str(path))
+
+    def close_waves(self) -> None:
+        self.harness.close_waves()
+
+
+def commit_cycle(imem: bytes, dmem: bytes, index: int, cycles: int) -> int | None:
+    # Find the cycle in which the given commit was fetched, this allows a
+    # trigger expressed in commits (which every engine agrees on) to be mapped
+    # onto the RTL's timeline
+    trace = Hex8DirectSystem(imem, dmem).trace(cycles)
+    if index >= len(trace) // COMMIT_FORMAT.size:
+        return None
+    return COMMIT_FORMAT.unpack_from(trace, index * COMMIT_FORMAT.size)[0]
+
+
+def capture_waves(imem: bytes, dmem: bytes, path: Path, start: int, end: int) -> Path:
+    # The program is deterministic from reset, so rather than dumping the whole
+    # run it is replayed at full speed up to the start of the window and waves
+    # are only dumped from there
+    system = Hex8DirectSystem(imem, dmem, waves=True)
+    system.trace(max(0, start))
+    system.open_waves(path)
+    system.trace(max(0, end - max(0, start)))
+    system.close_waves()
+    return path
@@ -0,0 +1,160 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+from itertools import chain
+from pathlib import Path
+from random import Random
+
+from .coverage import TOTAL_BINS, Hex8Coverage
+from .isa import Hex8Op, encode
+from .model import Hex8Model
+
+# AFL-style buckets of hit counts, so that a bin being hit noticeably more
+# often than before also counts as new behaviour
+BUCKETS = (1, 2, 3, 4, 8, 16, 32, 128)
+BUCKET_INDEX = [max(i for i, y in enumerate(BUCKETS) if y <= x) if x else -1
+                for x in range(BUCKETS[-1] + 1)]
+# Opcodes executed back to back are tracked alongside the functional coverage
+PAIRS = len(Hex8Op) * len(Hex8Op)
+FEATURES = (TOTAL_BINS + PAIRS) * len(BUCKETS)
+
+# Entries hold the instruction memory image followed by the data memory image
+ENTRY_SIZE = 512
+
+
+def features(data: bytes, steps: int) -> int:
+    # Run an entry on the model (with the RTL's semantics, so that features
+    # match those the testbench will cover) returning the bitset of features
+    # hit (each being a bin or opcode pair along with the bucket of its count)
+    model = Hex8Model(rtl=True)
+    model.load(data[:256], data[256:])
+    cover = Hex8Coverage()
+    pairs = [0] * PAIRS
+    last = None
+    for _ in range(steps):
+        state = model.step()
+        cover.sample(state)
+        op = int(state.op.op)
+        if last is not None:
+            pairs[last * len(Hex8Op) + op] += 1
+        last = op
+    mask = 0
+    for idx, count in enumerate(chain(cover.hits, pairs)):
+        if count:
+            mask |= 1 << (idx * len(BUCKETS) + BUCKET_INDEX[min(count, BUCKETS[-1])])
+    return mask
+
+
+def mutate(random: Random, data: bytes, other: bytes) -> bytes:
+    # Apply a stack of AFL-style havoc mutations, mostly to instruction memory
+    data = bytearray(data)
+    if random.random() < 0.1:
+        # Splice the instructions of another entry onto the tail of this one
+        split = random.randrange(256)
+        data[split:256] = other[split:256]
+    for _ in range(1 << random.randrange(5)):
+        base, size = (0, 256) if random.random() < 0.75 else (256, 256)
+        pos = base + random.randrange(size)
+        match random.randrange(7):
+            case 0:
+                data[pos] ^= 1 << random.randrange(8)
+            case 1:
+                data[pos] = random.randrange(256)
+            case 2:
+                data[pos] = encode(random.choice(list(Hex8Op)), random.randrange(16))
+            case 3:
+                data[pos] = (data[pos] + random.randint(-16, 16)) & 0xFF
+            case 4:
+                # Copy a block within the same memory
+                length = random.randint(2, 16)
+                src = base + random.randrange(size - length)
+                dst = base + random.randrange(size - length)
+                data[dst:dst + length] = data[src:src + length]
+            case 5:
+                # Insert a byte, shifting everything after it along
+                data[pos:base + size] = bytes([random.randrange(256)]) + data[pos:base + size - 1]
+            case 6:
+                # Delete a byte, shifting everything after it back
+                data[pos:base + size] = data[pos + 1:base + size] + b"\x00"
+    return bytes(data)
+
+
+def explore(seed: int, parents: list[tuple[str, bytes]], covered: int, count: int,
+            steps: int) -> tuple[int, list[tuple[bytes, int, str]]]:
+    # Mutate and run a batch of entries, returning those that hit features not
+    # already covered. Features found earlier in the batch count as covered, so
+    # that near-identical entries are not all returned.
+    random = Random(seed)
+    found = []
+    for _ in range(count):
+        name, parent = random.choice(parents)
+        data = mutate(random, parent, random.choice(parents)[1])
+        if (mask := features(data, steps)) & ~covered:
+            covered |= mask
+            found.append((data, mask, name))
+    return count, found
+
+
+class Hex8Corpus:
+
+    # NOTE: Entries are kept on disk, each as an image and a JSON file of its
+    #       metadata (including its features, so that reloading does not rerun
+    #       the corpus), along with statistics accumulated across every run
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.entries: dict[str, dict] = {}
+        self.images: dict[str, bytes] = {}
+        self.covered = 0
+        for meta_path in sorted(self.path.glob("*.json")):
+            if meta_path.stem == "stats":
+                continue
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            self.entries[meta_path.stem] = meta
+            self.images[meta_path.stem] = meta_path.with_suffix(".bin").read_bytes()
+            self.covered |= int(meta["features"], 16)
+        stats_path = self.path / "stats.json"
+        self.stats = (json.loads(stats_path.read_text(encoding="utf-8"))
+                      if stats_path.exists() else {"runs": 0, "execs": 0, "seconds": 0.0})
+
+    def add(self, data: bytes, mask: int, parent: str | None = None) -> str | None:
+        # Entries are only kept if they hit a feature nothing else has
+        if not mask & ~self.covered:
+            return None
+        self.covered |= mask
+        name = hashlib.sha1(data).hexdigest()[:16]
+        self.images[name] = data
+        self.entries[name] = {"features": f"{mask:x}",
+                              "parent": parent,
+                              "found": self.stats["execs"]}
+        (self.path / f"{name}.bin").write_bytes(data)
+        self.update(name)
+        return name
+
+    def update(self, name: str, **meta) -> None:
+        self.entries[name].update(meta)
+        (self.path / f"{name}.json").write_text(json.dumps(self.entries[name], indent=4),
+                                                encoding="utf-8")
+
+    def save(self) -> None:
+        (self.path / "stats.json").write_text(json.dumps(self.stats, indent=4), encoding="utf-8")
+
+    @property
+    def bins(self) -> int:
+        # Functional coverage bins hit by any entry, regardless of count
+        return sum(((self.covered >> (x * len(BUCKETS))) & ((1 << len(BUCKETS)) - 1)) != 0
+                   for x in range(TOTAL_BINS))
@@ -0,0 +1,61 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+from enum import IntEnum
+
+
+# NOTE: Plain integer encodings matching h8_pkg.Opcode, these are used where an
+#       instruction stream is decoded in bulk and unpacking each byte through
+#       packtype would dominate the runtime
+class Hex8Op(IntEnum):
+    LDAM = 0b0000
+    LDBM = 0b0001
+    STAM = 0b0010
+    LDAC = 0b0011
+    LDBC = 0b0100
+    LDAP = 0b0101
+    LDAI = 0b0110
+    LDBI = 0b0111
+    STAI = 0b1000
+    BR   = 0b1001
+    BRZ  = 0b1010
+    BRN  = 0b1011
+    BRB  = 0b1100
+    ADD  = 0b1101
+    SUB  = 0b1110
+    PFIX = 0b1111
+
+
+def encode(op: Hex8Op, imm_u4: int = 0) -> int:
+    return (int(op) << 4) | (imm_u4 & 0xF)
+
+
+def decode(data: int) -> tuple[Hex8Op, int]:
+    return Hex8Op(data >> 4), data & 0xF
+
+
+def disassemble(data: int) -> str:
+    op, imm = decode(data)
+    return f"{op.name:<4s} 0x{imm:X}"
+
+
+@functools.cache
+def instruction(data: int) -> "Instruction":  # noqa: F821
+    # NOTE: Unpacking through packtype is slow and there are only 256 possible
+    #       encodings, so each is unpacked once and then shared. The returned
+    #       object must therefore be treated as immutable. Importing h8_pkg is
+    #       also deferred until an instruction is first unpacked.
+    from h8_pkg import Instruction
+    return Instruction._pt_unpack(data)
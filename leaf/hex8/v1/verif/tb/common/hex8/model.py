@@ -12,32 +12,51 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from h8_pkg import Opcode, Instruction
+from collections.abc import Iterable
 
+from h8_pkg import Opcode
+
+from .isa import instruction
 from .state import Hex8State, Hex8MemoryOp
 
 
 class Hex8Model:
 
-    def __init__(self) -> None:
+    # NOTE: By default the model follows the ISA, whereas with 'rtl' set it
+    #       follows h8_core as built: the instruction after a taken branch (the
+    #       delay slot) is executed, LDAP and relative branches add to the
+    #       address being fetched (one past the instruction, or the target of a
+    #       branch ahead of it), LDBI and STAI are indexed by A, and the PC wraps
+
+    def __init__(self, rtl: bool = False) -> None:
+        self.rtl = rtl
         self.reset()
 
     def reset(self) -> None:
         self.pc = 0
+        # Address being fetched while the instruction at 'pc' executes
+        self.fetch = 1
         self.areg = 0
         self.breg = 0
         self.pfix = 0
         self.imem = {}
         self.dmem = {}
+        self.steps = 0
+
+    def load(self, imem: Iterable[int], dmem: Iterable[int]) -> None:
+        self.imem = dict(enumerate(imem))
+        self.dmem = dict(enumerate(dmem))
 
     def step(self) -> Hex8State:
         # Get instruction from memory
-        op = Instruction._pt_unpack(self.imem.get(self.pc, 0))
+        op = instruction(self.imem.get(self.pc, 0))
         # Determine the fully prefixed constant
         oreg = (self.pfix << 4) | op.imm_u4
         self.pfix = 0
         # Execute
-        next_pc = self.pc + 1
+        base = self.fetch if self.rtl else self.pc
+        index = self.areg if self.rtl else self.breg
+        target = None
         mem_op = Hex8MemoryOp.NOTHING
         address = 0
         data = 0
@@ -68,39 +87,39 @@ class Hex8Model:
                 self.breg = oreg
             # Load PC into A adding the immediate
             case Opcode.LDAP:
-                self.areg = (self.pc + oreg) & 0xFF
+                self.areg = (base + oreg) & 0xFF
             # Load A from memory based on address in A plus immediate offset
             case Opcode.LDAI:
-                self.areg = self.dmem.get((self.areg + oreg) & 0xFF, 0)
+                address = (self.areg + oreg) & 0xFF
+                self.areg = self.dmem.get(address, 0)
                 mem_op = Hex8MemoryOp.LOAD
-                address = oreg
                 data = self.areg
             # Load B from memory based on address in B plus immediate offset
             case Opcode.LDBI:
-                self.breg = self.dmem.get((self.breg + oreg) & 0xFF, 0)
+                address = (index + oreg) & 0xFF
+                self.breg = self.dmem.get(address, 0)
                 mem_op = Hex8MemoryOp.LOAD
-                address = oreg
                 data = self.breg
             # Store A to memory at address held in B plus immediate offset
             case Opcode.STAI:
-                self.dmem[(self.breg + oreg) & 0xFF] = self.areg
+                address = (index + oreg) & 0xFF
+                self.dmem[address] = self.areg
                 mem_op = Hex8MemoryOp.STORE
-                address = oreg
                 data = self.areg
             # Branch unconditionally
             case Opcode.BR:
-                next_pc = (self.pc + oreg) & 0xFF
+                target = (base + oreg) & 0xFF
             # Branch if A is 0
             case Opcode.BRZ:
                 if self.areg == 0:
-                    next_pc = (self.pc + oreg) & 0xFF
+                    target = (base + oreg) & 0xFF
             # Branch if A is less than 0 (i.e. MSB set)
             case Opcode.BRN:
                 if self.areg & 0x80:
-                    next_pc = (self.pc + oreg) & 0xFF
+                    target = (base + oreg) & 0xFF
             # Branch unconditonally to address held in B
             case Opcode.BRB:
-                next_pc = self.breg
+                target = self.breg
             # Add A and B and store into A
             case Opcode.ADD:
                 self.areg = (self.areg + self.breg) & 0xFF
@@ -110,8 +129,10 @@ class Hex8Model:
             # Store a prefix
             case Opcode.PFIX:
                 self.pfix = op.imm_u4
-        # Create state object
-        state = Hex8State(pc=self.pc,
+        # Create state object (timestamped by the instruction count, so that the
+        # model can be stepped outside of a simulator)
+        state = Hex8State(timestamp=self.steps,
+                          pc=self.pc,
                           op=op,
                           areg=self.areg,
                           breg=self.breg,
@@ -119,6 +140,10 @@ class Hex8Model:
                           address=address,
                           data=data)
         # Update PC
-        self.pc = next_pc
+        if self.rtl:
+            self.pc, self.fetch = self.fetch, ((self.fetch + 1) & 0xFF) if target is None else target
+        else:
+            self.pc = (self.pc + 1) if target is None else target
+        self.steps += 1
         # Generate state object
         return state
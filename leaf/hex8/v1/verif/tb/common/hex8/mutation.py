@@ -0,0 +1,171 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import re
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from random import Random
+
+from .cycle import Hex8CycleSystem
+from .direct import BUILD_ROOT, COMMIT_FORMAT, RTL, Hex8DirectSystem, build
+from .workloads import WORKLOADS, load
+
+
+def _flip(match: re.Match) -> str:
+    # Flip the least significant bit of a sized decimal or binary constant
+    width, base, digits = match.groups()
+    if base == "b":
+        return f"{width}'b{int(digits, 2) ^ 1:0{len(digits)}b}"
+    return f"{width}'d{int(digits) ^ 1}"
+
+
+def _select(match: re.Match) -> str:
+    # Select a neighbouring bit
+    index = int(match.group(1))
+    return f"[{index - 1 if index else index + 1}]"
+
+
+# Mutation rules, each a kind, a pattern, and either a replacement string or a
+# function producing one from the match
+RULES = (
+    ("operator", r"==", "!="),
+    ("operator", r"!=", "=="),
+    ("operator", r"&&", "||"),
+    ("operator", r"\|\|", "&&"),
+    ("operator", r"(?<= )\+(?= )", "-"),
+    ("operator", r"(?<= )-(?= )", "+"),
+    ("operator", r"\|\{", "&{"),
+    ("constant", r"\b(\d+)'(d|b)([0-9]+)\b", _flip),
+    ("constant", r"(?<!\d)'d0\b", "'d1"),
+    ("constant", r"\[(\d+)\]", _select),
+    ("condition", r"!(?=\w)", ""),
+    ("condition", r"\b(is_\w+|valid|take_branch|ld_[ab]_pend_q)\b(?!\s*=[^=])", r"!\1"),
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class Hex8Mutant:
+    kind: str
+    line: int
+    column: int
+    original: str
+    replacement: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.line}:{self.column}:{self.original}->{self.replacement}"
+
+    def apply(self, source: str) -> str:
+        lines = source.splitlines(keepends=True)
+        text = lines[self.line - 1]
+        end = self.column + len(self.original)
+        assert text[self.column:end] == self.original, "Mutant does not match the source"
+        lines[self.line - 1] = text[:self.column] + self.replacement + text[end:]
+        return "".join(lines)
+
+
+def mutants(source: str) -> list[Hex8Mutant]:
+    # Mutate the right hand side of continuous assignments in the core's
+    # datapath and control, stopping at the performance counters (which only
+    # drive the debug outputs)
+    found = []
+    in_assign = False
+    for number, line in enumerate(source.splitlines(), start=1):
+        if line.startswith("generate"):
+            break
+        code = line.split("//")[0]
+        start = 0
+        if code.startswith("assign"):
+            in_assign = True
+            start = code.index("=") + 1
+        if not in_assign:
+            continue
+        for kind, pattern, replacement in RULES:
+            for match in re.compile(pattern).finditer(code, start):
+                mutated = match.expand(replacement) if isinstance(replacement, str) \
+                          else replacement(match)
+                found.append(Hex8Mutant(kind=kind,
+                                        line=number,
+                                        column=match.start(),
+                                        original=match.group(0),
+                                        replacement=mutated))
+        in_assign = ";" not in code
+    return sorted(found, key=lambda x: (x.line, x.column))
+
+
+def suite(seeds: int) -> list[str]:
+    # Tests that run in the direct harness: every benchmark workload checked
+    # against the golden model, and random programs checked commit by commit
+    # against the cycle model (which mirrors the RTL's timing)
+    return [f"workload:{x}" for x in WORKLOADS] + [f"random:{x}" for x in range(seeds)]
+
+
+def run_test(name: str, rtl: Path, cycles: int) -> str | None:
+    # Run a single test against a build of the given RTL, returning a description
+    # of the first failure (or None if it passed)
+    kind, arg = name.split(":")
+    if kind == "workload":
+        workload = load(arg)
+        reference = workload.reference
+        system = Hex8DirectSystem(workload.imem, workload.dmem, rtl=rtl)
+        limit = 4 * max(workload.cycles, reference["steps"])
+        while system.cycle < limit:
+            if any(x[1] == workload.halt for x in COMMIT_FORMAT.iter_unpack(system.trace(1024))):
+                break
+        else:
+            return "did not reach the halt"
+        if wrong := [x for x, y in enumerate(reference["dmem"]) if system.dmem[x] != y]:
+            return f"data memory differs at 0x{wrong[0]:02X}"
+        return None
+    random = Random(int(arg))
+    imem, dmem = random.randbytes(256), random.randbytes(256)
+    # NOTE: The harness stamps commits with their fetch cycle, whereas the cycle
+    #       model stamps the cycle in which they execute
+    actual = list(Hex8DirectSystem(imem, dmem, rtl=rtl).run(cycles))
+    expected = list(Hex8CycleSystem(imem, dmem).run(cycles))
+    for index, (got, exp) in enumerate(zip(actual, expected)):
+        fields = ("pc", "areg", "breg", "memory", "address", "data")
+        if got.timestamp + 1 != exp.timestamp or \
+                any(getattr(got, x) != getattr(exp, x) for x in fields):
+            return f"commit {index} differs at PC 0x{exp.pc:02X}"
+    if len(actual) != len(expected):
+        return f"{len(actual)} commits, expected {len(expected)}"
+    return None
+
+
+def evaluate(mutant: Hex8Mutant | None, order: list[str], cycles: int,
+             build_root: Path = BUILD_ROOT) -> dict:
+    # Build a mutant (or the original design, if None) and run tests in order
+    # until the first failure
+    result = {"mutant": asdict(mutant) if mutant else None, "status": "survived",
+              "test": None, "error": None, "tests": 0}
+    rtl = RTL
+    if mutant is not None:
+        source = mutant.apply(RTL.read_text(encoding="utf-8"))
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+        rtl = build_root / "mutants" / f"h8_core_{digest}.v"
+        rtl.parent.mkdir(parents=True, exist_ok=True)
+        rtl.write_text(source, encoding="utf-8")
+        try:
+            build(build_root, rtl=rtl)
+        except Exception as e:
+            # Mutants that do not compile are stillborn, and excluded from the
+            # score
+            return {**result, "status": "stillborn", "error": str(e)}
+    for test in order:
+        result["tests"] += 1
+        if error := run_test(test, rtl, cycles):
+            return {**result, "status": "killed", "test": test, "error": error}
+    return result
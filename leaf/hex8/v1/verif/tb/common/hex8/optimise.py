@@ -0,0 +1,163 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import Counter
+
+from .asm import Hex8Assembler, Item
+from .isa import Hex8Op
+from .model import Hex8Model
+
+# Operations after which the next instruction is never reached by falling
+# through (other than the NOP executed in the shadow of the branch)
+UNCONDITIONAL = frozenset((Hex8Op.BR, Hex8Op.BRB))
+
+
+def reuse(items: list[Item]) -> list[Item]:
+    # Remove loads of values already held in A or B. What each register is
+    # known to hold is tracked as a set of facts, either ("const", value),
+    # ("mem", address) or ("addr", label), which are discarded at labels as
+    # other paths may join there.
+    kept = []
+    areg, breg = set(), set()
+    for item in items:
+        match item:
+            case ("label", _):
+                areg, breg = set(), set()
+            case ("ref", Hex8Op.LDAC, name, _):
+                if ("addr", name) in areg:
+                    continue
+                areg = {("addr", name)}
+            case ("ref", Hex8Op.LDBC, name, _):
+                if ("addr", name) in breg:
+                    continue
+                breg = {("addr", name)}
+            case ("op", Hex8Op.LDAC | Hex8Op.LDAM as op, value):
+                fact = ("const" if op == Hex8Op.LDAC else "mem", value)
+                if fact in areg:
+                    continue
+                areg = {fact}
+            case ("op", Hex8Op.LDBC | Hex8Op.LDBM as op, value):
+                fact = ("const" if op == Hex8Op.LDBC else "mem", value)
+                if fact in breg:
+                    continue
+                breg = {fact}
+            case ("op", Hex8Op.STAM, value):
+                # The location now holds A, and no longer what B was loaded from
+                breg.discard(("mem", value))
+                areg.add(("mem", value))
+            case ("op", Hex8Op.STAI, _):
+                # The address is not known, so any location may have changed
+                areg = {x for x in areg if x[0] != "mem"}
+                breg = {x for x in breg if x[0] != "mem"}
+            case ("op", Hex8Op.ADD | Hex8Op.SUB as op, _):
+                a = next((x[1] for x in areg if x[0] == "const"), None)
+                b = next((x[1] for x in breg if x[0] == "const"), None)
+                areg = set()
+                if a is not None and b is not None:
+                    areg.add(("const", ((a - b) if op == Hex8Op.SUB else (a + b)) & 0xFF))
+            case ("op", Hex8Op.LDAI | Hex8Op.LDAP, _):
+                areg = set()
+            case ("op", Hex8Op.LDBI, _):
+                breg = set()
+            case ("op", Hex8Op.BR | Hex8Op.BRZ | Hex8Op.BRN | Hex8Op.BRB, _) | ("nop", ) | \
+                    ("ref", Hex8Op.BR | Hex8Op.BRZ | Hex8Op.BRN, _, _):
+                pass
+            case _:
+                areg, breg = set(), set()
+        kept.append(item)
+    return kept
+
+
+def profile(asm: Hex8Assembler, dmem: bytes, steps: int = 1 << 22) -> Counter:
+    # Count how often each item executes in the golden model, running until
+    # the program reaches its halt
+    imem = asm.assemble(relax=True)
+    image = bytearray(dmem)
+    for address, name in asm.pointers.items():
+        image[address] = asm.labels[name]
+    model = Hex8Model()
+    model.load(imem, image)
+    visits = Counter()
+    while (pc := model.step().pc) != asm.halt_pc:
+        visits[pc] += 1
+        if model.steps > steps:
+            raise Exception("Program did not reach its halt")
+    # Items are attributed with the address of their last instruction
+    return Counter({i: visits[a + s - 1] for i, (a, s) in enumerate(zip(asm.addresses, asm.sizes))
+                    if s})
+
+
+def closes(items: list[Item], index: int) -> bool:
+    # Test whether an item is the NOP in the shadow of an unconditional branch
+    return index > 0 and items[index] == ("nop", ) and items[index - 1][0] in ("op", "ref") \
+        and items[index - 1][1] in UNCONDITIONAL
+
+
+def chains(items: list[Item]) -> list[list[int]]:
+    # Split items into runs that must remain contiguous, each ending with an
+    # unconditional branch and the NOP in its shadow
+    runs, current = [], []
+    for index in range(len(items)):
+        current.append(index)
+        if closes(items, index):
+            runs.append(current)
+            current = []
+    if current:
+        runs.append(current)
+    return runs
+
+
+def place(asm: Hex8Assembler, dmem: bytes) -> list[Item]:
+    # Order the runs of code so that the most frequently executed references
+    # to labels need no prefix, keeping the entry point first and any run that
+    # falls off the end of the program last
+    counts = profile(asm, dmem)
+    runs = chains(asm.items)
+    if not runs:
+        return list(asm.items)
+    pinned_last = not closes(asm.items, runs[-1][-1])
+
+    def _cost(order: list[int]) -> tuple[int, int]:
+        indices = [x for r in order for x in runs[r]]
+        trial = Hex8Assembler([asm.items[x] for x in indices])
+        trial.assemble(relax=True)
+        prefixes = sum(counts[x] for x, s in zip(indices, trial.sizes) if s == 2
+                       and asm.items[x][0] == "ref")
+        return prefixes, sum(trial.sizes)
+
+    order = list(range(len(runs)))
+    best = _cost(order)
+    movable = order[1:-1] if pinned_last else order[1:]
+    # Positions at which a run may be reinserted once removed from the order
+    positions = range(1, len(order) - (1 if pinned_last else 0))
+    improved = True
+    while improved:
+        improved = False
+        for run in movable:
+            for position in positions:
+                trial = [x for x in order if x != run]
+                trial.insert(position, run)
+                if (cost := _cost(trial)) < best:
+                    order, best, improved = trial, cost, True
+    return [asm.items[x] for r in order for x in runs[r]]
+
+
+def optimise(asm: Hex8Assembler, dmem: bytes, layout: bool = True) -> Hex8Assembler:
+    # NOTE: The result should be assembled with relax set, so that references
+    #       to labels only carry a prefix where their value needs one
+    result = Hex8Assembler(reuse(asm.items))
+    result.pointers = dict(asm.pointers)
+    if layout:
+        result.items = place(result, dmem)
+    return result
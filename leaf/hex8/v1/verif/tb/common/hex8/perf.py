@@ -0,0 +1,71 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+
+from .isa import Hex8Op
+from .state import Hex8State, Hex8MemoryOp
+
+# Performance counters presented by h8_core when built with PERF_COUNTERS, each
+# on an output named 'o_perf_<counter>'
+COUNTERS = ("retired", "branches", "flushed", "loads", "stores", "prefixed")
+
+
+class Hex8PerfStats:
+
+    # Commits held back from the totals, so that counts can be taken as of a
+    # cycle shortly before the most recent commit
+    HOLDBACK = 4
+
+    def __init__(self) -> None:
+        self.restart()
+
+    def restart(self) -> None:
+        # NOTE: The counters clear on reset, after which the first cycle is
+        #       always flushed
+        self.totals = dict.fromkeys(COUNTERS, 0)
+        self.totals["flushed"] = 1
+        self.recent = deque()
+        self.last_op = None
+
+    def sample(self, state: Hex8State, cycle: int | None = None) -> None:
+        # Derive the counter increments from the commit, which executed in the
+        # given cycle (defaulting to its timestamp)
+        op = int(state.op.op)
+        match op:
+            case Hex8Op.BRZ:
+                taken = state.areg == 0
+            case Hex8Op.BRN:
+                taken = (state.areg & 0x80) != 0
+            case _:
+                taken = op in (Hex8Op.BR, Hex8Op.BRB)
+        deltas = {"retired": 1,
+                  "branches": int(taken),
+                  "loads": int(state.memory == Hex8MemoryOp.LOAD),
+                  "stores": int(state.memory == Hex8MemoryOp.STORE),
+                  "prefixed": int(self.last_op == Hex8Op.PFIX)}
+        self.last_op = op
+        self.recent.append((state.timestamp if cycle is None else cycle, deltas))
+        while len(self.recent) > Hex8PerfStats.HOLDBACK:
+            for key, value in self.recent.popleft()[1].items():
+                self.totals[key] += value
+
+    def counts(self, before: int | None = None) -> dict[str, int]:
+        # Counts from instructions that executed before the given cycle
+        counts = dict(self.totals)
+        for cycle, deltas in self.recent:
+            if before is None or cycle < before:
+                for key, value in deltas.items():
+                    counts[key] += value
+        return counts
@@ -0,0 +1,167 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from collections.abc import Iterable
+
+from .isa import Hex8Op
+from .model import Hex8Model
+
+RELATIVE = frozenset((Hex8Op.BR, Hex8Op.BRZ, Hex8Op.BRN))
+BRANCHES = RELATIVE | {Hex8Op.BRB}
+
+
+class Hex8BranchTrace:
+
+    # NOTE: The trace follows Hex8Model, where a taken branch is followed
+    #       directly by its target. Only branches are recorded, as every other
+    #       instruction is fetched sequentially and never mispredicted.
+
+    def __init__(self) -> None:
+        self.steps = 0
+        # Branch PC, opcode, decoded relative target (if any), outcome and the
+        # PC that followed
+        self.pc = array("B")
+        self.op = array("B")
+        self.target = array("h")
+        self.taken = array("B")
+        self.next_pc = array("B")
+
+    @classmethod
+    def from_model(cls, imem: bytes, dmem: bytes, steps: int,
+                   halt: int | None = None) -> "Hex8BranchTrace":
+        trace = cls()
+        model = Hex8Model()
+        model.load(imem, dmem)
+        pfix = 0
+        for _ in range(steps):
+            state = model.step()
+            op, imm = int(state.op.op), state.op.imm_u4
+            if op in BRANCHES:
+                trace.pc.append(state.pc)
+                trace.op.append(op)
+                trace.target.append(((state.pc + ((pfix << 4) | imm)) & 0xFF)
+                                    if op in RELATIVE else -1)
+                trace.taken.append(int(model.pc != ((state.pc + 1) & 0xFF)))
+                trace.next_pc.append(model.pc)
+            pfix = imm if op == Hex8Op.PFIX else 0
+            if state.pc == halt:
+                break
+        trace.steps = model.steps
+        return trace
+
+    def __len__(self) -> int:
+        return len(self.pc)
+
+    def __iter__(self) -> Iterable[tuple[int, int, int, int, int]]:
+        return zip(self.pc, self.op, self.target, self.taken, self.next_pc)
+
+
+class Hex8Predictor:
+
+    # A front end that fetches sequentially unless it predicts a branch as
+    # taken, in which case it fetches from the predicted target. A branch is
+    # mispredicted if the PC fetched after it was not the one that followed.
+
+    def predict(self, pc: int, op: int, target: int) -> int:
+        return (pc + 1) & 0xFF
+
+    def update(self, pc: int, op: int, taken: bool, next_pc: int) -> None:
+        pass
+
+    def run(self, trace: Hex8BranchTrace) -> int:
+        mispredicts = 0
+        for pc, op, target, taken, next_pc in trace:
+            mispredicts += self.predict(pc, op, target) != next_pc
+            self.update(pc, op, taken, next_pc)
+        return mispredicts
+
+
+class Hex8NotTaken(Hex8Predictor):
+    pass
+
+
+class Hex8BackwardTaken(Hex8Predictor):
+
+    # Static prediction from the decoded instruction, taking unconditional
+    # relative branches and conditional branches that return to an earlier PC
+    # (BRB's target is held in a register, so cannot be predicted)
+
+    def predict(self, pc: int, op: int, target: int) -> int:
+        if op == Hex8Op.BR or (target >= 0 and target <= pc):
+            return target
+        return (pc + 1) & 0xFF
+
+
+class Hex8BranchTargetBuffer(Hex8Predictor):
+
+    # Direct-mapped buffer of taken branches and their last target, which
+    # predicts every branch that hits as taken (including BRB)
+
+    def __init__(self, entries: int) -> None:
+        self.entries = entries
+        self.tags = [-1] * entries
+        self.targets = [0] * entries
+
+    def predict(self, pc: int, op: int, target: int) -> int:
+        index = pc % self.entries
+        return self.targets[index] if self.tags[index] == pc else (pc + 1) & 0xFF
+
+    def update(self, pc: int, op: int, taken: bool, next_pc: int) -> None:
+        index = pc % self.entries
+        if taken:
+            self.tags[index] = pc
+            self.targets[index] = next_pc
+        elif self.tags[index] == pc:
+            self.tags[index] = -1
+
+
+class Hex8TwoBitCounter(Hex8Predictor):
+
+    # Table of saturating 2-bit counters indexed by PC, predicting the
+    # direction of conditional branches while targets come from decode (so BR
+    # is always taken and BRB is never predicted)
+
+    def __init__(self, entries: int) -> None:
+        self.entries = entries
+        # Initialised to weakly not-taken
+        self.counters = bytearray([1] * entries)
+
+    def predict(self, pc: int, op: int, target: int) -> int:
+        if op == Hex8Op.BR or (target >= 0 and self.counters[pc % self.entries] >= 2):
+            return target
+        return (pc + 1) & 0xFF
+
+    def update(self, pc: int, op: int, taken: bool, next_pc: int) -> None:
+        index = pc % self.entries
+        if taken:
+            self.counters[index] = min(3, self.counters[index] + 1)
+        else:
+            self.counters[index] = max(0, self.counters[index] - 1)
+
+
+PREDICTORS: dict[str, type[Hex8Predictor]] = {
+    "not_taken": Hex8NotTaken,
+    "backward_taken": Hex8BackwardTaken,
+    "btb": Hex8BranchTargetBuffer,
+    "two_bit": Hex8TwoBitCounter,
+}
+
+
+def create(spec: str) -> Hex8Predictor:
+    # Predictors are specified as '<name>' or '<name>:<entries>'
+    name, _, entries = spec.partition(":")
+    if name not in PREDICTORS:
+        raise Exception(f"Unknown predictor '{name}'")
+    return PREDICTORS[name](int(entries)) if entries else PREDICTORS[name]()
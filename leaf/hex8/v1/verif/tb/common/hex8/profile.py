@@ -0,0 +1,184 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from operator import add
+
+from .isa import Hex8Op, disassemble
+from .state import Hex8State
+
+
+# Operand usage, following the operand muxing of h8_core, used to identify
+# instructions that consume a load's data as it is forwarded from the response
+READS_A = frozenset((Hex8Op.LDAI, Hex8Op.LDBI, Hex8Op.STAM, Hex8Op.STAI,
+                     Hex8Op.BRZ, Hex8Op.BRN, Hex8Op.ADD, Hex8Op.SUB))
+READS_B = frozenset((Hex8Op.BRB, Hex8Op.ADD, Hex8Op.SUB))
+LOADS_A = frozenset((Hex8Op.LDAM, Hex8Op.LDAI))
+LOADS_B = frozenset((Hex8Op.LDBM, Hex8Op.LDBI))
+BRANCHES = frozenset((Hex8Op.BR, Hex8Op.BRZ, Hex8Op.BRN, Hex8Op.BRB))
+
+# Per-PC counters, summarised over aligned ranges of PCs
+COUNTERS = ("commits", "pfix", "loads", "stores", "load_use", "redirects")
+RANGE_SIZE = 16
+
+
+class Hex8Profile:
+
+    def __init__(self, name: str | None = None) -> None:
+        self.name = name
+        self.counters = {x: array("Q", bytes(8 * 256)) for x in COUNTERS}
+        self.ops = array("Q", bytes(8 * len(Hex8Op)))
+        # Taken branches that return to an earlier PC, keyed by (target, source)
+        self.loops = Counter()
+        self.programs = 0
+        self.commits = 0
+        self.cycles = 0
+        self.startup = 0
+        self.bubbles = 0
+        self.restart()
+
+    def restart(self) -> None:
+        # Begin a new program from reset, the totals accumulate across programs
+        self.last_cycle = None
+        self.last = None
+        self.before = None
+        self.pending = 0
+
+    def sample(self, state: Hex8State, cycle: int | None = None) -> None:
+        # NOTE: The cycle is that in which the instruction executed, counted
+        #       from the first cycle out of reset. Engines differ in how they
+        #       timestamp commits, so callers provide it where it is not simply
+        #       the timestamp.
+        cycle = state.timestamp if cycle is None else cycle
+        pc = state.pc
+        op = int(state.op.op)
+        counters = self.counters
+        self.commits += 1
+        self.ops[op] += 1
+        counters["commits"][pc] += 1
+        # Cycles between reset and the first commit, or between two commits,
+        # are lost to the pipeline
+        if self.last_cycle is None:
+            self.programs += 1
+            self.startup += cycle
+            self.cycles += cycle + 1
+        else:
+            self.bubbles += max(0, cycle - self.last_cycle - 1)
+            self.cycles += max(0, cycle - self.last_cycle)
+        self.last_cycle = max(cycle, self.last_cycle or 0)
+        # Prefixes do no architectural work of their own
+        if op == Hex8Op.PFIX:
+            counters["pfix"][pc] += 1
+        # Consumers of a load's data in the following cycle
+        if (self.pending == 1 and op in READS_A) or (self.pending == 2 and op in READS_B):
+            counters["load_use"][pc] += 1
+        if op in LOADS_A:
+            counters["loads"][pc] += 1
+            self.pending = 1
+        elif op in LOADS_B:
+            counters["loads"][pc] += 1
+            self.pending = 2
+        else:
+            self.pending = 0
+            if op == Hex8Op.STAM or op == Hex8Op.STAI:
+                counters["stores"][pc] += 1
+        # A discontinuity in the PC is a redirect, which h8_core performs after
+        # executing the instruction following the branch
+        if self.last and pc != ((self.last[0] + 1) & 0xFF):
+            source = self.last
+            if self.before and self.before[1] in BRANCHES:
+                source = self.before
+            counters["redirects"][source[0]] += 1
+            if pc <= source[0]:
+                self.loops[(pc, source[0])] += 1
+        self.before = self.last
+        self.last = (pc, op)
+
+    def observe(self, commits: Iterable[Hex8State], offset: int = 0) -> Iterable[Hex8State]:
+        # Sample commits as they pass through to another consumer, the offset
+        # converts each timestamp into the cycle of execution
+        for state in commits:
+            self.sample(state, state.timestamp + offset)
+            yield state
+
+    def merge(self, other: "Hex8Profile") -> "Hex8Profile":
+        for key, values in other.counters.items():
+            self.counters[key] = array("Q", map(add, self.counters[key], values))
+        self.ops = array("Q", map(add, self.ops, other.ops))
+        self.loops.update(other.loops)
+        for key in ("programs", "commits", "cycles", "startup", "bubbles"):
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        return self
+
+    @property
+    def cpi(self) -> float:
+        return self.cycles / max(1, self.commits)
+
+    @property
+    def ipc(self) -> float:
+        return self.commits / max(1, self.cycles)
+
+    def ranges(self) -> dict[str, dict[str, int]]:
+        ranges = {}
+        for base in range(0, 256, RANGE_SIZE):
+            counts = {k: sum(v[base:base + RANGE_SIZE]) for k, v in self.counters.items()}
+            if counts["commits"]:
+                ranges[f"0x{base:02X}-0x{base + RANGE_SIZE - 1:02X}"] = counts
+        return ranges
+
+    def hot_loops(self, count: int = 8) -> list[dict]:
+        # Loops are ranked by the commits attributed to their body, which spans
+        # from the target to the instruction executed after the branch
+        loops = []
+        commits = self.counters["commits"]
+        for (target, source), iterations in self.loops.items():
+            body = range(target, min(255, source + 1) + 1)
+            loops.append({"start": target,
+                          "end": body[-1],
+                          "branch": source,
+                          "iterations": iterations,
+                          "commits": sum(commits[x] for x in body)})
+        return sorted(loops, key=lambda x: (x["commits"], x["iterations"]), reverse=True)[:count]
+
+    def hot_spots(self, imem: bytes | None = None, count: int = 8) -> list[dict]:
+        commits = self.counters["commits"]
+        spots = []
+        for pc in sorted(range(256), key=lambda x: commits[x], reverse=True)[:count]:
+            if not commits[pc]:
+                break
+            spot = {"pc": pc, "commits": commits[pc], "share": commits[pc] / self.commits}
+            if imem is not None:
+                spot["instr"] = disassemble(imem[pc])
+            spots.append(spot)
+        return spots
+
+    def summary(self) -> dict:
+        useful = self.commits - sum(self.counters["pfix"])
+        return {
+            "programs": self.programs,
+            "cycles": self.cycles,
+            "commits": self.commits,
+            "ipc": self.ipc,
+            "cpi": self.cpi,
+            "useful_ipc": useful / max(1, self.cycles),
+            "lost": {"startup": self.startup, "bubbles": self.bubbles},
+            "pfix": sum(self.counters["pfix"]),
+            "redirects": sum(self.counters["redirects"]),
+            "loads": sum(self.counters["loads"]),
+            "load_use": sum(self.counters["load_use"]),
+            "stores": sum(self.counters["stores"]),
+            "opcodes": {x.name: self.ops[x] for x in Hex8Op},
+        }
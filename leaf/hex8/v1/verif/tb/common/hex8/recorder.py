@@ -0,0 +1,132 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from collections.abc import Callable, Iterable
+
+from cocotb.log import SimLog
+from forastero import BaseMonitor, MonitorEvent
+
+from ..byte_memory import ByteMemoryRequest, ByteMemoryResponse
+from .isa import disassemble
+from .state import Hex8MemoryOp, Hex8State
+
+
+class Hex8RecordRing:
+
+    def __init__(self, depth: int, fields: Iterable[str]) -> None:
+        # Storage is allocated once, with the oldest record overwritten when full
+        self.depth = depth
+        self.fields = tuple(fields)
+        self.sequence = array("Q", bytes(8 * depth))
+        self.time = array("Q", bytes(8 * depth))
+        self.values = {x: array("B", bytes(depth)) for x in self.fields}
+        self.head = 0
+        self.count = 0
+
+    def clear(self) -> None:
+        self.head = 0
+        self.count = 0
+
+    def push(self, sequence: int, time: int, *values: int) -> None:
+        head = self.head
+        self.sequence[head] = sequence
+        self.time[head] = time
+        for field, value in zip(self.fields, values):
+            self.values[field][head] = value
+        self.head = (head + 1) % self.depth
+        self.count = min(self.count + 1, self.depth)
+
+    def __iter__(self) -> Iterable[tuple[int, int, dict[str, int]]]:
+        # Yield records from oldest to newest
+        for offset in range(self.count):
+            idx = (self.head - self.count + offset) % self.depth
+            yield (self.sequence[idx],
+                   self.time[idx],
+                   {x: self.values[x][idx] for x in self.fields})
+
+
+class Hex8Recorder:
+
+    # Kinds of memory record
+    READ, WRITE, RESPONSE = range(3)
+
+    def __init__(self, depth: int = 64, clock: Callable[[], int] | None = None) -> None:
+        self.depth = depth
+        # NOTE: Memory transactions are timestamped in simulation time, so a
+        #       clock (e.g. the tracer's cycle count) may be provided so that
+        #       they share a timeline with the commits
+        self.clock = clock
+        self.channels: list[str] = []
+        self.commits = Hex8RecordRing(depth, ("pc", "instr", "areg", "breg",
+                                              "memory", "address", "data"))
+        self.memory = Hex8RecordRing(depth, ("channel", "kind", "address", "data"))
+        self.sequence = 0
+
+    def clear(self) -> None:
+        self.commits.clear()
+        self.memory.clear()
+
+    def attach(self, monitor: BaseMonitor, name: str | None = None) -> None:
+        channel = len(self.channels)
+        self.channels.append(name or monitor.name)
+        monitor.subscribe(MonitorEvent.CAPTURE,
+                          lambda _c, _e, obj: self.record(obj, channel))
+
+    def record(self, obj: Hex8State | ByteMemoryRequest | ByteMemoryResponse,
+               channel: int = 0) -> None:
+        self.sequence += 1
+        time = self.clock() if self.clock else int(obj.timestamp)
+        if isinstance(obj, Hex8State):
+            self.commits.push(self.sequence, obj.timestamp, obj.pc, obj.op._pt_pack(),
+                              obj.areg, obj.breg, obj.memory, obj.address, obj.data)
+        elif isinstance(obj, ByteMemoryRequest):
+            self.memory.push(self.sequence, time, channel,
+                             self.WRITE if obj.write else self.READ, obj.address, obj.data)
+        else:
+            self.memory.push(self.sequence, time, channel,
+                             self.RESPONSE, 0, obj.data)
+
+    def format_commit(self, time: int, record: dict[str, int]) -> str:
+        line = (f"@{time:<8d} COMMIT PC 0x{record['pc']:02X}: 0x{record['instr']:02X} "
+                f"{disassemble(record['instr'])}  A=0x{record['areg']:02X} "
+                f"B=0x{record['breg']:02X}")
+        match record["memory"]:
+            case Hex8MemoryOp.LOAD:
+                line += f"  LOAD  [0x{record['address']:02X}] -> 0x{record['data']:02X}"
+            case Hex8MemoryOp.STORE:
+                line += f"  STORE [0x{record['address']:02X}] <- 0x{record['data']:02X}"
+        return line
+
+    def format_memory(self, time: int, record: dict[str, int]) -> str:
+        line = f"@{time:<8d} {self.channels[record['channel']].upper():<6s} "
+        match record["kind"]:
+            case self.READ:
+                return line + f"READ  [0x{record['address']:02X}]"
+            case self.WRITE:
+                return line + f"WRITE [0x{record['address']:02X}] <- 0x{record['data']:02X}"
+            case _:
+                return line + f"RSP   0x{record['data']:02X}"
+
+    def dump(self) -> list[str]:
+        # Interleave commits and memory transactions in the order they occurred
+        records = sorted([(s, self.format_commit(t, r)) for s, t, r in self.commits]
+                         + [(s, self.format_memory(t, r)) for s, t, r in self.memory])
+        return [x for _, x in records]
+
+    def report(self, log: SimLog) -> None:
+        log.info(f"Last {self.commits.count} commits and {self.memory.count} "
+                 f"memory transactions:")
+        for line in self.dump():
+            log.info(f"  {line}")
@@ -13,11 +13,11 @@
 # limitations under the License.
 
 from enum import IntEnum, auto
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from forastero import BaseTransaction
 
-from .h8_pkg import Instruction
+from .isa import instruction
 
 
 class Hex8MemoryOp(IntEnum):
@@ -29,7 +29,7 @@ class Hex8MemoryOp(IntEnum):
 @dataclass(kw_only=True)
 class Hex8State(BaseTransaction):
     pc: int = 0
-    op: Instruction = Instruction()
+    op: "Instruction" = field(default_factory=lambda: instruction(0))  # noqa: F821
     areg: int = 0
     breg: int = 0
     memory: Hex8MemoryOp = Hex8MemoryOp.NOTHING
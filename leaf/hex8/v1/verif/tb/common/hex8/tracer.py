@@ -12,12 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import cocotb
+from collections.abc import Callable
+
 from cocotb.handle import HierarchyObject, ModifiableObject
+from cocotb.triggers import ReadOnly, RisingEdge
 from forastero import BaseBench, BaseIO, BaseMonitor
 
-from h8_pkg import Opcode, Instruction
-
+from .isa import instruction
 from .state import Hex8State, Hex8MemoryOp
 
 
@@ -31,39 +32,56 @@ class Hex8Tracer(BaseMonitor):
                  core: HierarchyObject) -> None:
         super().__init__(tb, io, clk, rst)
         self.core = core
-        cocotb.start_soon(self.trace())
+        self.fetch = None
+        self.execute = None
+        self.cycle = 0
+        self.reset_cycle = 0
 
     async def monitor(self, capture) -> None:
-        fetch = None
-        execute = None
-        while True:
-            # On reset, clear pipelined state
-            if self.rst.value == 1:
-                fetch = None
-                execute = None
-                continue
+        await RisingEdge(self.clk)
+        # Sample once the cycle's values have settled
+        await ReadOnly()
+        self.sample(capture)
+
+    def sample(self, capture: Callable[[Hex8State], None]) -> None:
+        self.cycle += 1
+
+        # On reset, clear pipelined state
+        if self.rst.value == 1:
+            self.fetch = None
+            self.execute = None
+            self.reset_cycle = self.cycle
+            return
 
-            # If a transaction was in execute, it is now committed
-            if execute and execute.memory is Hex8MemoryOp.LOAD:
-                execute.areg = int(self.core.i_dmem_rsp_data.areg)
-                execute.breg = int(self.core.i_dmem_rsp_data.breg)
-                execute.data = int(self.core.i_dmem_rsp_data.value)
-                capture(execute)
-                execute = None
+        # If a load was in execute, it commits as its data is returned
+        if self.execute:
+            self.execute.areg = int(self.core.areg.value)
+            self.execute.breg = int(self.core.breg.value)
+            self.execute.data = int(self.core.i_dmem_rsp_data.value)
+            capture(self.execute)
+            self.execute = None
 
-            # If a transaction was in fetch, it is now executed
-            if fetch:
-                execute = fetch
-                execute.op = Instruction._pt_unpack(int(self.core.i_imem_rsp_data.value))
-                if self.core.o_dmem_req_valid.value == 1:
-                    execute.address = int(self.core.o_dmem_req_addr.value)
-                    if self.core.o_dmem_req_write.value == 1:
-                        execute.memory = Hex8MemoryOp.STORE
-                        execute.data = int(self.core.o_dmem_req_data.value)
-                    else:
-                        execute.memory = Hex8MemoryOp.LOAD
-                fetch = None
+        # If an instruction was fetched, it is now executing (unless flushed)
+        if self.fetch and self.core.flush_q.value == 0:
+            state = self.fetch
+            state.op = instruction(int(self.core.i_imem_rsp_data.value))
+            state.areg = int(self.core.areg_d.value)
+            state.breg = int(self.core.breg_d.value)
+            if self.core.o_dmem_req_valid.value == 1:
+                state.address = int(self.core.o_dmem_req_addr.value)
+                if self.core.o_dmem_req_write.value == 1:
+                    state.memory = Hex8MemoryOp.STORE
+                    state.data = int(self.core.o_dmem_req_data.value)
+                else:
+                    state.memory = Hex8MemoryOp.LOAD
+            # Loads are deferred until their response arrives
+            if state.memory is Hex8MemoryOp.LOAD:
+                self.execute = state
+            else:
+                capture(state)
+        self.fetch = None
 
-            # If instruction request valid high, then fetch occurred
-            if self.core.o_imem_req_valid.value == 1:
-                fetch = Hex8State(pc=int(self.core.o_imem_req_addr.value))
+        # If instruction request valid high, then fetch occurred
+        if self.core.o_imem_req_valid.value == 1:
+            self.fetch = Hex8State(timestamp=self.cycle,
+                                   pc=int(self.core.o_imem_req_addr.value))
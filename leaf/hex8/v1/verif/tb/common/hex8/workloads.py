@@ -0,0 +1,302 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from random import Random
+
+from .asm import Hex8Assembler
+from .isa import Hex8Op
+from .model import Hex8Model
+from .optimise import optimise as optimise_asm
+from .perf import Hex8PerfStats
+
+# Scratch variables are kept at the top of data memory
+VAR = {x: 0xFF - i for i, x in enumerate(("count", "ptr", "tmp", "s1", "s2", "a", "b", "x",
+                                          "y", "p", "ret", "state", "cur", "changes",
+                                          "zero", "neg", "pos"))}
+
+
+@dataclass(kw_only=True)
+class Hex8Workload:
+    name: str
+    description: str
+    imem: bytes
+    dmem: bytes
+    # PC of the branch the program spins on once complete
+    halt: int
+    # Data memory contents expected on completion, derived independently of
+    # any model from the inputs
+    expect: dict[int, int] = field(default_factory=dict)
+    # Cycles the RTL takes to reach the halt, as last recorded
+    cycles: int = 0
+    # Addresses of labels, which differ between builds that lay out the code
+    # differently
+    labels: dict[str, int] = field(default_factory=dict)
+
+    @functools.cached_property
+    def reference(self) -> dict:
+        # Final state from the golden model
+        model = Hex8Model()
+        model.load(self.imem, self.dmem)
+        stats = Hex8PerfStats()
+        while True:
+            stats.sample(state := model.step())
+            if state.pc == self.halt:
+                break
+            if model.steps > (1 << 24):
+                raise Exception(f"Workload {self.name} did not reach its halt in the model")
+        return {"steps": model.steps,
+                "areg": state.areg,
+                "breg": state.breg,
+                "dmem": bytes(model.dmem.get(x, 0) for x in range(256)),
+                "counters": stats.counts()}
+
+
+WORKLOADS: dict[str, Callable[[], Hex8Workload]] = {}
+
+
+def workload(name: str, cycles: int) -> Callable:
+    def _inner(func: Callable[[Hex8Assembler, bytearray, Random], tuple[str, dict[int, int]]]):
+        @functools.wraps(func)
+        def _build(optimise: bool = False) -> Hex8Workload:
+            asm = Hex8Assembler()
+            dmem = bytearray(256)
+            description, expect = func(asm, dmem, Random(name))
+            asm.halt()
+            if optimise:
+                asm = optimise_asm(asm, bytes(dmem))
+            imem = asm.assemble(relax=optimise)
+            # Variables holding code addresses are resolved once assembled
+            for address, value in asm.pointers.items():
+                dmem[address] = asm.labels[value]
+            for address, value in list(expect.items()):
+                if isinstance(value, str):
+                    expect[address] = asm.labels[value]
+            return Hex8Workload(name=name,
+                                description=description,
+                                imem=imem,
+                                dmem=bytes(dmem),
+                                halt=asm.halt_pc,
+                                expect=expect,
+                                # The recorded count only applies unoptimised
+                                cycles=0 if optimise else cycles,
+                                labels=dict(asm.labels))
+        WORKLOADS[name] = _build
+        return _build
+    return _inner
+
+
+def load(name: str, optimise: bool = False) -> Hex8Workload:
+    return WORKLOADS[name](optimise)
+
+
+def increment(asm: Hex8Assembler, address: int, step: int = 1) -> None:
+    asm.op(Hex8Op.LDAM, address)
+    asm.op(Hex8Op.LDBC, step)
+    asm.emit(Hex8Op.ADD)
+    asm.op(Hex8Op.STAM, address)
+
+
+def countdown(asm: Hex8Assembler, loop: str) -> None:
+    # Decrement the loop count, branching back to the loop until it hits zero
+    asm.op(Hex8Op.LDAM, VAR["count"])
+    asm.op(Hex8Op.LDBC, 1)
+    asm.emit(Hex8Op.SUB)
+    asm.op(Hex8Op.STAM, VAR["count"])
+    asm.branch(Hex8Op.BRZ, f"{loop}_exit")
+    asm.branch(Hex8Op.BR, loop)
+    asm.label(f"{loop}_exit")
+
+
+@workload("memcpy", cycles=7937)
+def memcpy(asm: Hex8Assembler, dmem: bytearray, random: Random) -> tuple[str, dict]:
+    size, src, dst, repeats = 32, 0x00, 0x40, 64
+    dmem[src:src + size] = random.randbytes(size)
+    dmem[VAR["count"]] = repeats
+    asm.label("copy")
+    for idx in range(size):
+        asm.op(Hex8Op.LDAM, src + idx)
+        asm.op(Hex8Op.STAM, dst + idx)
+    countdown(asm, "copy")
+    return (f"Copy {size} bytes, unrolled, {repeats} times",
+            {dst + i: dmem[src + i] for i in range(size)})
+
+
+@workload("checksum", cycles=3972)
+def checksum(asm: Hex8Assembler, dmem: bytearray, random: Random) -> tuple[str, dict]:
+    size = 128
+    dmem[:size] = random.randbytes(size)
+    asm.label("loop")
+    # Fetch the next byte through the pointer
+    asm.op(Hex8Op.LDAM, VAR["ptr"])
+    asm.op(Hex8Op.LDAI, 0)
+    asm.op(Hex8Op.STAM, VAR["tmp"])
+    # Accumulate both sums of a Fletcher checksum
+    asm.op(Hex8Op.LDBM, VAR["tmp"])
+    asm.op(Hex8Op.LDAM, VAR["s1"])
+    asm.emit(Hex8Op.ADD)
+    asm.op(Hex8Op.STAM, VAR["s1"])
+    asm.op(Hex8Op.LDBM, VAR["s1"])
+    asm.op(Hex8Op.LDAM, VAR["s2"])
+    asm.emit(Hex8Op.ADD)
+    asm.op(Hex8Op.STAM, VAR["s2"])
+    # Advance until the pointer reaches the end of the data
+    increment(asm, VAR["ptr"])
+    asm.op(Hex8Op.LDBC, size)
+    asm.emit(Hex8Op.SUB)
+    asm.branch(Hex8Op.BRN, "loop")
+    s1 = s2 = 0
+    for data in dmem[:size]:
+        s1 = (s1 + data) & 0xFF
+        s2 = (s2 + s1) & 0xFF
+    return (f"Fletcher checksum over {size} bytes",
+            {VAR["s1"]: s1, VAR["s2"]: s2, VAR["ptr"]: size})
+
+
+@workload("fibonacci", cycles=6751)
+def fibonacci(asm: Hex8Assembler, dmem: bytearray, random: Random) -> tuple[str, dict]:
+    terms = 250
+    dmem[VAR["b"]] = 1
+    dmem[VAR["count"]] = terms
+    asm.label("loop")
+    # (a, b) <- (b, a + b)
+    asm.op(Hex8Op.LDAM, VAR["a"])
+    asm.op(Hex8Op.LDBM, VAR["b"])
+    asm.emit(Hex8Op.ADD)
+    asm.op(Hex8Op.STAM, VAR["tmp"])
+    asm.op(Hex8Op.LDAM, VAR["b"])
+    asm.op(Hex8Op.STAM, VAR["a"])
+    asm.op(Hex8Op.LDAM, VAR["tmp"])
+    asm.op(Hex8Op.STAM, VAR["b"])
+    countdown(asm, "loop")
+    a, b = 0, 1
+    for _ in range(terms):
+        a, b = b, (a + b) & 0xFF
+    return f"First {terms} terms of the Fibonacci sequence", {VAR["a"]: a, VAR["b"]: b}
+
+
+@workload("multiply", cycles=6375)
+def multiply(asm: Hex8Assembler, dmem: bytearray, random: Random) -> tuple[str, dict]:
+    pairs = [(random.getrandbits(8), random.randrange(16, 128)) for _ in range(6)]
+    for idx, (x, y) in enumerate(pairs):
+        dmem[2 * idx], dmem[2 * idx + 1] = x, y
+    # Call a subroutine for each pair, passing the return address through memory
+    for idx in range(len(pairs)):
+        asm.op(Hex8Op.LDAM, 2 * idx)
+        asm.op(Hex8Op.STAM, VAR["x"])
+        asm.op(Hex8Op.LDAM, 2 * idx + 1)
+        asm.op(Hex8Op.STAM, VAR["y"])
+        asm.address(Hex8Op.LDAC, f"return_{idx}")
+        asm.op(Hex8Op.STAM, VAR["ret"])
+        asm.branch(Hex8Op.BR, "multiply")
+        asm.label(f"return_{idx}")
+        asm.op(Hex8Op.LDAM, VAR["p"])
+        asm.op(Hex8Op.STAM, 0x40 + idx)
+    asm.branch(Hex8Op.BR, "_halt")
+    # Subroutine: p = x * y by repeated addition of x, y times
+    asm.label("multiply")
+    asm.op(Hex8Op.LDAC, 0)
+    asm.op(Hex8Op.STAM, VAR["p"])
+    asm.label("accumulate")
+    asm.op(Hex8Op.LDAM, VAR["p"])
+    asm.op(Hex8Op.LDBM, VAR["x"])
+    asm.emit(Hex8Op.ADD)
+    asm.op(Hex8Op.STAM, VAR["p"])
+    asm.op(Hex8Op.LDAM, VAR["y"])
+    asm.op(Hex8Op.LDBC, 1)
+    asm.emit(Hex8Op.SUB)
+    asm.op(Hex8Op.STAM, VAR["y"])
+    asm.branch(Hex8Op.BRZ, "done")
+    asm.branch(Hex8Op.BR, "accumulate")
+    asm.label("done")
+    asm.op(Hex8Op.LDBM, VAR["ret"])
+    asm.branch_b()
+    return (f"Multiply {len(pairs)} pairs by repeated addition in a subroutine",
+            {0x40 + i: (x * y) & 0xFF for i, (x, y) in enumerate(pairs)})
+
+
+@workload("bubble_sort", cycles=1069)
+def bubble_sort(asm: Hex8Assembler, dmem: bytearray, random: Random) -> tuple[str, dict]:
+    # NOTE: Elements are kept below 128 so that the sign of their difference
+    #       orders them, and as neither model nor RTL agree on an indirect
+    #       store each pass is unrolled over absolute addresses
+    size = 12
+    values = [random.randrange(128) for _ in range(size)]
+    dmem[:size] = bytes(values)
+    dmem[VAR["count"]] = size - 1
+    asm.label("pass")
+    for idx in range(size - 1):
+        # Swap unless element idx is less than element idx + 1
+        asm.op(Hex8Op.LDBM, idx + 1)
+        asm.op(Hex8Op.LDAM, idx)
+        asm.emit(Hex8Op.SUB)
+        asm.branch(Hex8Op.BRN, f"ordered_{idx}")
+        asm.op(Hex8Op.LDAM, idx)
+        asm.op(Hex8Op.STAM, idx + 1)
+        asm.op(Hex8Op.LDAC, 0)
+        asm.emit(Hex8Op.ADD)
+        asm.op(Hex8Op.STAM, idx)
+        asm.label(f"ordered_{idx}")
+    countdown(asm, "pass")
+    return f"Bubble sort {size} bytes in place", dict(enumerate(sorted(values)))
+
+
+@workload("state_machine", cycles=4629)
+def state_machine(asm: Hex8Assembler, dmem: bytearray, random: Random) -> tuple[str, dict]:
+    # Classify a stream of bytes as zero, negative or positive, counting each
+    # class and the changes between them. The current state is held as the
+    # address of its handler and dispatched through BRB.
+    size = 96
+    stream = [random.choice((0, random.randrange(1, 128), random.randrange(128, 256)))
+              for _ in range(size)]
+    dmem[:size] = bytes(stream)
+    asm.label("loop")
+    asm.op(Hex8Op.LDAM, VAR["ptr"])
+    asm.op(Hex8Op.LDAI, 0)
+    asm.op(Hex8Op.STAM, VAR["cur"])
+    increment(asm, VAR["ptr"])
+    asm.op(Hex8Op.LDBM, VAR["state"])
+    asm.branch_b()
+    classes = ("zero", "neg", "pos")
+    for name in classes:
+        asm.label(f"state_{name}")
+        asm.op(Hex8Op.LDAM, VAR["cur"])
+        for cond, target in ((Hex8Op.BRZ, "zero"), (Hex8Op.BRN, "neg"), (Hex8Op.BR, "pos")):
+            asm.branch(cond, f"{['enter', 'count'][target == name]}_{target}")
+    for name in classes:
+        asm.label(f"enter_{name}")
+        increment(asm, VAR["changes"])
+        asm.address(Hex8Op.LDAC, f"state_{name}")
+        asm.op(Hex8Op.STAM, VAR["state"])
+        asm.label(f"count_{name}")
+        increment(asm, VAR[name])
+        asm.branch(Hex8Op.BR, "next")
+    asm.label("next")
+    asm.op(Hex8Op.LDAM, VAR["ptr"])
+    asm.op(Hex8Op.LDBC, size)
+    asm.emit(Hex8Op.SUB)
+    asm.branch(Hex8Op.BRN, "loop")
+    asm.pointer(VAR["state"], "state_zero")
+    counts = {x: 0 for x in classes}
+    state, changes = "zero", 0
+    for data in stream:
+        current = "zero" if data == 0 else ("neg" if data & 0x80 else "pos")
+        changes += current != state
+        counts[current] += 1
+        state = current
+    return (f"Branch-heavy state machine over {size} bytes",
+            {VAR["changes"]: changes, VAR["state"]: f"state_{state}",
+             **{VAR[x]: y for x, y in counts.items()}})
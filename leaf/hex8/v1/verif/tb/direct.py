@@ -0,0 +1,50 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from collections.abc import Callable, Iterable
+from random import Random
+
+from .common.hex8.direct import Hex8DirectSystem
+
+
+# Counterpart to Testbench that runs h8_core through the direct Verilator harness
+# rather than cocotb, for testcases that only need the core's commit stream
+class DirectBench:
+
+    TESTCASES: dict[str, Callable] = {}
+
+    def __init__(self, seed: int = 0, log: logging.Logger | None = None) -> None:
+        self.seed = seed
+        self.random = Random(seed)
+        self.log = log or logging.getLogger("tb.direct")
+        self.system = None
+
+    def load(self, imem: Iterable[int], dmem: Iterable[int]) -> None:
+        self.system = Hex8DirectSystem(imem, dmem)
+
+    def reset(self) -> None:
+        self.system.reset()
+
+    @classmethod
+    def testcase(cls) -> Callable:
+        def _inner(func: Callable) -> Callable:
+            cls.TESTCASES[func.__name__] = func
+            return func
+        return _inner
+
+    @classmethod
+    def run_testcase(cls, name: str, seed: int = 0, **params) -> None:
+        bench = cls(seed, logging.getLogger(f"tb.direct.{name}"))
+        cls.TESTCASES[name](bench, bench.log, **params)
@@ -12,22 +12,37 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import json
+from collections.abc import Callable, Iterable
+from pathlib import Path
 from random import Random
 
 from cocotb.handle import HierarchyObject
-from forastero import BaseBench, IORole
+from cocotb.log import SimLog
+from cocotb.triggers import FallingEdge
+from forastero import BaseBench, BaseDriver, BaseIO, IORole, MonitorEvent
 
 from .common.byte_memory import (
     ByteMemoryIO,
     ByteMemoryRequestMonitor,
     ByteMemoryResponseDriver,
+    ByteMemoryResponseMonitor,
     ByteMemoryModel,
 )
-from .common.h8_model import Hex8Model
+from .common.hex8.coverage import Hex8Coverage
+from .common.hex8.perf import COUNTERS, Hex8PerfStats
+from .common.hex8.profile import Hex8Profile
+from .common.hex8.recorder import Hex8Recorder
+from .common.hex8.tracer import Hex8Tracer
 
 
 class Testbench(BaseBench):
 
+    # Testcases and their options, allowing a persistent worker to run them
+    # against a single bench instance (see tb.testcases.worker)
+    TESTCASES: dict[str, dict] = {}
+
     def __init__(self, dut: HierarchyObject) -> None:
         super().__init__(dut,
                          clk=dut.i_clk,
@@ -35,24 +50,254 @@ class Testbench(BaseBench):
                          clk_drive=True,
                          clk_period=1,
                          clk_units="ns")
+        # Memories either fill lazily as they are read ('lazy') or take a whole
+        # random background per seed ('block') independent of access order
+        self.fill = str(self.get_parameter("fill", "lazy"))
+        if self.fill not in ("lazy", "block"):
+            raise Exception(f"Unknown memory fill mode '{self.fill}'")
+        dense = (self.fill == "block")
         # Instruction memory
-        inst_io = ByteMemoryIO(self.dut, "inst", IORole.INITIATOR)
-        self.register("inst_mon", ByteMemoryRequestMonitor(self, inst_io, self.clk, self.rst))
+        inst_io = ByteMemoryIO(self.dut, "imem", IORole.INITIATOR)
+        self.register("inst_mon",
+                      ByteMemoryRequestMonitor(self, inst_io, self.clk, self.rst),
+                      scoreboard=False)
         self.register("inst_drv", ByteMemoryResponseDriver(self, inst_io, self.clk, self.rst))
+        self.register("inst_rsp_mon",
+                      ByteMemoryResponseMonitor(self, inst_io, self.clk, self.rst),
+                      scoreboard=False)
         self.inst_mem = ByteMemoryModel(self.inst_mon,
                                         self.inst_drv,
                                         Random(self.random.random()),
-                                        self.fork_log("model", "inst_mem"))
+                                        self.fork_log("model", "inst_mem"),
+                                        dense=dense)
         # Data memory
-        data_io = ByteMemoryIO(self.dut, "data", IORole.INITIATOR)
-        self.register("data_mon", ByteMemoryRequestMonitor(self, data_io, self.clk, self.rst))
+        data_io = ByteMemoryIO(self.dut, "dmem", IORole.INITIATOR)
+        self.register("data_mon",
+                      ByteMemoryRequestMonitor(self, data_io, self.clk, self.rst),
+                      scoreboard=False)
         self.register("data_drv", ByteMemoryResponseDriver(self, data_io, self.clk, self.rst))
+        self.register("data_rsp_mon",
+                      ByteMemoryResponseMonitor(self, data_io, self.clk, self.rst),
+                      scoreboard=False)
         self.data_mem = ByteMemoryModel(self.data_mon,
                                         self.data_drv,
                                         Random(self.random.random()),
-                                        self.fork_log("model", "data_mem"))
+                                        self.fork_log("model", "data_mem"),
+                                        dense=dense)
+        # Pipeline tracer
+        core_io = BaseIO(self.dut, None, IORole.INITIATOR, [], [])
+        self.register("tracer",
+                      Hex8Tracer(self, core_io, self.clk, self.rst, self.dut),
+                      scoreboard=False)
+        # Functional coverage of committed instructions, written out at the end
+        # of the test if a database path has been provided
+        path = self.get_parameter("coverage")
+        self.coverage = Hex8Coverage(Path(path).stem if path else None)
+        self.tracer.subscribe(MonitorEvent.CAPTURE,
+                              lambda _c, _e, state: self.coverage.sample(state))
+        # Performance profile of the committed instructions, written out at the
+        # end of the test if a path has been provided
+        self.profile = None
+        if path := self.get_parameter("profile"):
+            self.profile = Hex8Profile(Path(path).stem)
+            self.tracer.subscribe(MonitorEvent.CAPTURE, self._profile_commit)
+        # Performance counters within the core (if it was built with them) are
+        # checked at the end of the test against those derived from the trace
+        self.perf = None
+        if int(self.get_parameter("perf_counters", 1)):
+            self.perf = Hex8PerfStats()
+            self.tracer.subscribe(MonitorEvent.CAPTURE, self._count_commit)
+        self._add_teardowns()
+        # Bounded history of recent activity, reported if the testcase fails
+        self.recorder = Hex8Recorder(int(self.get_parameter("history", 64)),
+                                     clock=lambda: self.tracer.cycle)
+        self.recorder.attach(self.tracer, "core")
+        self.recorder.attach(self.inst_mon, "imem")
+        self.recorder.attach(self.inst_rsp_mon, "imem")
+        self.recorder.attach(self.data_mon, "dmem")
+        self.recorder.attach(self.data_rsp_mon, "dmem")
+        # Waves are not dumped during the run, instead the program is replayed
+        # in the direct harness with waves only captured around a trigger
+        # (raised by a testcase, a PC match, or a failure)
+        self.waves = self.get_parameter("waves")
+        self.wave_pc = self.get_parameter("wave_pc")
+        if self.wave_pc is not None:
+            self.wave_pc = int(str(self.wave_pc), 0)
+        self.commits = 0
+        self.trigger_index = None
+        self.tracer.subscribe(MonitorEvent.CAPTURE, self._track_commit)
+        # Memory images to preload following reset
+        self.images = None
+        # Subscribers belonging to the bench itself
+        self._subscribers = {k: {e: list(h) for e, h in v._handlers.items()}
+                             for k, v in self._components.items()}
+
+    @classmethod
+    def testcase(cls, *args, **kwargs) -> Callable:
+        decorate = super().testcase(*args, **kwargs)
+
+        # Wrap the testcase so that recent history is reported (and waves are
+        # captured) on failure, with failures that only surface once the bench
+        # is closed down handled by close_down
+        def _inner(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def _debug(tb: "Testbench", log: SimLog, *args, **kwargs) -> None:
+                try:
+                    await func(tb, log, *args, **kwargs)
+                except BaseException:
+                    tb.failure(log)
+                    raise
+                if tb.trigger_index is not None:
+                    tb.capture_waves()
+            # Parameters are registered against the undecorated function
+            cls.TEST_REQ_PARAMS[_debug] = cls.TEST_REQ_PARAMS[func]
+            cls.TESTCASES[func.__name__] = {"func": _debug,
+                                            "reset": kwargs.get("reset", True),
+                                            "timeout": kwargs.get("timeout", 10000)}
+            return decorate(_debug)
+
+        return _inner
+
+    async def prepare(self, name: str, seed: int) -> None:
+        # Return the bench to a clean state so that another testcase can be run
+        # within the same simulator process, first letting any responses that
+        # are still in flight drain out
+        for comp in self._components.values():
+            if isinstance(comp, BaseDriver):
+                await comp.idle()
+        # Reseed all sources of randomness
+        self.seed = seed
+        self.random.seed(seed)
+        for comp in self._components.values():
+            comp.seed(self.random)
+        self.inst_mem.seed(Random(self.random.random()))
+        self.data_mem.seed(Random(self.random.random()))
+        # Clear state left over from the previous testcase
+        self.coverage = Hex8Coverage(name)
+        if self.profile:
+            self.profile = Hex8Profile(name)
+        self.images = None
+        self.trigger_index = None
+        self.recorder.clear()
+        # NOTE: Teardowns are coroutines that can only be awaited once, so
+        #       those belonging to the bench are recreated for each testcase
+        #       (discarding any registered by the previous testcase)
+        self._teardown.clear()
+        self._add_teardowns()
+        # NOTE: Forastero offers no way to remove a single subscriber, so those
+        #       registered by the testcase are removed by restoring the snapshot
+        #       taken once the bench was constructed
+        for name, comp in self._components.items():
+            comp._handlers.clear()
+            comp._handlers.update({e: list(h) for e, h in self._subscribers[name].items()})
+
+    def _add_teardowns(self) -> None:
+        if path := self.get_parameter("coverage"):
+            self.add_teardown(self.save_coverage(Path(path)))
+        if self.profile and (path := self.get_parameter("profile")):
+            self.add_teardown(self.save_profile(Path(path)))
+        if self.perf:
+            self.add_teardown(self.check_counters())
+
+    def failure(self, log: SimLog) -> None:
+        self.recorder.report(log)
+        self.trigger()
+        self.capture_waves()
+
+    async def close_down(self, *args, **kwargs) -> None:
+        # Teardowns (such as check_counters) and the scoreboard only fail once
+        # the testcase has returned, as does a timeout expiring while draining
+        # (which kills this coroutine), so each is reported here instead
+        log = self.fork_log("close_down")
+        try:
+            await super().close_down(*args, **kwargs)
+        except BaseException:
+            self.failure(log)
+            raise
+        if not self.scoreboard.result:
+            self.failure(log)
+
+    def load(self, imem: Iterable[int], dmem: Iterable[int]) -> None:
+        self.images = (bytes(imem), bytes(dmem))
+
+    def _track_commit(self, _component, _event, state) -> None:
+        if state.pc == self.wave_pc:
+            self.trigger(self.commits)
+        self.commits += 1
+
+    def trigger(self, index: int | None = None) -> None:
+        # Only the first trigger is captured, identified by its commit index as
+        # that is consistent between the cocotb and direct runs
+        if self.trigger_index is None:
+            self.trigger_index = self.commits if index is None else index
+            self.fork_log("waves").info(f"Triggered at commit {self.trigger_index}")
+
+    def capture_waves(self) -> Path | None:
+        log = self.fork_log("waves")
+        if not self.waves or self.trigger_index is None:
+            return None
+        if not self.images:
+            log.warning("Waves can only be replayed for preloaded memory images")
+            return None
+        # NOTE: Imported here as the direct harness is only needed when replaying
+        from .common.hex8.direct import capture_waves, commit_cycle
+        imem, dmem = self.images
+        before = int(self.get_parameter("wave_before", 200))
+        after = int(self.get_parameter("wave_after", 50))
+        cycle = commit_cycle(imem, dmem, self.trigger_index, 4 * self.trigger_index + 64)
+        if cycle is None:
+            log.warning(f"Commit {self.trigger_index} was not reached when replayed")
+            return None
+        path = capture_waves(imem, dmem, Path(self.waves), cycle - before, cycle + after)
+        log.info(f"Captured waves of cycles {max(0, cycle - before)} to {cycle + after} "
+                 f"(trigger at cycle {cycle}) to {path}")
+        return path
+
+    async def save_coverage(self, path: Path) -> None:
+        self.coverage.save(path)
+        self.fork_log("coverage").info(f"Saved coverage ({self.coverage.percentage:.1f}%) "
+                                       f"to {path}")
+
+    def _profile_commit(self, _component, _event, state) -> None:
+        # Tracer timestamps are fetch cycles counted from the start of the
+        # simulation, whereas the profile counts execution from reset
+        self.profile.sample(state, state.timestamp - self.tracer.reset_cycle)
+
+    async def save_profile(self, path: Path) -> None:
+        with path.open("w", encoding="utf-8") as fh:
+            json.dump({"summary": self.profile.summary(),
+                       "ranges": self.profile.ranges(),
+                       "loops": self.profile.hot_loops(),
+                       "hot_spots": self.profile.hot_spots()}, fh, indent=4)
+        self.fork_log("profile").info(f"Saved profile (IPC {self.profile.ipc:.3f}) to {path}")
+
+    def _count_commit(self, _component, _event, state) -> None:
+        # Tracer timestamps are fetch cycles, with execution in the next cycle
+        self.perf.sample(state, state.timestamp + 1)
+
+    async def check_counters(self) -> None:
+        # The counters are registered, so mid-cycle they account for every
+        # instruction that executed before the current cycle
+        await FallingEdge(self.clk)
+        actual = {x: int(getattr(self.dut, f"o_perf_{x}").value) for x in COUNTERS}
+        expected = self.perf.counts(self.tracer.cycle)
+        log = self.fork_log("perf")
+        log.info("Performance counters: " + ", ".join(f"{k}={v}" for k, v in actual.items()))
+        for name in (mismatches := [x for x in COUNTERS if actual[x] != expected[x]]):
+            log.error(f"Counter {name} is {actual[name]}, trace implies {expected[name]}")
+        assert not mismatches, "Performance counters do not match the trace"
 
     async def initialise(self) -> None:
         await super().initialise()
         self.inst_mem.reset()
         self.data_mem.reset()
+        self.coverage.restart()
+        if self.profile:
+            self.profile.restart()
+        if self.perf:
+            self.perf.restart()
+        self.commits = 0
+        if self.images:
+            for address, (inst, data) in enumerate(zip(*self.images)):
+                self.inst_mem.write(address, inst)
+                self.data_mem.write(address, data)
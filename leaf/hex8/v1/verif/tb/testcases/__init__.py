@@ -12,4 +12,67 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .smoke import *  # noqa: F403
+import json
+from importlib import import_module
+from pathlib import Path
+
+# Testcases are discovered by parsing the source of each module rather than by
+# importing it, with the result cached in a manifest that is keyed by each
+# file's size and modification time. Modules are only imported when one of
+# their testcases is selected.
+ROOT = Path(__file__).parent
+MANIFEST = ROOT / "__pycache__" / "manifest.json"
+
+_manifest: dict[str, dict[str, str]] | None = None
+
+
+def scan(path: Path) -> dict[str, str]:
+    # NOTE: Imported here as parsing is only required when the manifest is stale
+    import ast
+    # Find functions decorated with '<Bench>.testcase(...)' or 'cocotb.test(...)'
+    found = {}
+    for node in ast.parse(path.read_text(encoding="utf-8"), str(path)).body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            if (isinstance(decorator, ast.Call)
+                    and isinstance(decorator.func, ast.Attribute)
+                    and decorator.func.attr in ("testcase", "test")
+                    and isinstance(decorator.func.value, ast.Name)):
+                found[node.name] = decorator.func.value.id
+    return found
+
+
+def discover() -> dict[str, dict[str, str]]:
+    global _manifest
+    if _manifest is not None:
+        return _manifest
+    sources = {x.stem: x for x in sorted(ROOT.glob("*.py")) if x.stem != "__init__"}
+    keys = {k: [v.stat().st_mtime_ns, v.stat().st_size] for k, v in sources.items()}
+    # Reuse the cached manifest if no module has changed
+    try:
+        cached = json.loads(MANIFEST.read_text(encoding="utf-8"))
+        if cached["keys"] == keys:
+            _manifest = cached["testcases"]
+            return _manifest
+    except (OSError, ValueError, KeyError):
+        pass
+    _manifest = {name: {"module": module, "bench": bench}
+                 for module, path in sources.items()
+                 for name, bench in scan(path).items()}
+    try:
+        MANIFEST.parent.mkdir(exist_ok=True)
+        MANIFEST.write_text(json.dumps({"keys": keys, "testcases": _manifest}),
+                            encoding="utf-8")
+    except OSError:
+        pass
+    return _manifest
+
+
+def load(name: str) -> object:
+    module = import_module(f"{__name__}.{discover()[name]['module']}")
+    return getattr(module, name)
+
+
+def load_all() -> dict[str, object]:
+    return {x: load(x) for x in discover()}
@@ -0,0 +1,86 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from cocotb.log import SimLog
+from cocotb.triggers import ClockCycles
+from forastero import MonitorEvent
+
+from ..common.hex8.cfg import Hex8ControlFlow
+from ..common.hex8.cosim import Hex8Cosim
+from ..common.hex8.cycle import Hex8CycleSystem
+from ..direct import DirectBench
+from ..testbench import Testbench
+
+
+def report(cosim: Hex8Cosim, log: SimLog) -> None:
+    for engine, result in cosim.summary().items():
+        if divergence := result["divergence"]:
+            log.error(f"{engine} diverged from the golden model after "
+                      f"{divergence['index']} commits at PC 0x{divergence['pc']:02X} "
+                      f"({divergence['op']}) on {', '.join(divergence['fields'])}: "
+                      f"expected {divergence['expected']}, got {divergence['actual']}")
+        else:
+            log.info(f"{engine} matched the golden model for {result['commits']} commits")
+    assert not cosim.divergences, "Divergence detected between engines"
+
+
+@Testbench.testcase(reset=False)
+@Testbench.parameter("cycles")
+@Testbench.parameter("timebox")
+async def cosim(tb: Testbench, log: SimLog, cycles: int = 2000, timebox: int = 0) -> None:
+    # Generate random instruction and data memory images, or take the
+    # backgrounds of the memories if they are filled as a block
+    if tb.fill == "block":
+        imem, dmem = tb.inst_mem.image, tb.data_mem.image
+    else:
+        imem = bytes(tb.random.getrandbits(8) for _ in range(256))
+        dmem = bytes(tb.random.getrandbits(8) for _ in range(256))
+    # Stop shortly after the program is predicted to settle into a spin loop
+    if int(timebox):
+        cycles = Hex8ControlFlow(imem, rtl=True).budget(int(cycles))
+    cosim = Hex8Cosim(imem, dmem)
+    # Compare the RTL's commits against the golden model as they are traced
+    cosim.register("rtl")
+    def _compare(_component, _event, state) -> None:
+        # Trigger wave capture around the first divergence
+        if divergence := cosim.commit("rtl", state):
+            tb.trigger(divergence.index)
+
+    tb.tracer.subscribe(MonitorEvent.CAPTURE, _compare)
+    # The cycle model is compared against the same reference
+    cosim.consume("cycle", Hex8CycleSystem(imem, dmem).run(int(cycles)))
+    # Preload the memories and run
+    tb.load(imem, dmem)
+    await tb.reset()
+    log.info(f"Running for {cycles} cycles")
+    await ClockCycles(tb.clk, int(cycles))
+    report(cosim, log)
+
+
+@DirectBench.testcase()
+def cosim_direct(tb: DirectBench, log: SimLog, cycles: int = 2000, timebox: int = 0) -> None:
+    # Same stimulus as cosim, but the RTL runs in the direct harness and its
+    # commits are returned in bulk once all cycles have completed
+    imem = bytes(tb.random.getrandbits(8) for _ in range(256))
+    dmem = bytes(tb.random.getrandbits(8) for _ in range(256))
+    if int(timebox):
+        cycles = Hex8ControlFlow(imem, rtl=True).budget(int(cycles))
+    cosim = Hex8Cosim(imem, dmem)
+    cosim.register("rtl")
+    cosim.register("cycle")
+    tb.load(imem, dmem)
+    log.info(f"Running for {cycles} cycles")
+    cosim.consume("rtl", tb.system.run(int(cycles)))
+    cosim.consume("cycle", Hex8CycleSystem(imem, dmem).run(int(cycles)))
+    report(cosim, log)
@@ -0,0 +1,96 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.handle import HierarchyObject
+from cocotb.triggers import with_timeout
+from cocotb.utils import get_sim_time
+from forastero.component import Component
+
+from ..testbench import Testbench
+from . import load
+
+
+def claim(jobs: Path) -> Path | None:
+    # Jobs are claimed by renaming them, which is atomic so that each job is
+    # picked up by exactly one of the workers sharing the directory
+    for path in sorted(jobs.glob("*.job")):
+        claimed = path.with_suffix(f".{os.getpid()}")
+        try:
+            path.rename(claimed)
+        except FileNotFoundError:
+            continue
+        return claimed
+    return None
+
+
+async def run_job(tb: Testbench, job: dict) -> dict:
+    name, seed = job["testcase"], int(job.get("seed", 0))
+    # Importing the testcase registers it with the bench
+    load(name)
+    testcase = Testbench.TESTCASES[name]
+    log = tb.fork_log("testcase", name)
+    await tb.prepare(f"{name}_{seed}", seed)
+    log.info(f"Starting {name} with seed {seed}")
+    result = {**job, "passed": False, "error": None}
+    started = (time.perf_counter(), get_sim_time("ns"))
+
+    async def _run() -> None:
+        await testcase["func"](tb, log, **job.get("params", {}))
+        # Drain the bench and run its teardowns (such as checking the
+        # performance counters), a failure of which also fails the job
+        await tb.close_down()
+
+    try:
+        if testcase["reset"]:
+            await tb.reset()
+        await with_timeout(_run(), testcase["timeout"], "ns")
+        result["passed"] = True
+    except Exception as e:
+        log.error(f"{name} with seed {seed} failed: {e}")
+        result["error"] = "".join(traceback.format_exception_only(e)).strip()
+    # Save coverage from this testcase, if requested
+    if path := job.get("coverage"):
+        tb.coverage.save(Path(path))
+    result["wall_s"] = time.perf_counter() - started[0]
+    result["sim_ns"] = get_sim_time("ns") - started[1]
+    return result
+
+
+# Persistent worker that constructs the bench once and then runs testcases
+# back-to-back, claiming them from a job directory shared with other workers,
+# rather than paying for a fresh simulator and bench per testcase. This is
+# skipped in normal regressions, where no job directory is provided.
+@cocotb.test(skip="HEX8_JOBS" not in os.environ)
+async def worker(dut: HierarchyObject) -> None:
+    jobs = Path(os.environ["HEX8_JOBS"])
+    Component.COMPONENTS.clear()
+    tb = Testbench(dut)
+    cocotb.start_soon(Clock(tb.clk, tb.clk_period, units=tb.clk_units).start())
+    tb.evt_ready.set()
+    count = 0
+    while (path := claim(jobs)) is not None:
+        job = json.loads(path.read_text(encoding="utf-8"))
+        result = await run_job(tb, job)
+        path.with_suffix(".result").write_text(json.dumps(result), encoding="utf-8")
+        path.unlink()
+        count += 1
+    tb.fork_log("worker").info(f"Worker completed {count} jobs")
@@ -0,0 +1,60 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from cocotb.log import SimLog
+from cocotb.triggers import Event
+from forastero import MonitorEvent
+
+from ..common.hex8.workloads import load
+from ..testbench import Testbench
+
+
+@Testbench.testcase(reset=False)
+@Testbench.parameter("workload")
+async def workload(tb: Testbench, log: SimLog, workload: str = "checksum") -> None:
+    program = load(workload)
+    reference = program.reference
+    # Watch for the program reaching its halt
+    halted = Event()
+
+    def _watch(_component, _event, state) -> None:
+        if state.pc == program.halt and not halted.is_set():
+            halted.set(state)
+
+    tb.tracer.subscribe(MonitorEvent.CAPTURE, _watch)
+    # Preload the memories and run
+    tb.load(program.imem, program.dmem)
+    await tb.reset()
+    log.info(f"Running {workload}: {program.description}")
+    await halted.wait()
+    state = halted.data
+    cycles = state.timestamp - tb.tracer.reset_cycle
+    log.info(f"Reached the halt after {cycles} cycles (recorded count is {program.cycles})")
+    # Compare the final state against the golden model
+    for name in ("areg", "breg"):
+        assert getattr(state, name) == reference[name], \
+            f"{name} is 0x{getattr(state, name):02X}, model has 0x{reference[name]:02X}"
+    mismatches = [x for x in range(256) if tb.data_mem.read(x) != reference["dmem"][x]]
+    for address in mismatches:
+        log.error(f"Data memory 0x{address:02X} is 0x{tb.data_mem.read(address):02X}, "
+                  f"model has 0x{reference['dmem'][address]:02X}")
+    assert not mismatches, "Final data memory does not match the golden model"
+    # Events counted from the RTL's trace should agree with the model, except
+    # for instructions retired (and prefixed) in the shadow of BRB, which only
+    # the RTL executes
+    if tb.perf:
+        counts = tb.perf.counts()
+        for name in ("branches", "loads", "stores"):
+            assert counts[name] == reference["counters"][name], \
+                f"{name} is {counts[name]}, model has {reference['counters'][name]}"
@@ -0,0 +1,109 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+import sys
+from collections import Counter
+from pathlib import Path
+
+from ..common.hex8.cfg import END, Hex8ControlFlow
+from ..common.hex8.isa import disassemble
+from ..common.hex8.model import Hex8Model
+from ..common.hex8.state import Hex8MemoryOp
+from .cosim import generate
+
+
+def check(flow: Hex8ControlFlow, dmem: bytes, steps: int, turns: int = 256) -> list[str]:
+    # Run the golden model, checking it stays within the reachable addresses
+    # and, if predicted to halt, is spinning without storing once it should be
+    model = Hex8Model(rtl=flow.rtl)
+    model.load(flow.imem, dmem)
+    reachable, errors = set(flow.reachable) | {END}, []
+    for _ in range(flow.steps if flow.halts else steps):
+        if (pc := min(model.step().pc, END)) not in reachable:
+            errors.append(f"reached 0x{pc:02X}, which was predicted unreachable")
+    if flow.halts:
+        spin = {x for y in flow.loops if y.kind == "spin" for x in y.pcs} | {END}
+        for _ in range(turns):
+            state = model.step()
+            if min(state.pc, END) not in spin or state.memory == Hex8MemoryOp.STORE:
+                errors.append(f"not spinning at 0x{state.pc:02X} after {flow.steps} steps")
+                break
+    return errors
+
+
+def spans(pcs: list[int]) -> str:
+    # Describe addresses as contiguous ranges
+    ranges = []
+    for pc in pcs:
+        if ranges and ranges[-1][1] == pc - 1:
+            ranges[-1][1] = pc
+        else:
+            ranges.append([pc, pc])
+    return ", ".join(f"0x{x:02X}" if x == y else f"0x{x:02X}-0x{y:02X}" for x, y in ranges)
+
+
+def show(flow: Hex8ControlFlow) -> None:
+    logging.info(f"Halts: {flow.halts}" + (f" within {flow.steps} steps" if flow.halts else ""))
+    for loop in flow.loops:
+        logging.info(f" - {loop.kind:<8s} loop over {spans(loop.pcs)}"
+                     + (f" leaving within {loop.steps} steps" if loop.steps is not None else ""))
+    unreachable = set(flow.unreachable)
+    for pc, data in enumerate(flow.imem):
+        logging.info(f"{'  ' if pc in unreachable else '> '}0x{pc:02X}: {disassemble(data)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Analyse the control flow of Hex8 programs, "
+                                                 "predicting which settle into a spin loop")
+    parser.add_argument("--image", type=Path, default=None,
+                        help="Analyse and disassemble an instruction memory image")
+    parser.add_argument("--seeds", type=int, default=1000,
+                        help="Number of random programs to analyse")
+    parser.add_argument("--first-seed", type=int, default=0, help="Seed of the first program")
+    parser.add_argument("--check", type=int, default=0, metavar="STEPS",
+                        help="Check predictions against the golden model, running programs "
+                             "not predicted to halt for this many steps")
+    parser.add_argument("--rtl", action="store_true",
+                        help="Analyse control flow as h8_core executes it, rather than as the "
+                             "ISA defines it")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    if args.image:
+        show(Hex8ControlFlow(args.image.read_bytes(), rtl=args.rtl))
+        return
+    kinds, steps, unreachable, failed = Counter(), [], 0, False
+    for seed in range(args.first_seed, args.first_seed + args.seeds):
+        imem, dmem = generate(seed)
+        flow = Hex8ControlFlow(imem, rtl=args.rtl)
+        kinds.update(x.kind for x in flow.loops)
+        unreachable += len(flow.unreachable)
+        if flow.halts:
+            steps.append(flow.steps)
+        for error in check(flow, dmem, args.check) if args.check else []:
+            logging.error(f"Seed {seed}: {error}")
+            failed = True
+    logging.info(f"{len(steps)} of {args.seeds} programs predicted to halt"
+                 + (f", within a median of {sorted(steps)[len(steps) // 2]} steps"
+                    if steps else ""))
+    logging.info(f"Mean unreachable instructions: {unreachable / args.seeds:.1f}")
+    for kind, count in kinds.most_common():
+        logging.info(f" - {kind:<8s} loops: {count}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+from collections import Counter
+from collections.abc import Callable, Iterable
+from multiprocessing import Pool
+from pathlib import Path
+from random import Random
+
+from ..common.hex8.cfg import Hex8ControlFlow
+from ..common.hex8.cosim import Hex8Cosim
+from ..common.hex8.coverage import Hex8Coverage
+from ..common.hex8.cycle import Hex8CycleSystem
+from ..common.hex8.direct import Hex8DirectSystem, build
+from ..common.hex8.state import Hex8State
+
+
+# Engines that can be compared against the golden model, each accepting the
+# instruction and data memory images along with a cycle budget
+ENGINES: dict[str, Callable[[bytes, bytes, int], Iterable[Hex8State]]] = {
+    "cycle": lambda imem, dmem, cycles: Hex8CycleSystem(imem, dmem).run(cycles),
+    "verilator": lambda imem, dmem, cycles: Hex8DirectSystem(imem, dmem).run(cycles),
+}
+
+
+def generate(seed: int) -> tuple[bytes, bytes]:
+    random = Random(seed)
+    return random.randbytes(256), random.randbytes(256)
+
+
+def run_program(seed: int, cycles: int, engines: list[str], coverage: bool = False,
+                timebox: bool = False, min_steps: int = 0) -> dict:
+    imem, dmem = generate(seed)
+    # Programs predicted to settle into a spin loop are only run until shortly
+    # after they get there, and skipped entirely if that happens too soon
+    if timebox:
+        flow = Hex8ControlFlow(imem, rtl=True)
+        if flow.halts and flow.steps < min_steps:
+            return {"seed": seed, "engines": {}, "skipped": True}
+        cycles = flow.budget(cycles)
+    cosim = Hex8Cosim(imem, dmem)
+    for engine in engines:
+        cosim.register(engine)
+    # Coverage is collected from the whole of the first engine's run, even
+    # beyond the point where it diverges
+    cover = Hex8Coverage(f"seed_{seed}")
+    for idx, engine in enumerate(engines):
+        commits = ENGINES[engine](imem, dmem, cycles)
+        if coverage and idx == 0:
+            commits = list(cover.observe(commits))
+        # Each engine stops being compared as soon as it diverges
+        cosim.consume(engine, commits)
+    result = {"seed": seed, "engines": cosim.summary(), "cycles": cycles}
+    if coverage:
+        result["coverage"] = cover
+    return result
+
+
+def report(results: list[dict]) -> dict:
+    stats = {}
+    for engine in sorted({x for r in results for x in r["engines"]}):
+        runs = [r["engines"][engine] for r in results if engine in r["engines"]]
+        diverged = [x["divergence"] for x in runs if x["divergence"]]
+        stats[engine] = {
+            "runs": len(runs),
+            "diverged": len(diverged),
+            "commits": sum(x["commits"] for x in runs),
+            "mean_commits_to_divergence": (sum(x["index"] for x in diverged) / len(diverged)
+                                           if diverged else None),
+            "opcodes": dict(Counter(x["op"] for x in diverged).most_common()),
+            "fields": dict(Counter(y for x in diverged for y in x["fields"]).most_common()),
+        }
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Differential co-simulation of Hex8 engines "
+                                                 "against the golden model")
+    parser.add_argument("--seeds", type=int, default=1000, help="Number of programs to run")
+    parser.add_argument("--first-seed", type=int, default=0, help="Seed of the first program")
+    parser.add_argument("--cycles", type=int, default=2000, help="Cycle budget per program")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES), dest="engines",
+                        help="Engine to compare (may be repeated, defaults to all)")
+    parser.add_argument("--output", type=Path, default=None, help="Write results to a JSON file")
+    parser.add_argument("--coverage", type=Path, default=None,
+                        help="Write merged functional coverage to a database file")
+    parser.add_argument("--timebox", action="store_true",
+                        help="Analyse each program's control flow, trimming the cycle budget "
+                             "of those predicted to settle into a spin loop")
+    parser.add_argument("--min-steps", type=int, default=0,
+                        help="With --timebox, skip programs predicted to spin within this "
+                             "many instructions")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    engines = args.engines or sorted(ENGINES)
+    # Build the direct harness up front rather than racing within the workers
+    if "verilator" in engines:
+        build()
+    # Fan the programs out across worker processes
+    with Pool(args.workers) as pool:
+        results = pool.starmap(run_program,
+                               [(x, args.cycles, engines, args.coverage is not None,
+                                 args.timebox, args.min_steps)
+                                for x in range(args.first_seed, args.first_seed + args.seeds)],
+                               chunksize=16)
+    if args.timebox:
+        run = [x for x in results if not x.get("skipped")]
+        logging.info(f"Skipped {len(results) - len(run)} programs, ran the rest for "
+                     f"{sum(x['cycles'] for x in run)} of {len(run) * args.cycles} cycles")
+    # Merge coverage from every program into a single database
+    if args.coverage:
+        coverage = Hex8Coverage()
+        for result in results:
+            if "coverage" in result:
+                coverage.merge(result.pop("coverage"))
+        coverage.save(args.coverage)
+        logging.info(f"Coverage: {coverage.percentage:.1f}% of bins hit, "
+                     f"written to {args.coverage}")
+    stats = report(results)
+    for engine, summary in stats.items():
+        logging.info(f"{engine}: {summary['diverged']} of {summary['runs']} programs diverged "
+                     f"({summary['commits']} commits compared)")
+        for opcode, count in summary["opcodes"].items():
+            logging.info(f" - {opcode:<4s} : {count}")
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as fh:
+            json.dump({"stats": stats, "results": results}, fh, indent=4)
+
+
+if __name__ == "__main__":
+    main()
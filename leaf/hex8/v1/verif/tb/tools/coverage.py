@@ -0,0 +1,107 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+from multiprocessing import Pool
+from pathlib import Path
+
+from ..common.hex8.coverage import Hex8Coverage
+
+# Number of databases reduced by each task in the merge tree
+FAN_IN = 32
+
+
+def merge_group(items: list[Path | bytes]) -> bytes:
+    coverage = Hex8Coverage()
+    for item in items:
+        if isinstance(item, bytes):
+            coverage.merge(Hex8Coverage.from_bytes(item))
+        else:
+            coverage.merge(Hex8Coverage.load(item))
+    return coverage.to_bytes()
+
+
+def merge(inputs: list[Path], workers: int | None = None, fan_in: int = FAN_IN) -> Hex8Coverage:
+    # Reduce the databases in a tree, with every group at each level being
+    # merged in parallel, until a single database remains
+    items: list[Path | bytes] = list(inputs)
+    with Pool(workers) as pool:
+        while len(items) > 1:
+            items = pool.map(merge_group,
+                             [items[x:x + fan_in] for x in range(0, len(items), fan_in)])
+    if not items:
+        return Hex8Coverage()
+    # NOTE: A lone input never reaches a merge task, so is still a path
+    if isinstance(items[0], bytes):
+        return Hex8Coverage.from_bytes(items[0])
+    return Hex8Coverage.load(items[0])
+
+
+def report(coverage: Hex8Coverage) -> None:
+    logging.info(f"{coverage.percentage:.1f}% of bins hit from {coverage.samples} samples "
+                 f"across {len(coverage.contributions())} tests")
+    for name, summary in coverage.summary().items():
+        logging.info(f" - {name:<8s} : {summary['hit']} of {summary['bins']} bins")
+        for hole in summary["holes"]:
+            logging.info(f"   - Missed {hole}")
+
+
+def report_rank(ranking: list[dict]) -> None:
+    useful = [x for x in ranking if x["added"]]
+    logging.info(f"{len(useful)} of {len(ranking)} tests are required to reach "
+                 f"{ranking[-1]['cumulative'] if ranking else 0:.1f}% coverage")
+    for idx, entry in enumerate(useful):
+        logging.info(f" {idx + 1:4d}. {entry['test']:<24s} +{entry['added']:<4d} "
+                     f"(unique {entry['unique']:<4d}) {entry['cumulative']:5.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Merge and report on Hex8 functional coverage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge_cmd = commands.add_parser("merge", help="Merge coverage databases into one")
+    merge_cmd.add_argument("output", type=Path, help="Merged database to write")
+    merge_cmd.add_argument("inputs", type=Path, nargs="+",
+                           help="Databases (or directories of databases) to merge")
+    merge_cmd.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    merge_cmd.add_argument("--fan-in", type=int, default=FAN_IN,
+                           help="Databases reduced by each merge task")
+    report_cmd = commands.add_parser("report", help="Summarise a coverage database")
+    report_cmd.add_argument("database", type=Path, help="Database to summarise")
+    rank_cmd = commands.add_parser("rank", help="Rank tests by the coverage they add")
+    rank_cmd.add_argument("database", type=Path, help="Merged database to rank")
+    rank_cmd.add_argument("--output", type=Path, default=None,
+                          help="Write the ranking to a JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    if args.command == "merge":
+        inputs = []
+        for path in args.inputs:
+            inputs += sorted(path.glob("*.h8cov")) if path.is_dir() else [path]
+        coverage = merge(inputs, args.workers, args.fan_in)
+        coverage.save(args.output)
+        report(coverage)
+    elif args.command == "report":
+        report(Hex8Coverage.load(args.database))
+    else:
+        ranking = Hex8Coverage.load(args.database).rank()
+        report_rank(ranking)
+        if args.output:
+            with args.output.open("w", encoding="utf-8") as fh:
+                json.dump(ranking, fh, indent=4)
+
+
+if __name__ == "__main__":
+    main()
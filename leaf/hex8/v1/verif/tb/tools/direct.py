@@ -0,0 +1,47 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+import sys
+
+from ..direct import DirectBench
+from ..testcases import discover, load
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run testcases using the direct Verilator "
+                                                 "harness in place of cocotb")
+    parser.add_argument("testcase",
+                        choices=sorted(k for k, v in discover().items()
+                                       if v["bench"] == DirectBench.__name__),
+                        help="Testcase to run")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--param", action="append", default=[], metavar="KEY=VALUE",
+                        help="Testcase parameter (may be repeated)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(name)s %(message)s", force=True)
+    params = dict(x.split("=", 1) for x in args.param)
+    # Importing the testcase registers it with the bench
+    load(args.testcase)
+    try:
+        DirectBench.run_testcase(args.testcase, args.seed, **params)
+    except AssertionError as e:
+        logging.error(f"{args.testcase} failed: {e}")
+        sys.exit(1)
+    logging.info(f"{args.testcase} passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+import os
+import time
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+from random import Random
+
+from ..common.hex8.cosim import Hex8Cosim
+from ..common.hex8.coverage import TOTAL_BINS
+from ..common.hex8.direct import build
+from ..common.hex8.fuzz import Hex8Corpus, explore, features
+from ..common.hex8.workloads import WORKLOADS, load
+from .cosim import ENGINES, generate
+
+
+def promote(name: str, data: bytes, engine: str, cycles: int) -> tuple[str, dict]:
+    # Co-simulate an entry that added coverage against the golden model
+    cosim = Hex8Cosim(data[:256], data[256:])
+    cosim.register(engine)
+    cosim.consume(engine, ENGINES[engine](data[:256], data[256:], cycles))
+    return name, cosim.summary()[engine]
+
+
+def seed_corpus(corpus: Hex8Corpus, steps: int, randoms: int) -> None:
+    # Start from the benchmark workloads and a handful of random programs
+    images = [(f"workload_{x}", (w := load(x)).imem + w.dmem) for x in WORKLOADS]
+    images += [(f"random_{x}", b"".join(generate(x))) for x in range(randoms)]
+    for origin, data in images:
+        if name := corpus.add(data, features(data, steps)):
+            corpus.update(name, origin=origin)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Coverage-guided fuzzing of Hex8 programs on "
+                                                 "the golden model, co-simulating entries that "
+                                                 "add coverage against the RTL")
+    parser.add_argument("--corpus", type=Path, required=True,
+                        help="Directory holding the corpus, which persists between runs")
+    parser.add_argument("--duration", type=float, default=60,
+                        help="Seconds to fuzz for in this run")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--batch", type=int, default=200,
+                        help="Mutations tried by each worker per round")
+    parser.add_argument("--steps", type=int, default=500,
+                        help="Instructions run on the golden model per execution")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the mutations")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="verilator",
+                        help="Engine to co-simulate entries on")
+    parser.add_argument("--cycles", type=int, default=2000,
+                        help="Cycle budget when co-simulating an entry")
+    parser.add_argument("--no-promote", action="store_true",
+                        help="Only fuzz the golden model, without co-simulating new entries")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    if not args.no_promote and args.engine == "verilator":
+        build()
+    corpus = Hex8Corpus(args.corpus)
+    if not corpus.entries:
+        seed_corpus(corpus, args.steps, randoms=16)
+    random = Random(args.seed)
+    started, execs = time.perf_counter(), 0
+    workers = args.workers or os.cpu_count()
+    with Pool(workers) as pool:
+        # Entries carried over from a run stopped before co-simulating them
+        pending = [x for x, y in corpus.entries.items() if "cosim" not in y]
+        while True:
+            if pending and not args.no_promote:
+                for name, result in pool.starmap(promote, [(x, corpus.images[x], args.engine,
+                                                            args.cycles) for x in pending]):
+                    corpus.update(name, cosim=result)
+            pending = []
+            if time.perf_counter() - started >= args.duration:
+                break
+            # Each worker explores from its own random selection of parents
+            entries = list(corpus.images.items())
+            tasks = [(random.getrandbits(64), random.sample(entries, min(len(entries), 16)),
+                      corpus.covered, args.batch, args.steps) for _ in range(workers)]
+            for count, found in pool.starmap(explore, tasks):
+                execs += count
+                corpus.stats["execs"] += count
+                for data, mask, parent in found:
+                    if name := corpus.add(data, mask, parent):
+                        pending.append(name)
+            elapsed = time.perf_counter() - started
+            logging.info(f"{elapsed:7.1f}s: {execs} execs ({execs / elapsed:.0f}/s), "
+                         f"{len(corpus.entries)} entries, {corpus.covered.bit_count()} features, "
+                         f"{corpus.bins} of {TOTAL_BINS} coverage bins")
+    # Accumulate statistics across runs
+    corpus.stats["runs"] += 1
+    corpus.stats["seconds"] += time.perf_counter() - started
+    corpus.save()
+    results = [y["cosim"] for y in corpus.entries.values() if y.get("cosim")]
+    diverged = [x["divergence"] for x in results if x["divergence"]]
+    logging.info(f"Corpus of {len(corpus.entries)} entries after {corpus.stats['execs']} execs "
+                 f"over {corpus.stats['seconds']:.0f}s in {corpus.stats['runs']} runs")
+    logging.info(f"{len(diverged)} of {len(results)} co-simulated entries diverged")
+    for opcode, count in Counter(x["op"] for x in diverged).most_common():
+        logging.info(f" - {opcode:<4s} : {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+from collections import defaultdict
+from pathlib import Path
+
+from ..common.hex8.coverage import Hex8Coverage
+
+# NOTE: The testbench (as run by tools.pool) names each test '<testcase>_<seed>',
+#       whereas tools.cosim names each random program 'seed_<seed>'. Those
+#       programs do not belong to a testcase, so cannot be rerun by the runner.
+COSIM_PREFIX = "seed_"
+
+
+def parse_name(name: str) -> tuple[str | None, int]:
+    if name.startswith(COSIM_PREFIX):
+        return None, int(name.removeprefix(COSIM_PREFIX))
+    testcase, seed = name.rsplit("_", 1)
+    return testcase, int(seed)
+
+
+def history(paths: list[Path], decay: float) -> tuple[dict[str, dict], dict[str, dict]]:
+    # Summarise results from the regression runner (oldest first), with the
+    # failure record decaying so that recent runs count for more, both for each
+    # test and totalled across every seed of each testcase
+    tests = defaultdict(lambda: {"runs": 0.0, "failures": 0.0, "wall_s": [], "last": None})
+    for path in paths:
+        results = json.loads(path.read_text(encoding="utf-8"))["results"]
+        for entry in tests.values():
+            entry["runs"] *= decay
+            entry["failures"] *= decay
+        for result in results:
+            entry = tests[f"{result['testcase']}_{result['seed']}"]
+            entry["runs"] += 1
+            entry["failures"] += not result["passed"]
+            entry["wall_s"].append(result.get("wall_s", 0.0))
+            entry["last"] = result["passed"]
+    testcases = defaultdict(lambda: {"runs": 0.0, "failures": 0.0, "wall_s": 0.0, "count": 0})
+    for name, entry in tests.items():
+        totals = testcases[parse_name(name)[0]]
+        totals["runs"] += entry["runs"]
+        totals["failures"] += entry["failures"]
+        totals["wall_s"] += sum(entry["wall_s"])
+        totals["count"] += len(entry["wall_s"])
+    return dict(tests), dict(testcases)
+
+
+def likelihood(name: str, tests: dict[str, dict], testcases: dict[str, dict]) -> float:
+    # Chance of a test failing, with its own record weighed against that of
+    # every seed of the same testcase (which acts as the prior)
+    totals = testcases.get(parse_name(name)[0], {"runs": 0.0, "failures": 0.0})
+    prior = (totals["failures"] + 1) / (totals["runs"] + 2)
+    entry = tests.get(name, {"runs": 0.0, "failures": 0.0})
+    return (entry["failures"] + 2 * prior) / (entry["runs"] + 2)
+
+
+def runtime(name: str, tests: dict[str, dict], testcases: dict[str, dict]) -> float:
+    # Mean runtime of a test, falling back to that of its testcase
+    if times := tests.get(name, {}).get("wall_s"):
+        return sum(times) / len(times)
+    totals = testcases.get(parse_name(name)[0], {"wall_s": 0.0, "count": 0})
+    return totals["wall_s"] / totals["count"] if totals["count"] else 1.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Select and order regression tests from their "
+                                                 "coverage, runtime, and failure history")
+    parser.add_argument("database", type=Path,
+                        help="Merged coverage database with each test's contribution")
+    parser.add_argument("--results", type=Path, action="append", default=[],
+                        help="Results from the regression runner, oldest first (may be "
+                             "repeated)")
+    parser.add_argument("--decay", type=float, default=0.5,
+                        help="Weight of each run's failures relative to the next run")
+    parser.add_argument("--full", action="store_true",
+                        help="Order every test rather than selecting a minimal subset")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Write the ordered job list to a JSON file for the runner")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    coverage = Hex8Coverage.load(args.database)
+    tests, testcases = history(args.results, args.decay)
+    names = sorted(set(coverage.contributions()) | set(tests))
+    costs = {x: runtime(x, tests, testcases) for x in names}
+    if args.full:
+        selected = names
+    else:
+        # Keep the coverage of the full set at the least runtime, and always
+        # rerun anything that failed the last time it ran
+        selected = coverage.select(costs)
+        selected += [x for x in names if tests.get(x, {}).get("last") is False
+                     and x not in selected]
+    # Most likely failures first, quicker tests first where equally likely
+    order = sorted(selected, key=lambda x: (-likelihood(x, tests, testcases), costs[x], x))
+    total = sum(costs.values())
+    chosen = sum(costs[x] for x in order)
+    logging.info(f"Selected {len(order)} of {len(names)} tests, taking {chosen:.1f} s of "
+                 f"{total:.1f} s ({100 * chosen / max(total, 1E-9):.1f}%)")
+    for name in order[:10]:
+        logging.info(f" - {name:<32s} {100 * likelihood(name, tests, testcases):5.1f}% to fail, "
+                     f"{costs[name]:.2f} s")
+    # Programs from tools.cosim are listed separately from the runner's jobs
+    jobs, programs = [], []
+    for testcase, seed in map(parse_name, order):
+        if testcase is None:
+            programs.append(seed)
+        else:
+            jobs.append({"testcase": testcase, "seed": seed})
+    if programs:
+        logging.info(f"{len(programs)} of the selected tests are programs from tools.cosim, "
+                     f"which the runner cannot rerun")
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as fh:
+            json.dump({"jobs": jobs, "programs": programs}, fh, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+import sys
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+
+from ..common.hex8.direct import RTL, build
+from ..common.hex8.mutation import RULES, evaluate, mutants, suite
+
+
+def ordering(tests: list[str], history: dict, mutant: str | None = None) -> list[str]:
+    # Run the test that last killed this mutant first, then the rest by how
+    # many mutants each has killed historically (keeping the suite's order for
+    # those with equal records)
+    kills = history.get("kills", {})
+    order = sorted(tests, key=lambda x: -kills.get(x, 0))
+    if (killer := history.get("killers", {}).get(mutant)) in order:
+        order.remove(killer)
+        order.insert(0, killer)
+    return order
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mutation testing of h8_core against the "
+                                                 "direct harness test suite")
+    parser.add_argument("--kind", action="append", dest="kinds",
+                        choices=sorted({x for x, *_ in RULES}),
+                        help="Kind of mutation to apply (may be repeated, defaults to all)")
+    parser.add_argument("--line", type=int, action="append", dest="lines",
+                        help="Only mutate this line of the RTL (may be repeated)")
+    parser.add_argument("--seeds", type=int, default=16,
+                        help="Number of random programs in the suite")
+    parser.add_argument("--cycles", type=int, default=1000,
+                        help="Cycles to run each random program for")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--history", type=Path, default=None,
+                        help="JSON file of kills by each test, used to order tests and "
+                             "updated after the run")
+    parser.add_argument("--output", type=Path, default=None, help="Write results to a JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    history = {}
+    if args.history and args.history.exists():
+        history = json.loads(args.history.read_text(encoding="utf-8"))
+    selected = [x for x in mutants(RTL.read_text(encoding="utf-8"))
+                if (not args.kinds or x.kind in args.kinds)
+                and (not args.lines or x.line in args.lines)]
+    tests = suite(args.seeds)
+    build()
+    # NOTE: Each evaluation (including that of the unmutated design) runs in a
+    #       fresh worker process, as every build is an extension module of the
+    #       same name and so the parent must never load one itself
+    results = []
+    with Pool(args.workers, maxtasksperchild=1) as pool:
+        # The unmutated design must pass the whole suite for kills to mean anything
+        if (baseline := pool.apply(evaluate, (None, tests, args.cycles)))["status"] != "survived":
+            logging.error(f"Unmutated design fails {baseline['test']}: {baseline['error']}")
+            sys.exit(1)
+        logging.info(f"Evaluating {len(selected)} mutants against {len(tests)} tests")
+        jobs = [(x, ordering(tests, history, x.name), args.cycles) for x in selected]
+        for mutant, result in zip(selected, pool.starmap(evaluate, jobs)):
+            results.append(result)
+            logging.info(f"{result['status']:<9s} {mutant.kind:<9s} line {mutant.line:>3d}: "
+                         f"{mutant.original} -> {mutant.replacement}"
+                         + (f" by {result['test']} after {result['tests']} tests"
+                            if result["test"] else ""))
+    killed = [x for x in results if x["status"] == "killed"]
+    survived = [x for x in results if x["status"] == "survived"]
+    score = 100 * len(killed) / max(1, len(killed) + len(survived))
+    logging.info(f"Mutation score: {score:.1f}% ({len(killed)} killed, {len(survived)} "
+                 f"survived, {len(results) - len(killed) - len(survived)} stillborn), "
+                 f"{sum(x['tests'] for x in results)} tests run")
+    for result in survived:
+        mutant = result["mutant"]
+        logging.warning(f" - survived: line {mutant['line']}: {mutant['original']} -> "
+                        f"{mutant['replacement']}")
+    if args.history:
+        kills = Counter(history.get("kills", {}))
+        kills.update(x["test"] for x in killed)
+        killers = history.get("killers", {})
+        for mutant, result in zip(selected, results):
+            if result["status"] == "killed":
+                killers[mutant.name] = result["test"]
+        args.history.write_text(json.dumps({"kills": dict(kills), "killers": killers},
+                                           indent=4), encoding="utf-8")
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as fh:
+            json.dump({"score": score, "results": results}, fh, indent=4)
+
+
+if __name__ == "__main__":
+    main()
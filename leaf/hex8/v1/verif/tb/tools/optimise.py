@@ -0,0 +1,83 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+import sys
+
+from ..common.hex8.direct import build
+from ..common.hex8.workloads import WORKLOADS, Hex8Workload, load
+from .workloads import run_rtl
+
+
+def same(value: int, base: Hex8Workload, other: int, optimised: Hex8Workload) -> bool:
+    # Values match if equal or if both are the address of the same label
+    return value == other or any(base.labels[x] == value and optimised.labels.get(x) == other
+                                 for x in base.labels)
+
+
+def compare(base: Hex8Workload, optimised: Hex8Workload, limit: int) -> tuple[dict, list[str]]:
+    before, after = base.reference, optimised.reference
+    errors = [f"model: 0x{x:02X} is 0x{after['dmem'][x]:02X} (expected 0x{y:02X})"
+              for x, y in optimised.expect.items() if after["dmem"][x] != y]
+    # Code addresses held in registers or memory move with the layout
+    errors += [f"model: {x} is 0x{after[x]:02X} (unoptimised has 0x{before[x]:02X})"
+               for x in ("areg", "breg") if not same(before[x], base, after[x], optimised)]
+    errors += [f"model: 0x{i:02X} is 0x{y:02X} (unoptimised has 0x{x:02X})"
+               for i, (x, y) in enumerate(zip(before["dmem"], after["dmem"], strict=True))
+               if not same(x, base, y, optimised)]
+    # The RTL must agree with the model on the optimised program
+    rtl = run_rtl(optimised, limit)
+    errors += [f"rtl: 0x{x:02X} is 0x{rtl['dmem'][x]:02X} (model has 0x{y:02X})"
+               for x, y in enumerate(after["dmem"]) if rtl["dmem"][x] != y]
+    return {"size": len(optimised.imem.rstrip(b"\x00")),
+            "steps": after["steps"],
+            "prefixed": after["counters"]["prefixed"],
+            "cycles": rtl["cycles"]}, errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Optimise the Hex8 benchmark workloads, "
+                                                 "checking results are unchanged and "
+                                                 "reporting the savings")
+    parser.add_argument("workloads", nargs="*", default=[],
+                        help=f"Workloads to optimise from {', '.join(WORKLOADS)} "
+                             "(defaults to all)")
+    parser.add_argument("--limit", type=int, default=1 << 20,
+                        help="Maximum cycles for a workload to reach its halt")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    if unknown := [x for x in args.workloads if x not in WORKLOADS]:
+        parser.error(f"Unknown workloads: {', '.join(unknown)}")
+    build()
+    failed = False
+    logging.info(f"{'Workload':<14s} {'Size':>9s} {'Prefixed':>13s} {'Steps':>13s} "
+                 f"{'Cycles':>13s} {'Saving':>7s}")
+    for name in (args.workloads or WORKLOADS):
+        base = load(name)
+        before, _ = compare(base, base, args.limit)
+        after, errors = compare(base, load(name, optimise=True), args.limit)
+        columns = " ".join(f"{before[x]:>{w}d}>{after[x]:<{w}d}" for x, w in
+                           (("size", 4), ("prefixed", 6), ("steps", 6), ("cycles", 6)))
+        logging.info(f"{name:<14s} {columns} "
+                     f"{100 * (1 - after['cycles'] / before['cycles']):>6.1f}%")
+        for error in errors:
+            logging.error(f" - {error}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def write_jobs(jobs_dir: Path, tests: list[tuple[str, int]], params: dict,
+               coverage_dir: Path | None) -> int:
+    # NOTE: Workers claim jobs in the order of their file names, so jobs are
+    #       started in the order given
+    count = 0
+    for testcase, seed in tests:
+        job = {"testcase": testcase, "seed": seed, "params": params}
+        if coverage_dir:
+            job["coverage"] = str(coverage_dir / f"{testcase}_{seed}.h8cov")
+        (jobs_dir / f"{count:08d}.job").write_text(json.dumps(job), encoding="utf-8")
+        count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run testcases across a pool of persistent "
+                                                 "simulator workers")
+    parser.add_argument("--testcase", action="append", default=[], dest="testcases",
+                        help="Testcase to run (may be repeated)")
+    parser.add_argument("--seeds", type=int, default=100, help="Number of seeds per testcase")
+    parser.add_argument("--first-seed", type=int, default=0, help="First seed to run")
+    parser.add_argument("--job-list", type=Path, default=None,
+                        help="JSON file listing the testcase and seed of each job to run, in "
+                             "order, instead of every seed of each testcase")
+    parser.add_argument("--param", action="append", default=[], metavar="KEY=VALUE",
+                        help="Testcase parameter (may be repeated)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of simulator processes")
+    parser.add_argument("--command", required=True,
+                        help="Shell command that launches the simulator (with cocotb)")
+    parser.add_argument("--cwd", type=Path, default=None, help="Directory to launch from")
+    parser.add_argument("--jobs-dir", type=Path, default=None,
+                        help="Directory shared with the workers (defaults to a temporary one)")
+    parser.add_argument("--coverage-dir", type=Path, default=None,
+                        help="Directory to write per-job coverage databases into")
+    parser.add_argument("--output", type=Path, default=None, help="Write results to a JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    if not args.testcases and not args.job_list:
+        parser.error("Either --testcase or --job-list must be given")
+    params = dict(x.split("=", 1) for x in args.param)
+    if args.job_list:
+        listed = json.loads(args.job_list.read_text(encoding="utf-8"))["jobs"]
+        tests = [(x["testcase"], int(x["seed"])) for x in listed]
+    else:
+        tests = [(x, y) for y in range(args.first_seed, args.first_seed + args.seeds)
+                 for x in args.testcases]
+    jobs_dir = args.jobs_dir or Path(tempfile.mkdtemp(prefix="hex8_jobs_"))
+    jobs_dir.mkdir(parents=True, exist_ok=True)
+    if args.coverage_dir:
+        args.coverage_dir.mkdir(parents=True, exist_ok=True)
+    count = write_jobs(jobs_dir, tests, params, args.coverage_dir)
+    # Each worker keeps claiming jobs until none remain, so work balances
+    # itself across the pool regardless of the runtime of each testcase
+    logging.info(f"Running {count} jobs across {args.workers} workers from {jobs_dir}")
+    env = {**os.environ, "HEX8_JOBS": str(jobs_dir.absolute()), "MODULE": "tb",
+           "TESTCASE": "worker"}
+    started = time.perf_counter()
+    procs = [subprocess.Popen(args.command, shell=True, cwd=args.cwd, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+             for _ in range(min(args.workers, count))]
+    codes = [x.wait() for x in procs]
+    elapsed = time.perf_counter() - started
+    # Gather results, noting any jobs that were lost (e.g. a worker crashed)
+    results = [json.loads(x.read_text(encoding="utf-8"))
+               for x in sorted(jobs_dir.glob("*.result"))]
+    lost = count - len(results)
+    failed = [x for x in results if not x["passed"]]
+    logging.info(f"Completed {len(results)} of {count} jobs in {elapsed:.1f} s "
+                 f"({elapsed / max(1, len(results)):.3f} s per job), {len(failed)} failed")
+    for result in failed:
+        logging.error(f" - {result['testcase']} seed {result['seed']}: {result['error']}")
+    if lost:
+        logging.error(f"{lost} jobs did not complete, worker exit codes: {codes}")
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as fh:
+            json.dump({"elapsed": elapsed, "lost": lost, "results": results}, fh, indent=4)
+    if failed or lost:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import functools
+import json
+import logging
+from multiprocessing import Pool
+from pathlib import Path
+
+from ..common.hex8.predict import Hex8BranchTrace, create
+from ..common.hex8.workloads import WORKLOADS, load
+from .cosim import generate
+
+# Predictors evaluated by default, sweeping the size of each table
+DEFAULT = ["not_taken", "backward_taken",
+           *(f"btb:{x}" for x in (1, 2, 4, 8, 16, 32)),
+           *(f"two_bit:{x}" for x in (4, 8, 16, 32, 64))]
+
+
+@functools.cache
+def trace(program: str, steps: int) -> Hex8BranchTrace:
+    # Traces are cached within each worker, as every predictor replays them
+    if program in WORKLOADS:
+        workload = load(program)
+        return Hex8BranchTrace.from_model(workload.imem, workload.dmem, steps, workload.halt)
+    return Hex8BranchTrace.from_model(*generate(int(program.removeprefix("seed_"))), steps)
+
+
+def evaluate(program: str, spec: str, steps: int, penalty: int) -> dict:
+    branches = trace(program, steps)
+    mispredicts = create(spec).run(branches)
+    # One cycle per instruction plus the flush after reset, with each
+    # misprediction squashing the wrongly fetched instructions
+    return {"program": program,
+            "predictor": spec,
+            "branches": len(branches),
+            "mispredicts": mispredicts,
+            "cycles": branches.steps + 1 + mispredicts * penalty}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Explore branch prediction for the Hex8 "
+                                                 "front end by replaying golden model traces")
+    parser.add_argument("--predictor", action="append", dest="predictors", default=[],
+                        metavar="NAME[:ENTRIES]",
+                        help="Predictor to evaluate (may be repeated, defaults to a sweep)")
+    parser.add_argument("--workload", action="append", dest="workloads", default=[],
+                        help="Workload to replay (may be repeated, defaults to all)")
+    parser.add_argument("--seeds", type=int, default=0,
+                        help="Also replay this many random programs")
+    parser.add_argument("--steps", type=int, default=1 << 20,
+                        help="Maximum instructions to trace per program")
+    parser.add_argument("--penalty", type=int, default=1,
+                        help="Cycles lost to each misprediction")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--output", type=Path, default=None, help="Write results to a JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    predictors = args.predictors or DEFAULT
+    for spec in predictors:
+        create(spec)
+    programs = (args.workloads or list(WORKLOADS)) + [f"seed_{x}" for x in range(args.seeds)]
+    # Every pairing of program and predictor is evaluated independently, with
+    # the jobs for a program kept together so that its trace is reused
+    with Pool(args.workers) as pool:
+        results = pool.starmap(evaluate,
+                               [(x, y, args.steps, args.penalty)
+                                for x in programs for y in predictors],
+                               chunksize=len(predictors))
+    # Report cycles saved relative to always fetching sequentially
+    table = {}
+    for result in results:
+        table.setdefault(result["program"], {})[result["predictor"]] = result
+    totals = {x: sum(table[y][x]["cycles"] for y in programs) for x in predictors}
+    baseline = sum(table[x]["not_taken"]["cycles"] for x in programs) \
+        if "not_taken" in predictors else None
+    width = max(len(x) for x in predictors)
+    for program in programs:
+        row = table[program]
+        base = row["not_taken"]["cycles"] if "not_taken" in row else None
+        logging.info(f"{program} ({row[predictors[0]]['branches']} branches)")
+        for spec in predictors:
+            result = row[spec]
+            saved = f", {base - result['cycles']} cycles saved" if base is not None else ""
+            logging.info(f" - {spec:<{width}s}: {result['mispredicts']:>6d} mispredicts, "
+                         f"{result['cycles']:>8d} cycles{saved}")
+    logging.info("Total")
+    for spec in predictors:
+        saved = (f", {baseline - totals[spec]} cycles saved "
+                 f"({100 * (baseline - totals[spec]) / baseline:.1f}%)") if baseline else ""
+        logging.info(f" - {spec:<{width}s}: {totals[spec]:>8d} cycles{saved}")
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as fh:
+            json.dump({"penalty": args.penalty, "totals": totals, "results": results},
+                      fh, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+from collections.abc import Callable, Iterable
+from multiprocessing import Pool
+from pathlib import Path
+
+from ..common.hex8.cycle import Hex8CycleSystem
+from ..common.hex8.direct import Hex8DirectSystem, build
+from ..common.hex8.profile import Hex8Profile
+from ..common.hex8.state import Hex8State
+from .cosim import generate
+
+
+def stream_direct(imem: bytes, dmem: bytes, cycles: int, chunk: int) -> Iterable[Hex8State]:
+    # The harness returns commits in bulk, so long runs are taken in chunks to
+    # bound the size of the trace held in memory at once
+    system = Hex8DirectSystem(imem, dmem)
+    while (remaining := cycles - system.cycle) > 0:
+        yield from system.run(min(chunk, remaining))
+
+
+# Engines that can be profiled, each with the offset from a commit's timestamp
+# to the cycle in which it executed (the direct harness stamps the fetch cycle)
+ENGINES: dict[str, tuple[Callable[[bytes, bytes, int, int], Iterable[Hex8State]], int]] = {
+    "cycle": (lambda imem, dmem, cycles, _: Hex8CycleSystem(imem, dmem).run(cycles), 0),
+    "verilator": (stream_direct, 1),
+}
+
+
+def profile_program(name: str,
+                    imem: bytes,
+                    dmem: bytes,
+                    cycles: int,
+                    engine: str,
+                    chunk: int) -> Hex8Profile:
+    run, offset = ENGINES[engine]
+    profile = Hex8Profile(name)
+    for _ in profile.observe(run(imem, dmem, cycles, chunk), offset):
+        pass
+    return profile
+
+
+def profile_seed(seed: int, cycles: int, engine: str, chunk: int) -> Hex8Profile:
+    return profile_program(f"seed_{seed}", *generate(seed), cycles, engine, chunk)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Profile the CPI and stall behaviour of "
+                                                 "h8_core from its commit trace")
+    parser.add_argument("--seeds", type=int, default=100, help="Number of random programs")
+    parser.add_argument("--first-seed", type=int, default=0, help="Seed of the first program")
+    parser.add_argument("--imem", type=Path, default=None,
+                        help="Profile a binary instruction memory image instead")
+    parser.add_argument("--dmem", type=Path, default=None,
+                        help="Binary data memory image to accompany --imem")
+    parser.add_argument("--cycles", type=int, default=2000, help="Cycles to run per program")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="verilator",
+                        help="Engine producing the commit trace")
+    parser.add_argument("--chunk", type=int, default=1 << 20,
+                        help="Cycles traced at once by the direct harness")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--top", type=int, default=8, help="Number of hot loops and PCs to list")
+    parser.add_argument("--output", type=Path, default=None, help="Write results to a JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    if args.engine == "verilator":
+        build()
+    if args.imem:
+        imem = args.imem.read_bytes().ljust(256, b"\x00")[:256]
+        dmem = args.dmem.read_bytes().ljust(256, b"\x00")[:256] if args.dmem else bytes(256)
+        profiles = [profile_program(args.imem.stem, imem, dmem, args.cycles,
+                                    args.engine, args.chunk)]
+    else:
+        imem = None
+        with Pool(args.workers) as pool:
+            profiles = pool.starmap(profile_seed,
+                                    [(x, args.cycles, args.engine, args.chunk)
+                                     for x in range(args.first_seed,
+                                                    args.first_seed + args.seeds)],
+                                    chunksize=4)
+    total = Hex8Profile()
+    for profile in profiles:
+        total.merge(profile)
+    summary = total.summary()
+    logging.info(f"{summary['programs']} programs, {summary['commits']} commits in "
+                 f"{summary['cycles']} cycles: IPC {summary['ipc']:.3f}, CPI "
+                 f"{summary['cpi']:.3f} (IPC {summary['useful_ipc']:.3f} excluding PFIX)")
+    logging.info(f"Cycles lost: {summary['lost']['startup']} after reset, "
+                 f"{summary['lost']['bubbles']} to bubbles")
+    logging.info(f"Redirects: {summary['redirects']}, loads: {summary['loads']} "
+                 f"({summary['load_use']} consumed by the next instruction), "
+                 f"prefixes: {summary['pfix']}")
+    logging.info("PC ranges:")
+    logging.info(f" {'Range':<11s} " + " ".join(f"{x:>10s}" for x in total.counters))
+    for label, counts in total.ranges().items():
+        logging.info(f" {label:<11s} " + " ".join(f"{x:>10d}" for x in counts.values()))
+    # Loops and hot spots are only meaningful within a single program
+    if len(profiles) == 1:
+        logging.info("Hot loops:")
+        for loop in total.hot_loops(args.top):
+            logging.info(f" - 0x{loop['start']:02X}-0x{loop['end']:02X} (branch at "
+                         f"0x{loop['branch']:02X}): {loop['iterations']} iterations, "
+                         f"{loop['commits']} commits")
+        logging.info("Hot spots:")
+        for spot in total.hot_spots(imem, args.top):
+            logging.info(f" - 0x{spot['pc']:02X} {spot.get('instr', ''):<8s}: "
+                         f"{spot['commits']} commits ({100 * spot['share']:.1f}%)")
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as fh:
+            json.dump({"summary": summary,
+                       "ranges": total.ranges(),
+                       "programs": {x.name: {"summary": x.summary(),
+                                             "ranges": x.ranges(),
+                                             "loops": x.hot_loops(args.top),
+                                             "hot_spots": x.hot_spots(count=args.top)}
+                                    for x in profiles}}, fh, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+# Run in a fresh interpreter to time each phase of starting a testcase, cocotb
+# is optionally imported first as it is already loaded when running under a
+# simulator (and TESTCASE is set as cocotb would when selecting a test)
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+if {cocotb}:
+    import cocotb, cocotb.handle, cocotb.log, cocotb.triggers
+cocotb_done = time.perf_counter()
+import tb
+import_done = time.perf_counter()
+getattr(tb, {testcase!r})
+select_done = time.perf_counter()
+json.dump({{"cocotb": cocotb_done - start,
+            "import": import_done - cocotb_done,
+            "select": select_done - import_done}}, sys.stdout)
+"""
+
+
+def measure(testcase: str, runs: int, cocotb: bool) -> dict[str, float]:
+    root = Path(__file__).parents[2]
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", PROBE.format(testcase=testcase,
+                                                                    cocotb=cocotb)],
+                                cwd=root,
+                                env={**os.environ, "TESTCASE": testcase},
+                                capture_output=True,
+                                text=True,
+                                check=True)
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    # Report the median of each phase in milliseconds
+    timings = {x: 1000 * statistics.median(y[x] for y in samples)
+               for x in ("cocotb", "import", "select")}
+    timings["total"] = timings["import"] + timings["select"]
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the Python startup cost of the "
+                                                 "testbench for a single testcase")
+    parser.add_argument("testcase", nargs="?", default="smoke", help="Testcase to select")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters to time")
+    parser.add_argument("--no-cocotb", action="store_true",
+                        help="Do not import cocotb before the testbench")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Fail if the testbench startup exceeds this many milliseconds")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Fail if startup regresses against timings saved in this file")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="Allowed slowdown relative to the baseline")
+    parser.add_argument("--save", type=Path, default=None, help="Save timings as a baseline")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    timings = measure(args.testcase, args.runs, not args.no_cocotb)
+    logging.info(f"Startup of {args.testcase} (median of {args.runs} runs): "
+                 f"cocotb {timings['cocotb']:.1f} ms, import {timings['import']:.1f} ms, "
+                 f"select {timings['select']:.1f} ms")
+    if args.save:
+        with args.save.open("w", encoding="utf-8") as fh:
+            json.dump(timings, fh, indent=4)
+    failed = False
+    if args.budget is not None and timings["total"] > args.budget:
+        logging.error(f"Startup of {timings['total']:.1f} ms exceeds the budget of "
+                      f"{args.budget:.1f} ms")
+        failed = True
+    if args.baseline:
+        with args.baseline.open("r", encoding="utf-8") as fh:
+            limit = json.load(fh)["total"] * args.tolerance
+        if timings["total"] > limit:
+            logging.error(f"Startup of {timings['total']:.1f} ms has regressed beyond "
+                          f"{limit:.1f} ms")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
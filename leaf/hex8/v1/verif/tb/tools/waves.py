@@ -0,0 +1,76 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+from pathlib import Path
+
+from ..common.hex8.cosim import Hex8Cosim
+from ..common.hex8.direct import (
+    COMMIT_FORMAT,
+    Hex8DirectSystem,
+    capture_waves,
+    commit_cycle,
+)
+from .cosim import generate
+
+
+def find_trigger(imem: bytes, dmem: bytes, cycles: int, args: argparse.Namespace) -> int | None:
+    # An explicit cycle needs no search
+    if args.cycle is not None:
+        return args.cycle
+    # Find the first fetch of the requested PC
+    if args.pc is not None:
+        trace = Hex8DirectSystem(imem, dmem).trace(cycles)
+        return next((cycle for cycle, pc, *_ in COMMIT_FORMAT.iter_unpack(trace)
+                     if pc == args.pc), None)
+    # Find the first divergence from the golden model
+    cosim = Hex8Cosim(imem, dmem)
+    if divergence := cosim.consume("verilator", Hex8DirectSystem(imem, dmem).run(cycles)):
+        return commit_cycle(imem, dmem, divergence.index, cycles)
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-run a co-simulation seed in the direct "
+                                                 "harness, dumping waves around a trigger")
+    parser.add_argument("seed", type=int, help="Seed of the program to re-run")
+    trigger = parser.add_mutually_exclusive_group()
+    trigger.add_argument("--cycle", type=int, default=None, help="Trigger at a cycle")
+    trigger.add_argument("--pc", type=lambda x: int(x, 0), default=None,
+                         help="Trigger on the first fetch of a PC")
+    trigger.add_argument("--divergence", action="store_true",
+                         help="Trigger on the first divergence from the golden model (default)")
+    parser.add_argument("--before", type=int, default=200,
+                        help="Cycles to capture before the trigger")
+    parser.add_argument("--after", type=int, default=50,
+                        help="Cycles to capture after the trigger")
+    parser.add_argument("--cycles", type=int, default=2000,
+                        help="Cycle budget when searching for the trigger")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="VCD file to write (defaults to seed_<N>.vcd)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    imem, dmem = generate(args.seed)
+    if (cycle := find_trigger(imem, dmem, args.cycles, args)) is None:
+        logging.error(f"Trigger not reached within {args.cycles} cycles")
+        raise SystemExit(1)
+    path = args.output or Path(f"seed_{args.seed}.vcd")
+    capture_waves(imem, dmem, path, cycle - args.before, cycle + args.after)
+    logging.info(f"Captured cycles {max(0, cycle - args.before)} to {cycle + args.after} "
+                 f"(trigger at cycle {cycle}) to {path}")
+
+
+if __name__ == "__main__":
+    main()
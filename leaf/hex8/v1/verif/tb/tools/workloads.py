@@ -0,0 +1,153 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ..common.hex8.cycle import Hex8CycleSystem
+from ..common.hex8.direct import COMMIT_FORMAT, Hex8DirectSystem, build
+from ..common.hex8.model import Hex8Model
+from ..common.hex8.workloads import WORKLOADS, Hex8Workload, load
+
+
+def run_rtl(workload: Hex8Workload, limit: int, chunk: int = 1 << 16) -> dict:
+    # Run the RTL in the direct harness until it reaches the halt, returning the
+    # cycle in which the halt executed along with the final state
+    system = Hex8DirectSystem(workload.imem, workload.dmem)
+    commits = 0
+    while system.cycle < limit:
+        trace = system.trace(chunk)
+        for cycle, pc, _, areg, breg, *_ in COMMIT_FORMAT.iter_unpack(trace):
+            if pc == workload.halt:
+                # NOTE: The harness stamps commits with their fetch cycle
+                return {"cycles": cycle + 1,
+                        "commits": commits,
+                        "areg": areg,
+                        "breg": breg,
+                        "dmem": system.dmem}
+            commits += 1
+    raise Exception(f"Workload {workload.name} did not reach its halt within {limit} cycles")
+
+
+def rate(func, minimum: float) -> float:
+    # Repeat a run until enough time has passed to give a stable rate
+    count, elapsed, started = 0, 0, time.perf_counter()
+    while elapsed < minimum:
+        count += func()
+        elapsed = time.perf_counter() - started
+    return count / elapsed
+
+
+def measure(workload: Hex8Workload, limit: int, minimum: float) -> dict:
+    reference = workload.reference
+    rtl = run_rtl(workload, limit)
+    # Check the model against the expected result, and the RTL against both
+    errors = [f"model: 0x{x:02X} is 0x{reference['dmem'][x]:02X} (expected 0x{y:02X})"
+              for x, y in workload.expect.items() if reference["dmem"][x] != y]
+    errors += [f"rtl: {x} is 0x{rtl[x]:02X} (model has 0x{reference[x]:02X})"
+               for x in ("areg", "breg") if rtl[x] != reference[x]]
+    errors += [f"rtl: 0x{x:02X} is 0x{rtl['dmem'][x]:02X} (model has 0x{y:02X})"
+               for x, y in enumerate(reference["dmem"]) if rtl["dmem"][x] != y]
+
+    def _model() -> int:
+        model = Hex8Model()
+        model.load(workload.imem, workload.dmem)
+        for _ in range(reference["steps"]):
+            model.step()
+        return reference["steps"]
+
+    def _cycle() -> int:
+        system = Hex8CycleSystem(workload.imem, workload.dmem)
+        for _ in range(rtl["cycles"]):
+            system.step()
+        return rtl["cycles"]
+
+    def _direct() -> int:
+        Hex8DirectSystem(workload.imem, workload.dmem).trace(rtl["cycles"])
+        return rtl["cycles"]
+
+    return {"cycles": rtl["cycles"],
+            "commits": rtl["commits"],
+            "ipc": rtl["commits"] / rtl["cycles"],
+            "reference_cycles": workload.cycles,
+            "model_steps": reference["steps"],
+            "model_steps_per_s": rate(_model, minimum),
+            "cycle_model_cycles_per_s": rate(_cycle, minimum),
+            "direct_cycles_per_s": rate(_direct, minimum),
+            "errors": errors}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Hex8 benchmark workloads, checking "
+                                                 "results and tracking performance")
+    parser.add_argument("workloads", nargs="*", default=[],
+                        help=f"Workloads to run from {', '.join(WORKLOADS)} (defaults to all)")
+    parser.add_argument("--limit", type=int, default=1 << 20,
+                        help="Maximum cycles for a workload to reach its halt")
+    parser.add_argument("--minimum", type=float, default=0.2,
+                        help="Minimum seconds to spend measuring each rate")
+    parser.add_argument("--history", type=Path, default=None,
+                        help="Append results to this JSON lines file and compare against "
+                             "the previous entry")
+    parser.add_argument("--tolerance", type=float, default=0.8,
+                        help="Allowed fraction of the previous rates before flagging a "
+                             "regression")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", force=True)
+    if unknown := [x for x in args.workloads if x not in WORKLOADS]:
+        parser.error(f"Unknown workloads: {', '.join(unknown)}")
+    build()
+    previous = None
+    if args.history and args.history.exists():
+        with args.history.open("r", encoding="utf-8") as fh:
+            if lines := fh.read().splitlines():
+                previous = json.loads(lines[-1])["results"]
+    results, failed = {}, False
+    logging.info(f"{'Workload':<14s} {'Cycles':>8s} {'IPC':>6s} {'Model st/s':>11s} "
+                 f"{'Cycle cy/s':>11s} {'Direct cy/s':>12s}")
+    for name in (args.workloads or WORKLOADS):
+        result = results[name] = measure(load(name), args.limit, args.minimum)
+        logging.info(f"{name:<14s} {result['cycles']:>8d} {result['ipc']:>6.3f} "
+                     f"{result['model_steps_per_s']:>11.0f} "
+                     f"{result['cycle_model_cycles_per_s']:>11.0f} "
+                     f"{result['direct_cycles_per_s']:>12.0f}")
+        for error in result["errors"]:
+            logging.error(f" - {error}")
+            failed = True
+        # Cycle counts only change with the design, so any difference from the
+        # recorded count is reported
+        if result["reference_cycles"] and result["cycles"] != result["reference_cycles"]:
+            logging.warning(f" - took {result['cycles']} cycles, recorded count is "
+                            f"{result['reference_cycles']}")
+        if previous and name in previous:
+            for key in ("model_steps_per_s", "cycle_model_cycles_per_s", "direct_cycles_per_s"):
+                if result[key] < previous[name][key] * args.tolerance:
+                    logging.error(f" - {key} regressed from {previous[name][key]:.0f} to "
+                                  f"{result[key]:.0f}")
+                    failed = True
+    if args.history:
+        with args.history.open("a", encoding="utf-8") as fh:
+            fh.write(json.dumps({"time": datetime.now(timezone.utc).isoformat(),
+                                 "results": results}) + "\n")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
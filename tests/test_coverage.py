@@ -0,0 +1,67 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+# NOTE: The testbench's dependencies are installed by the Python tool (see
+#       infra/tools/pythonsite.txt) rather than by Poetry, so these tests only
+#       run where they are available
+pytest.importorskip("forastero")
+pytest.importorskip("packtype")
+
+from tb.common.hex8.coverage import Hex8Coverage  # noqa: E402
+from tb.common.hex8.model import Hex8Model  # noqa: E402
+from tb.tools.coverage import merge  # noqa: E402
+
+
+def record(name: str, seed: int, steps: int = 200) -> Hex8Coverage:
+    rng = random.Random(seed)
+    model = Hex8Model(rtl=True)
+    model.load(rng.randbytes(256), rng.randbytes(256))
+    coverage = Hex8Coverage(name)
+    for _ in range(steps):
+        coverage.sample(model.step())
+    return coverage
+
+
+def test_bytes_round_trip():
+    coverage = record("test_0", 0).merge(record("test_1", 1))
+    loaded = Hex8Coverage.from_bytes(coverage.to_bytes())
+    assert loaded.hits == coverage.hits
+    assert loaded.samples == coverage.samples == 400
+    assert loaded.contributions() == coverage.contributions()
+    assert set(loaded.contributions()) == {"test_0", "test_1"}
+
+
+def test_rejects_foreign_data():
+    with pytest.raises(Exception, match="Not a Hex8 coverage database"):
+        Hex8Coverage.from_bytes(bytes(1024))
+
+
+@pytest.mark.parametrize("count", [0, 1, 2, 5])
+def test_merge(tmp_path, count):
+    expected = Hex8Coverage()
+    inputs = []
+    for idx in range(count):
+        coverage = record(f"test_{idx}", idx)
+        coverage.save(path := tmp_path / f"test_{idx}.h8cov")
+        inputs.append(path)
+        expected.merge(coverage)
+    # A small fan-in forces several levels of the merge tree
+    merged = merge(inputs, workers=2, fan_in=2)
+    assert merged.hits == expected.hits
+    assert merged.samples == 200 * count
+    assert merged.contributions() == expected.contributions()
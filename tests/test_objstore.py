@@ -0,0 +1,303 @@
+# Copyright 2024, Peter Birch, mailto:peter@intuity.io
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import hashlib
+import io
+import os
+import random
+import tarfile
+import threading
+from types import SimpleNamespace
+from zipfile import ZIP_STORED, ZipFile
+
+import boto3
+import botocore.exceptions
+import pytest
+import zstandard
+from blockwork.tools import Tool
+from moto import mock_aws
+
+from infra.tools.objstore import (ObjStore, ObjStoreCache, ObjStoreReader,
+                                  build_archive, tree_digest)
+
+BUCKET = "hex8"
+CHUNK = 1024
+
+
+@pytest.fixture
+def client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def store(client, tmp_path, monkeypatch):
+    # NOTE: The store is assembled directly as setup() needs a blockwork
+    #       context, and chunks are shrunk so that small objects span several
+    monkeypatch.setattr(ObjStore, "CHUNK_SIZE", CHUNK)
+    store = object.__new__(ObjStore)
+    store.store = client
+    store.bucket = BUCKET
+    store.max_concurrency = 2
+    store._manifest = None
+    store._manifest_lock = threading.RLock()
+    store._cache = ObjStoreCache(tmp_path / "cache", 1 << 20)
+    return store
+
+
+def put(client, key: str, data: bytes, sha256: str | None = None) -> None:
+    client.put_object(Bucket=BUCKET,
+                      Key=key,
+                      Body=data,
+                      Metadata={"sha256": sha256} if sha256 else {})
+
+
+@pytest.mark.parametrize("digest", ["sha256", "md5"])
+def test_prefetched_ranged_reads(client, store, monkeypatch, digest):
+    data = random.Random(0).randbytes(5 * CHUNK + 100)
+    put(client, "data.bin", data,
+        hashlib.sha256(data).hexdigest() if digest == "sha256" else None)
+    info = store.get_info("data.bin")
+    # Record every ranged GET, each of which must be pinned to the ETag
+    ranges = []
+    get_object = client.get_object
+
+    def _get_object(**kwargs):
+        assert kwargs["IfMatch"] == info["ETag"]
+        ranges.append(kwargs["Range"])
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(client, "get_object", _get_object)
+    spool = io.BytesIO()
+    with ObjStoreReader(store, "data.bin", info, CHUNK, 2, spool) as fh:
+        assert fh.read(10) == data[:10]
+        # The first read puts a window of chunks in flight ahead of it
+        assert set(fh._chunks) | set(fh._futures) == set(range(4))
+        # Reads may seek and straddle chunk boundaries
+        fh.seek(3 * CHUNK - 5)
+        assert fh.read(10) == data[3 * CHUNK - 5:3 * CHUNK + 5]
+        fh.seek(0)
+        assert fh.read() == data
+        fh.verify()
+        assert fh._digest.name == digest
+    assert spool.getvalue() == data
+    assert set(ranges) == {f"bytes={x}-{min(x + CHUNK, len(data)) - 1}"
+                           for x in range(0, len(data), CHUNK)}
+
+
+def test_checksum_mismatch_cleans_up(client, store, tmp_path):
+    # An archive spanning several chunks, published with the wrong checksum
+    archive = io.BytesIO()
+    with ZipFile(archive, "w", compression=ZIP_STORED) as zh:
+        for idx in range(3):
+            zh.writestr(f"tool/file_{idx}.bin", random.Random(idx).randbytes(CHUNK))
+    put(client, "tool.zip", archive.getvalue(), "0" * 64)
+    target = tmp_path / "install"
+    target.mkdir()
+    with pytest.raises(Exception, match="Checksum mismatch"):
+        store.extract("tool.zip", target)
+    # Neither unpacked files nor a cache entry (complete or partial) remain
+    assert not [x for x in target.rglob("*") if x.is_file()]
+    assert not list((tmp_path / "cache").iterdir())
+
+
+def test_replaced_object_is_detected(client, store):
+    data = random.Random(0).randbytes(6 * CHUNK)
+    put(client, "data.bin", data)
+    info = store.get_info("data.bin")
+    with ObjStoreReader(store, "data.bin", info, CHUNK, 1) as fh:
+        assert fh.read(CHUNK) == data[:CHUNK]
+        # Replacing the object changes its ETag, so chunks requested from then
+        # on fail rather than mixing content from the two versions
+        put(client, "data.bin", random.Random(1).randbytes(6 * CHUNK))
+        with pytest.raises(botocore.exceptions.ClientError) as error:
+            fh.read()
+        assert error.value.response["Error"]["Code"] == "PreconditionFailed"
+
+
+def fill(cache, path: str, data: bytes) -> None:
+    with cache.insert(path, "etag") as fh:
+        fh.write(data)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ObjStoreCache(tmp_path / "cache", 300)
+    for idx, name in enumerate(("a", "b", "c")):
+        fill(cache, name, bytes(100))
+        os.utime(cache.entry(name, "etag"), (100 * (idx + 1), 100 * (idx + 1)))
+    # A lookup touches the entry, so the oldest becomes "b"
+    assert cache.lookup("a", "etag") == cache.entry("a", "etag")
+    assert cache.entry("a", "etag").stat().st_mtime > 300
+    fill(cache, "d", bytes(100))
+    assert cache.lookup("b", "etag") is None
+    assert all(cache.lookup(x, "etag") for x in ("a", "c", "d"))
+    # Missing entries are not created by a lookup
+    assert cache.lookup("e", "etag") is None
+    assert len(cache.entries()) == 3
+
+
+def test_oversized_download_is_kept(client, store, tmp_path):
+    store._cache = ObjStoreCache(tmp_path / "cache", CHUNK)
+    fill(store._cache, "old.bin", bytes(CHUNK // 2))
+    data = random.Random(0).randbytes(3 * CHUNK)
+    put(client, "data.bin", data)
+    store.download("data.bin", target := tmp_path / "data.bin")
+    assert target.read_bytes() == data
+    # Older entries are evicted to make room, but not the one just fetched
+    assert store._cache.lookup("old.bin", "etag") is None
+    assert store._cache.lookup("data.bin", store.get_info("data.bin")["ETag"])
+
+
+@pytest.mark.parametrize("method", ["link", "clone", "copy"])
+def test_link_fallback(tmp_path, monkeypatch, method):
+    (source := tmp_path / "source").write_bytes(data := random.Random(0).randbytes(CHUNK))
+    (target := tmp_path / "target").write_bytes(b"stale")
+    clones = []
+
+    def _fail(*_args):
+        raise OSError("Not supported")
+
+    def _ioctl(fd, request, arg):
+        assert request == ObjStoreCache.FICLONE
+        clones.append(fd)
+        os.write(fd, os.read(arg, len(data)))
+
+    if method != "link":
+        monkeypatch.setattr(os, "link", _fail)
+    monkeypatch.setattr(fcntl, "ioctl", _ioctl if method == "clone" else _fail)
+    ObjStoreCache.link(source, target)
+    assert target.read_bytes() == data
+    assert (target.stat().st_ino == source.stat().st_ino) == (method == "link")
+    assert bool(clones) == (method == "clone")
+
+
+def test_manifest_is_paginated_and_reused(client, store, monkeypatch):
+    objects = {f"tool_{idx}.zip": random.Random(idx).randbytes(idx + 1) for idx in range(5)}
+    for key, data in objects.items():
+        put(client, key, data)
+    # Listings are limited to two objects per page, so several are needed
+    pages = []
+    list_objects_v2 = client.list_objects_v2
+
+    def _list_objects_v2(**kwargs):
+        pages.append(kwargs.get("ContinuationToken", None))
+        return list_objects_v2(MaxKeys=2, **kwargs)
+
+    def _head_object(**kwargs):
+        raise AssertionError(f"Unexpected HEAD of {kwargs['Key']}")
+
+    monkeypatch.setattr(client, "list_objects_v2", _list_objects_v2)
+    monkeypatch.setattr(client, "head_object", _head_object)
+    assert {k: v["ContentLength"] for k, v in store.manifest.items()} == \
+        {k: len(v) for k, v in objects.items()}
+    assert len(pages) == 3
+    assert pages[0] is None and all(pages[1:])
+    # Later queries are answered from the same listing, without a HEAD request
+    assert store.offers("tool_0.zip")
+    assert not store.offers("tool_5.zip")
+    assert store.describe("tool_4.zip")["ContentLength"] == 5
+    assert len(pages) == 3
+
+
+def test_publish_skips_unchanged_tree(client, store, tmp_path, monkeypatch):
+    # NOTE: Only the name of the tool and the location and version of the
+    #       install are consulted when publishing
+    tool = SimpleNamespace(name="Demo")
+    version = SimpleNamespace(location=Tool.HOST_ROOT / "demo" / "1.0", version="1.0")
+    tree = (root := tmp_path / "tools") / "demo" / "1.0"
+    (tree / "bin").mkdir(parents=True)
+    (tool_bin := tree / "bin" / "demo").write_bytes(b"#!/bin/sh\n")
+    tool_bin.chmod(0o755)
+    uploads = []
+    upload = store.upload
+
+    def _upload(source, path, metadata):
+        uploads.append(metadata)
+        return upload(source, path, metadata)
+
+    monkeypatch.setattr(store, "upload", _upload)
+    assert store.publish_tool(tool, version, root)
+    assert uploads[-1]["tree-sha256"] == tree_digest(tree)
+    info = store.get_info("demo_1_0.tar.zst")
+    assert info["Metadata"]["tree-sha256"] == tree_digest(tree)
+    # Publishing the same tree again is skipped
+    assert not store.publish_tool(tool, version, root)
+    assert len(uploads) == 1
+    # ...unless forced, or either the content or permissions of a file change
+    assert store.publish_tool(tool, version, root, force=True)
+    tool_bin.chmod(0o644)
+    assert store.publish_tool(tool, version, root)
+    tool_bin.write_bytes(b"#!/bin/bash\n")
+    assert store.publish_tool(tool, version, root)
+    assert len(uploads) == 4
+    assert not store.publish_tool(tool, version, root)
+    assert store.get_info("demo_1_0.tar.zst")["Metadata"]["tree-sha256"] == tree_digest(tree)
+
+
+def make_tree(root):
+    tree = root / "demo" / "1.0"
+    (tree / "bin").mkdir(parents=True)
+    (tree / "share").mkdir()
+    (tool_bin := tree / "bin" / "demo").write_bytes(random.Random(0).randbytes(3 * CHUNK))
+    tool_bin.chmod(0o755)
+    (data := tree / "share" / "data.txt").write_text("data\n")
+    data.chmod(0o640)
+    (tree / "bin" / "alias").symlink_to("demo")
+    os.link(tool_bin, tree / "share" / "demo")
+    return tree
+
+
+def test_unpack_tar(client, store, tmp_path):
+    tree = make_tree(source := tmp_path / "source")
+    build_archive(tree, source, archive := tmp_path / "demo_1_0.tar.zst")
+    data = archive.read_bytes()
+    put(client, "demo_1_0.tar.zst", data, hashlib.sha256(data).hexdigest())
+    store.extract("demo_1_0.tar.zst", target := tmp_path / "install")
+    installed = target / "demo" / "1.0"
+    # Layout, content, and permissions all match the published tree
+    assert tree_digest(installed) == tree_digest(tree)
+    assert (installed / "bin" / "demo").stat().st_mode & 0o777 == 0o755
+    assert (installed / "share" / "data.txt").stat().st_mode & 0o777 == 0o640
+    assert os.readlink(installed / "bin" / "alias") == "demo"
+    assert (installed / "share" / "demo").samefile(installed / "bin" / "demo")
+    # A second extraction is served from the cache and replaces existing links
+    store.extract("demo_1_0.tar.zst", target)
+    assert tree_digest(installed) == tree_digest(tree)
+
+
+@pytest.mark.parametrize("fault", ["checksum", "unsafe"])
+def test_unpack_tar_cleans_up(client, store, tmp_path, fault):
+    tree = make_tree(source := tmp_path / "source")
+    build_archive(tree, source, archive := tmp_path / "demo_1_0.tar.zst")
+    if fault == "unsafe":
+        # Append a link escaping the install, which is rejected only once the
+        # members ahead of it have been unpacked
+        with archive.open("wb") as fh, zstandard.ZstdCompressor().stream_writer(fh) as zh:
+            with tarfile.open(fileobj=zh, mode="w|") as th:
+                th.add(tree, arcname="demo/1.0")
+                link = tarfile.TarInfo("demo/1.0/bin/escape")
+                link.type, link.linkname = tarfile.SYMTYPE, "/etc/passwd"
+                th.addfile(link)
+    data = archive.read_bytes()
+    put(client, "demo_1_0.tar.zst", data,
+        "0" * 64 if fault == "checksum" else hashlib.sha256(data).hexdigest())
+    with pytest.raises(Exception, match="Checksum mismatch" if fault == "checksum"
+                       else "link to an absolute path"):
+        store.extract("demo_1_0.tar.zst", target := tmp_path / "install")
+    # No files or links are left behind, nor is anything cached
+    assert not [x for x in target.rglob("*") if x.is_file() or x.is_symlink()]
+    assert not list((tmp_path / "cache").iterdir())